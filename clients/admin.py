@@ -5,4 +5,10 @@ from .models import Entreprise
 class EntrepriseAdmin(admin.ModelAdmin):
     list_display = ('raison_sociale', 'email', 'telephone', 'commune')
     search_fields = ('raison_sociale', 'email', 'telephone')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Index de mots-clés plutôt que des icontains non indexés
+        if not search_term.strip():
+            return queryset, False
+        return Entreprise.rechercher(search_term, queryset), False
 admin.site.register(Entreprise, EntrepriseAdmin)
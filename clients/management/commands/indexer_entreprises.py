@@ -0,0 +1,37 @@
+# clients/management/commands/indexer_entreprises.py
+from django.core.management.base import BaseCommand
+
+from clients.models import Entreprise
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit l'index de recherche des entreprises (MotCleEntreprise), "
+        "par lots (parcours par id). À lancer après un import en masse."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lot", type=int, default=1000,
+            help="Nombre d'entreprises traitées par lot (défaut : 1000).",
+        )
+
+    def handle(self, *args, **options):
+        taille_lot = max(1, options["lot"])
+        champs = ["pk", *Entreprise.CHAMPS_RECHERCHE]
+
+        dernier_id = 0
+        nb_entreprises = nb_mots = 0
+        while True:
+            entreprises = list(
+                Entreprise.objects.filter(pk__gt=dernier_id).order_by("pk").only(*champs)[:taille_lot]
+            )
+            if not entreprises:
+                break
+            dernier_id = entreprises[-1].pk
+            nb_entreprises += len(entreprises)
+            nb_mots += Entreprise.indexer_recherche(entreprises)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{nb_entreprises} entreprise(s) indexée(s), {nb_mots} mot(s)-clé(s)."
+        ))
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:47
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Copie figée de common.recherche (normalisation des mots) au moment de la migration :
+# une évolution du module ne doit pas changer ce que produit cette migration.
+LONGUEUR_MOT = 64
+_RE_MOT = re.compile(r"[a-z0-9]+")
+
+
+def _replier_caractere(c):
+    decompose = unicodedata.normalize("NFKD", c)
+    base = "".join(x for x in decompose if not unicodedata.combining(x))
+    return (base[:1] or c).lower()
+
+
+def mots(texte):
+    replie = "".join(_replier_caractere(c) for c in texte or "")
+    return [mot[:LONGUEUR_MOT] for mot in _RE_MOT.findall(replie)]
+
+# Copie figée de Entreprise.CHAMPS_RECHERCHE au moment de la migration
+CHAMPS_RECHERCHE = {
+    "raison_sociale": 4,
+    "personne_de_contact": 2,
+    "nif": 2,
+    "stat": 2,
+    "telephone": 2,
+    "email": 1,
+}
+
+
+def indexer_entreprises(apps, schema_editor):
+    Entreprise = apps.get_model('clients', 'Entreprise')
+    MotCleEntreprise = apps.get_model('clients', 'MotCleEntreprise')
+    lot = []
+    for entreprise in Entreprise.objects.only(*CHAMPS_RECHERCHE).iterator(chunk_size=1000):
+        mots_cles = set()
+        for champ, poids in CHAMPS_RECHERCHE.items():
+            mots_champ = mots(getattr(entreprise, champ) or "")
+            if champ == "telephone" and len(mots_champ) > 1:
+                mots_champ.append("".join(mots_champ)[:LONGUEUR_MOT])
+            mots_cles.update((champ, mot, poids) for mot in mots_champ)
+        lot.extend(
+            MotCleEntreprise(entreprise_id=entreprise.pk, champ=champ, mot=mot, poids=poids)
+            for champ, mot, poids in mots_cles
+        )
+        if len(lot) >= 5000:
+            MotCleEntreprise.objects.bulk_create(lot)
+            lot = []
+    MotCleEntreprise.objects.bulk_create(lot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0002_alter_entreprise_page_facebook'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entreprise',
+            name='raison_sociale',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='MotCleEntreprise',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('champ', models.CharField(max_length=30)),
+                ('mot', models.CharField(max_length=64)),
+                ('poids', models.PositiveSmallIntegerField(default=1)),
+                ('entreprise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mots_recherche', to='clients.entreprise')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mot', 'entreprise'], name='clients_mot_cle_mot_idx')],
+            },
+        ),
+        migrations.RunPython(indexer_entreprises, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+from common import recherche
+
 # Create your models here.
 class ActifsManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().filter(est_actif=True)
 
 class Entreprise(models.Model):
-    raison_sociale = models.CharField(max_length=255)
+    raison_sociale = models.CharField(max_length=255, db_index=True)
     date_debut = models.DateField(default=timezone.now, null=True, blank=True)
     page_facebook = models.CharField(max_length=255, blank=True, null=True)
     lien_page = models.URLField(blank=True, null=True)
@@ -31,6 +35,94 @@ class Entreprise(models.Model):
     objects = models.Manager()   # manager par défaut
     actifs = ActifsManager()
 
+    # Champs indexés pour la recherche, avec leur poids dans le classement
+    CHAMPS_RECHERCHE = {
+        "raison_sociale": 4,
+        "personne_de_contact": 2,
+        "nif": 2,
+        "stat": 2,
+        "telephone": 2,
+        "email": 1,
+    }
+
     def __str__(self):
         return self.raison_sociale
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.__class__.indexer_recherche([self])
+
+    def mots_cles(self):
+        """(champ, mot, poids) indexés pour cette entreprise."""
+        resultat = set()
+        for champ, poids in self.CHAMPS_RECHERCHE.items():
+            valeur = getattr(self, champ) or ""
+            mots = recherche.mots(valeur)
+            if champ == "telephone" and len(mots) > 1:
+                # « 034 12 345 67 » se retrouve aussi en tapant 0341234567
+                mots.append("".join(mots)[:recherche.LONGUEUR_MOT])
+            resultat.update((champ, mot, poids) for mot in mots)
+        return resultat
+
+    @classmethod
+    def indexer_recherche(cls, entreprises):
+        """Reconstruit les mots-clés des entreprises données (instances chargées)."""
+        entreprises = [e for e in entreprises if e.pk]
+        if not entreprises:
+            return 0
+        mots_cles = [
+            MotCleEntreprise(entreprise_id=e.pk, champ=champ, mot=mot, poids=poids)
+            for e in entreprises for champ, mot, poids in e.mots_cles()
+        ]
+        with transaction.atomic():
+            MotCleEntreprise.objects.filter(entreprise_id__in=[e.pk for e in entreprises]).delete()
+            MotCleEntreprise.objects.bulk_create(mots_cles, batch_size=1000)
+        return len(mots_cles)
+
+    @classmethod
+    def rechercher(cls, saisie, queryset=None):
+        """
+        Entreprises dont chaque terme de la saisie est le début d'un mot indexé,
+        annotées de `pertinence` (mot entier : poids x 2, début de mot : poids) et
+        classées par pertinence décroissante.
+        """
+        queryset = cls.objects.all() if queryset is None else queryset
+        termes = recherche.termes(saisie)
+        if not termes:
+            return queryset.annotate(pertinence=Value(0))
+
+        prefixes = Q()
+        for terme in termes:
+            filtre = recherche.filtre_prefixe("mot", terme)
+            prefixes |= filtre
+            queryset = queryset.filter(
+                pk__in=MotCleEntreprise.objects.filter(filtre).values("entreprise_id")
+            )
+
+        def score(condition):
+            return Coalesce(Subquery(
+                MotCleEntreprise.objects.filter(condition, entreprise_id=OuterRef("pk"))
+                .order_by().values("entreprise_id").annotate(total=Sum("poids")).values("total")[:1]
+            ), 0)
+
+        return queryset.annotate(
+            pertinence=score(Q(mot__in=termes)) * 2 + score(prefixes)
+        ).order_by(F("pertinence").desc(), "raison_sociale", "id")
+
+
+class MotCleEntreprise(models.Model):
+    """Index inversé de la recherche clients : un mot replié (sans accents) par ligne."""
+    entreprise = models.ForeignKey(Entreprise, on_delete=models.CASCADE, related_name="mots_recherche")
+    champ = models.CharField(max_length=30)
+    mot = models.CharField(max_length=recherche.LONGUEUR_MOT)
+    poids = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["mot", "entreprise"], name="clients_mot_cle_mot_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.mot} ({self.champ})"
     
\ No newline at end of file
@@ -1,3 +1,139 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import path
+
+from common.models import Caisse, Pages
+from common.recherche import surligner, termes
+from vente.models import Commande, Vente
+
+from .models import Entreprise, MotCleEntreprise
+from .views import EntrepriseTypeaheadView, ReleveClientView
+
+urlpatterns = [path("typeahead/", EntrepriseTypeaheadView.as_view())]
+
+
+class RechercheEntrepriseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cafe = Entreprise.objects.create(
+            raison_sociale="Café Étoile SARL", personne_de_contact="Hery Rakoto",
+            telephone="034 12 345 67", email="contact@etoile.mg", nif="4001234567",
+        )
+        cls.hotel = Entreprise.objects.create(
+            raison_sociale="Hôtel Rakoto", personne_de_contact="Soa Etoile",
+        )
+        cls.autre = Entreprise.objects.create(raison_sociale="Garage Central")
+
+    def ids(self, saisie):
+        return [e.pk for e in Entreprise.rechercher(saisie)]
+
+    def test_accents_et_prefixes(self):
+        self.assertEqual(self.ids("cafe etoi"), [self.cafe.pk])
+        self.assertEqual(self.ids("HOTEL"), [self.hotel.pk])
+        self.assertEqual(self.ids("4001"), [self.cafe.pk])
+        self.assertEqual(self.ids("0341234567"), [self.cafe.pk])
+        self.assertEqual(self.ids("introuvable"), [])
+
+    def test_classement_par_pertinence(self):
+        # « etoile » est dans la raison sociale du café, dans le contact de l'hôtel
+        self.assertEqual(self.ids("etoile"), [self.cafe.pk, self.hotel.pk])
+        self.assertEqual(self.ids("rakoto"), [self.hotel.pk, self.cafe.pk])
+
+    def test_index_mis_a_jour_a_l_enregistrement(self):
+        self.autre.raison_sociale = "Garage Fanilo"
+        self.autre.save()
+        self.assertEqual(self.ids("fanilo"), [self.autre.pk])
+        self.assertEqual(self.ids("central"), [])
+        self.assertFalse(MotCleEntreprise.objects.filter(mot="central").exists())
+
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN propre à SQLite")
+    def test_recherche_par_plage_d_index(self):
+        qs = Entreprise.rechercher("etoile")
+        with connection.cursor() as cursor:
+            sql, params = qs.query.sql_with_params()
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = " ".join(str(ligne[-1]) for ligne in cursor.fetchall())
+        self.assertIn("clients_mot_cle_mot_idx", plan)
+
+    def test_surligner(self):
+        self.assertEqual(
+            surligner("Café <Étoile>", termes("etoi")),
+            "Café &lt;<mark>Étoi</mark>le&gt;",
+        )
+        self.assertEqual(surligner("Garage", []), "Garage")
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class EntrepriseTypeaheadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = get_user_model().objects.create_user("vendeur", password="x")
+        for i in range(30):
+            Entreprise.objects.create(raison_sociale=f"Fanilo {i:02d}", telephone=f"034 00 000 {i:02d}")
+        cls.cible = Entreprise.objects.create(raison_sociale="Société Ravinala", nif="123")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.utilisateur)
+
+    def test_connexion_requise(self):
+        self.client.logout()
+        self.assertEqual(self.client.get("/typeahead/", {"q": "fanilo"}).status_code, 302)
+
+    def test_recherche_limitee_et_mise_en_cache(self):
+        reponse = self.client.get("/typeahead/", {"q": "fanilo", "limite": 5})
+        self.assertEqual(len(reponse.json()["resultats"]), 5)
+        self.assertIn("max-age=30", reponse["Cache-Control"])
+
+        # Même saisie, accents et casse près : servie par le cache (session seulement)
+        with self.assertNumQueries(2):
+            self.client.get("/typeahead/", {"q": "FANILO", "limite": 5})
+
+    def test_resultat_et_libelle_d_une_valeur_choisie(self):
+        resultat, = self.client.get("/typeahead/", {"q": "societe rav"}).json()["resultats"]
+        self.assertEqual(resultat["id"], self.cible.pk)
+        self.assertEqual(resultat["libelle"], "Société Ravinala")
+        self.assertEqual(resultat["nif"], "123")
+
+        resultats = self.client.get("/typeahead/", {"id": [self.cible.pk]}).json()["resultats"]
+        self.assertEqual([r["id"] for r in resultats], [self.cible.pk])
+
+
+class ReleveClientTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = get_user_model().objects.create_user("vendeur", password="x")
+        cls.entreprise = Entreprise.objects.create(raison_sociale="Client A")
+        page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        caisse = Caisse.objects.create(nom="MVola", responsable="Caissier")
+        cls.commandes = [
+            Commande.objects.create(client=cls.entreprise, page=page, date_commande=date(2026, 1, 1) + timedelta(days=i % 3))
+            for i in range(5)
+        ]
+        Vente.objects.create(commande=cls.commandes[0], paiement=caisse, montant=0, date_encaissement=date(2026, 2, 1))
+
+    def releve(self, **params):
+        requete = RequestFactory().get("/releve/", params)
+        requete.user = self.utilisateur
+        vue = ReleveClientView.as_view(paginate_by=2)
+        return vue(requete, entreprise_id=self.entreprise.pk).context_data
+
+    def test_solde_et_lignes_par_curseur(self):
+        contexte = self.releve()
+        self.assertEqual(contexte["solde"].nombre_commandes, 5)
+        self.assertEqual(contexte["solde"].derniere_activite, date(2026, 2, 1))
+
+        attendu = sorted(self.commandes, key=lambda c: (c.date_commande, c.pk), reverse=True)
+        vus = []
+        while True:
+            page = contexte["page_obj"]
+            vus.extend(page.object_list)
+            if not page.has_next():
+                break
+            contexte = self.releve(cursor=page.next_cursor)
+        self.assertEqual([c.pk for c in vus], [c.pk for c in attendu])
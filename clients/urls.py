@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import ClientView, EntrepriseCreateView, EntrepriseUpdateView, EntrepriseDeleteView
+from .views import ClientView, EntrepriseCreateView, EntrepriseUpdateView, EntrepriseDeleteView, EntrepriseTypeaheadView, ReleveClientView
 
 urlpatterns = [
     path('', ClientView.as_view(), name="listes-clients"),
@@ -10,4 +10,6 @@ urlpatterns = [
         name="entreprise_update"
     ),
     path("client/<int:entreprise_id>/delete/", EntrepriseDeleteView.as_view(), name="entreprise_delete"),
+    path("client/<int:entreprise_id>/releve/", ReleveClientView.as_view(), name="releve_client"),
+    path("typeahead/", EntrepriseTypeaheadView.as_view(), name="entreprise_typeahead"),
 ]
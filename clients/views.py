@@ -7,8 +7,15 @@ from django.core.validators import URLValidator, validate_email
 from django.core.exceptions import ValidationError
 from django.contrib import messages
 from django.db import transaction, IntegrityError
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 
+from common import recherche
+from common.filtres import FiltresMixin, FiltreTexte, SpecFiltres
+from common.pagination import CursorPaginationMixin, PAGINATION_CURSEUR
+from common.typeahead import TypeaheadView
 from common.utils import is_admin
+from vente.models import Commande, SoldeClient
 from .models import Entreprise
 
 
@@ -23,22 +30,85 @@ class AdminRequiredMixin(UserPassesTestMixin):
 
 
 # --- LISTE DES CLIENTS -------------------------------------------------------
-class ClientView(LoginRequiredMixin, ListView):
+class ClientFiltres(SpecFiltres):
+    q = FiltreTexte()
+
+
+class ClientView(LoginRequiredMixin, FiltresMixin, ListView):
     model = Entreprise
     template_name = "clients/clients_list.html"
     context_object_name = "clients"
     paginate_by = 10
+    filtres_class = ClientFiltres
+
+    def _saisie(self):
+        return self.get_filtres()["q"] or ""
+
+    def get_queryset(self):
+        # Recherche sur l'index de mots-clés (raison sociale, NIF, STAT, téléphone, email, contact)
+        saisie = self._saisie()
+        if saisie:
+            return Entreprise.rechercher(saisie)
+        return Entreprise.objects.order_by("raison_sociale", "id")
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
+        saisie = self._saisie()
         ctx.update({
             "display_mode": self.request.GET.get("display", "table"),
-            "extra_querystring": self.request.GET.urlencode(),
+            "query": saisie,
+            "termes": recherche.termes(saisie),
             "is_admin": is_admin(self.request.user),  # pour désactiver les boutons côté template
         })
         return ctx
 
 
+# --- RELEVÉ CLIENT -----------------------------------------------------------
+class ReleveClientView(LoginRequiredMixin, CursorPaginationMixin, ListView):
+    """
+    Totaux lus dans SoldeClient (une ligne) ; détail des commandes et de leurs
+    encaissements parcouru par clé (date, id), sans OFFSET ni COUNT.
+    """
+    template_name = "clients/releve_client.html"
+    context_object_name = "lignes"
+    paginate_by = 20
+    cursor_ordering = ("-date_commande", "-id")
+    pagination_par_defaut = PAGINATION_CURSEUR
+    cursor_afficher_total = False
+
+    def get_queryset(self):
+        self.entreprise = get_object_or_404(Entreprise, pk=self.kwargs["entreprise_id"])
+        return (
+            Commande.objects.filter(client=self.entreprise)
+            .select_related("vente__paiement", "page")
+            .annotate(
+                montant_paye=Coalesce(F("vente__montant"), Value(0)),
+                reste_a_payer=F("montant_total") - Coalesce(F("vente__montant"), Value(0)),
+            )
+        )
+
+    def get_solde(self):
+        solde = SoldeClient.objects.filter(entreprise=self.entreprise).first()
+        if solde is None:
+            # Client jamais recalculé (aucune commande depuis la mise en place des soldes)
+            SoldeClient.recalculer([self.entreprise.pk])
+            solde = SoldeClient.objects.get(entreprise=self.entreprise)
+        return solde
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        params = self.request.GET.copy()
+        params.pop("cursor", None)
+        params.pop("page", None)
+        params.pop("pagination", None)
+        ctx.update({
+            "entreprise": self.entreprise,
+            "solde": self.get_solde(),
+            "extra_querystring": params.urlencode(),
+        })
+        return ctx
+
+
 # --- CREATION D’ENTREPRISE ---------------------------------------------------
 class EntrepriseCreateView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
@@ -149,3 +219,23 @@ class EntrepriseDeleteView(LoginRequiredMixin, AdminRequiredMixin, View):
 
         messages.success(request, "Entreprise supprimée avec succès.")
         return redirect("listes-clients")
+
+
+# --- AUTOCOMPLETION (sélecteurs de client) -----------------------------------
+class EntrepriseTypeaheadView(TypeaheadView):
+    model = Entreprise
+    CHAMPS = ["raison_sociale", "nif", "stat", "rcs", "adresse", "telephone", "email"]
+
+    def rechercher(self, saisie):
+        if not recherche.termes(saisie):
+            return Entreprise.objects.order_by("raison_sociale", "id").only(*self.CHAMPS)
+        return Entreprise.rechercher(saisie).only(*self.CHAMPS)
+
+    def serialiser(self, entreprise):
+        donnees = {champ: getattr(entreprise, champ) or "" for champ in self.CHAMPS}
+        donnees.update({
+            "id": entreprise.pk,
+            "libelle": entreprise.raison_sociale,
+            "detail": " · ".join(filter(None, [entreprise.telephone, entreprise.nif and f"NIF {entreprise.nif}"])),
+        })
+        return donnees
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Pages, Caisse
+from .models import Pages, Caisse, MouvementCaisse
 
 # Register your models here.
 
@@ -10,3 +10,18 @@ class PageAdmin(admin.ModelAdmin):
 
 admin.site.register(Pages, PageAdmin)
 admin.site.register(Caisse)
+
+
+class MouvementCaisseAdmin(admin.ModelAdmin):
+    list_display = ('date', 'caisse', 'sens', 'montant', 'piece', 'libelle')
+    list_filter = ('caisse', 'sens')
+    search_fields = ('piece', 'libelle')
+
+    # Journal en ajout seul
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+admin.site.register(MouvementCaisse, MouvementCaisseAdmin)
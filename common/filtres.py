@@ -0,0 +1,233 @@
+# common/filtres.py
+"""
+Filtres de liste déclaratifs : chaque filtre est déclaré une fois (paramètre GET,
+type, champ et lookup), puis lu, validé et appliqué au queryset par la même classe.
+
+    class CommandeFiltres(SpecFiltres):
+        date_commande = FiltreDate()
+        client_id = FiltreEntier()
+        statut = FiltreChoix("statut_vente", choix=STATUTS)
+        service_id = FiltreExiste(LigneCommande, "commande", "service_id")
+
+    filtres = CommandeFiltres(request.GET)
+    qs = filtres.filtrer(Commande.objects.all())
+
+Les périodes (FiltrePeriode : aujourd'hui, semaine, mois, trimestre) et les bornes
+du / au (FiltreDate avec lookup="gte" / "lte") se combinent sur le même champ date.
+
+Une valeur absente ou invalide n'applique aucun filtre (l'erreur est gardée dans
+`erreurs`) : une URL bricolée ne provoque jamais d'erreur 500. Les filtres sur
+une relation « plusieurs » passent par EXISTS, jamais JOIN + distinct() : pas de
+doublons, les agrégats (totaux, COUNT de la pagination) restent justes.
+"""
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+PERIODE_PERSONNALISEE = "perso"
+PERIODES = [
+    ("jour", "Aujourd'hui"),
+    ("semaine", "Cette semaine"),
+    ("mois", "Ce mois"),
+    ("trimestre", "Ce trimestre"),
+    (PERIODE_PERSONNALISEE, "Personnalisée"),
+]
+
+
+class Filtre:
+    """
+    Filtre sur un paramètre GET. `champ` vaut par défaut le nom du paramètre ;
+    `defaut` s'applique quand le paramètre est absent ou vide.
+    """
+
+    def __init__(self, champ=None, lookup="exact", defaut=None):
+        self.nom = None
+        self.champ = champ
+        self.lookup = lookup
+        self.defaut = defaut
+
+    def __set_name__(self, owner, nom):
+        self.nom = nom
+        self.champ = self.champ or nom
+
+    def convertir(self, brut):
+        """Valeur typée à partir de la saisie nettoyée ; lève ValueError si invalide."""
+        return brut
+
+    def condition(self, valeur):
+        """Argument de queryset.filter() pour une valeur valide."""
+        return {f"{self.champ}__{self.lookup}": valeur}
+
+    def appliquer(self, queryset, valeur):
+        condition = self.condition(valeur)
+        if isinstance(condition, dict):
+            return queryset.filter(**condition)
+        return queryset.filter(condition)
+
+
+class FiltreTexte(Filtre):
+    pass
+
+
+class FiltreEntier(Filtre):
+    def convertir(self, brut):
+        return int(brut)
+
+
+class FiltreDate(Filtre):
+    def convertir(self, brut):
+        jour = parse_date(brut)
+        if jour is None:
+            raise ValueError("Date invalide (AAAA-MM-JJ).")
+        return jour
+
+
+class FiltreChoix(Filtre):
+    """Valeur limitée à `choix` (liste de valeurs ou de couples (valeur, libellé))."""
+
+    def __init__(self, champ=None, choix=(), **kwargs):
+        super().__init__(champ, **kwargs)
+        self.choix = [c[0] if isinstance(c, (list, tuple)) else c for c in choix]
+
+    def convertir(self, brut):
+        if brut not in self.choix:
+            raise ValueError("Valeur non proposée.")
+        return brut
+
+
+def bornes_periode(periode, jour=None):
+    """(premier, dernier) jour inclus de la période calendaire contenant `jour` (défaut : aujourd'hui)."""
+    jour = jour or timezone.localdate()
+    if periode == "jour":
+        return jour, jour
+    if periode == "semaine":
+        debut = jour - timedelta(days=jour.weekday())
+        return debut, debut + timedelta(days=6)
+    if periode == "mois":
+        debut = jour.replace(day=1)
+    elif periode == "trimestre":
+        debut = jour.replace(month=(jour.month - 1) // 3 * 3 + 1, day=1)
+    else:
+        raise ValueError("Période inconnue.")
+    mois_suivant = debut.month + (3 if periode == "trimestre" else 1)
+    fin = debut.replace(year=debut.year + (mois_suivant - 1) // 12, month=(mois_suivant - 1) % 12 + 1)
+    return debut, fin - timedelta(days=1)
+
+
+class FiltrePeriode(Filtre):
+    """
+    Période calendaire sur un champ date : `champ__range=(premier, dernier jour)`.
+    « perso » n'applique rien : les bornes viennent alors des filtres du / au.
+    """
+
+    def __init__(self, champ=None, **kwargs):
+        super().__init__(champ, lookup="range", **kwargs)
+
+    def convertir(self, brut):
+        if brut == PERIODE_PERSONNALISEE:
+            return None
+        return bornes_periode(brut)
+
+
+class FiltreExiste(FiltreEntier):
+    """
+    Filtre sur une relation « plusieurs » (ex. commandes contenant un service) :
+    EXISTS (SELECT 1 FROM modele WHERE lien = pk AND champ = valeur).
+    """
+
+    def __init__(self, modele, lien, champ, lookup="exact", **kwargs):
+        super().__init__(champ, lookup, **kwargs)
+        self.modele = modele
+        self.lien = lien
+
+    def condition(self, valeur):
+        return Exists(self.modele.objects.filter(
+            **{self.lien: OuterRef("pk"), f"{self.champ}__{self.lookup}": valeur}
+        ))
+
+
+class SpecFiltres:
+    """
+    Ensemble de filtres déclarés en attributs de classe, lus une fois à la construction.
+
+      valeurs  -> {nom: valeur typée} des filtres appliqués
+      donnees  -> {nom: saisie nettoyée} pour réafficher le formulaire ("" si absent ou invalide)
+                  (une saisie valide convertie en None est gardée ici sans être appliquée)
+      erreurs  -> {nom: message} des saisies ignorées
+    """
+    filtres = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        filtres = {}
+        for base in reversed(cls.__mro__):
+            filtres.update({nom: f for nom, f in vars(base).items() if isinstance(f, Filtre)})
+        cls.filtres = filtres
+
+    def __init__(self, donnees):
+        self.valeurs, self.donnees, self.erreurs = {}, {}, {}
+        for nom, filtre in self.filtres.items():
+            brut = (donnees.get(nom) or "").strip() or filtre.defaut or ""
+            self.donnees[nom] = ""
+            if not brut:
+                continue
+            try:
+                valeur = filtre.convertir(brut)
+            except (TypeError, ValueError) as e:
+                self.erreurs[nom] = str(e)
+                continue
+            self.donnees[nom] = brut
+            if valeur is not None:
+                self.valeurs[nom] = valeur
+
+    def __getitem__(self, nom):
+        return self.valeurs.get(nom)
+
+    @property
+    def actifs(self):
+        return bool(self.valeurs)
+
+    def filtrer(self, queryset):
+        for nom, valeur in self.valeurs.items():
+            queryset = self.filtres[nom].appliquer(queryset, valeur)
+        return queryset
+
+    def querystring(self, **extra):
+        """Filtres valides (et paramètres `extra` non vides) à conserver dans les liens de pagination."""
+        params = QueryDict(mutable=True)
+        for nom, brut in self.donnees.items():
+            if brut:
+                params[nom] = brut
+        for cle, valeur in extra.items():
+            if valeur not in (None, ""):
+                params[cle] = valeur
+        return params.urlencode()
+
+
+class FiltresMixin:
+    """
+    Pour ListView : `filtres_class` est lue une fois par requête (self.filtres),
+    le contexte reçoit l'état (`filtres`) et extra_querystring construit à partir
+    des filtres valides plus les paramètres de `querystring_conserves` (ex. display).
+    """
+    filtres_class = None
+    querystring_conserves = ("display",)
+
+    def get_filtres(self):
+        if not hasattr(self, "filtres"):
+            self.filtres = self.filtres_class(self.request.GET)
+        return self.filtres
+
+    def get_extra_querystring(self):
+        return self.get_filtres().querystring(
+            **{cle: (self.request.GET.get(cle) or "").strip() for cle in self.querystring_conserves}
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["filtres"] = self.get_filtres()
+        context["extra_querystring"] = self.get_extra_querystring()
+        return context
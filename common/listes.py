@@ -0,0 +1,64 @@
+# common/listes.py
+from django.db.models import Count
+from django.http import QueryDict
+
+from common.pagination import CursorPaginationMixin
+
+
+class ListePipelineMixin(CursorPaginationMixin):
+    """
+    Liste filtrée en une seule passe, pour ListView :
+      - get_queryset() est évalué une fois (par ListView.get) : ne pas le rappeler
+        dans get_context_data, utiliser self.object_list ;
+      - une requête d'agrégat donne à la fois le nombre de lignes (réutilisé par le
+        paginator, donc pas de COUNT séparé) et les totaux déclarés dans `aggregats` ;
+      - une requête LIMIT pour la page (numérotée ou par curseur).
+
+    Contexte ajouté : page_obj (ListView), totaux, chaque total sous son propre nom,
+    nombre_resultats et extra_querystring (filtres sans la position ni le mode).
+    """
+    aggregats = {}  # ex. {"total_encaisse": Sum("montant")}
+    querystring_exclus = ("page", "cursor", "pagination")
+
+    def get_aggregats(self):
+        return dict(self.aggregats)
+
+    def calculer_totaux(self, queryset):
+        resultats = queryset.order_by().aggregate(_nombre=Count("pk"), **self.get_aggregats())
+        nombre = resultats.pop("_nombre")
+        return nombre, {cle: valeur or 0 for cle, valeur in resultats.items()}
+
+    def _assurer_totaux(self, queryset):
+        if not hasattr(self, "totaux"):
+            self.nombre_resultats, self.totaux = self.calculer_totaux(queryset)
+
+    def paginate_queryset(self, queryset, page_size):
+        self._assurer_totaux(queryset)
+        return super().paginate_queryset(queryset, page_size)
+
+    def get_paginator(self, *args, **kwargs):
+        paginator = super().get_paginator(*args, **kwargs)
+        paginator.count = self.nombre_resultats
+        return paginator
+
+    def get_cursor_paginator(self, queryset, page_size):
+        paginator = super().get_cursor_paginator(queryset, page_size)
+        paginator.count = self.nombre_resultats
+        return paginator
+
+    def get_extra_querystring(self):
+        clean = QueryDict(mutable=True)
+        for key, values in self.request.GET.lists():
+            values = [v for v in values if v.strip()]
+            if values and key not in self.querystring_exclus:
+                clean.setlist(key, values)
+        return clean.urlencode()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        self._assurer_totaux(self.object_list)
+        context.update(self.totaux)
+        context["totaux"] = self.totaux
+        context["nombre_resultats"] = self.nombre_resultats
+        context["extra_querystring"] = self.get_extra_querystring()
+        return context
@@ -0,0 +1,167 @@
+# common/management/commands/benchmark_vues.py
+import json
+import statistics
+import subprocess
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from clients.models import Entreprise
+from common.requetes import EnregistreurRequetes
+from services.models import Service
+from vente.models import Commande, LigneCommande, Vente
+
+# (nom, nom d'url, paramètres GET) ; les PDF sont traités à part (une commande par itération)
+VUES = [
+    ("ventes", "accueil", {}),
+    ("encaissements_valides", "encaissement", {}),
+    ("encaissements_non_valides", "encaissement_non_valides", {}),
+    ("facturation", "facturation", {}),
+    ("services", "services", {}),
+    ("clients", "listes-clients", {}),
+]
+
+
+def percentile(valeurs, p):
+    """Percentile par interpolation linéaire (p entre 0 et 100)."""
+    valeurs = sorted(valeurs)
+    if len(valeurs) == 1:
+        return valeurs[0]
+    rang = (len(valeurs) - 1) * p / 100
+    bas = int(rang)
+    haut = min(bas + 1, len(valeurs) - 1)
+    return valeurs[bas] + (valeurs[haut] - valeurs[bas]) * (rang - bas)
+
+
+def commit_courant():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Appelle les vues principales via le client de test (listes ventes, encaissements, "
+        "facturation, services, clients, PDF de facture) et écrit latence p50/p95 et nombre "
+        "de requêtes SQL en JSON, pour comparer les commits entre eux."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repetitions", type=int, default=20, help="Appels mesurés par vue (défaut : 20).")
+        parser.add_argument("--echauffement", type=int, default=2, help="Appels non mesurés par vue (défaut : 2).")
+        parser.add_argument("--utilisateur", help="Identifiant du compte utilisé (défaut : premier superutilisateur).")
+        parser.add_argument("--vues", nargs="+", help="Limite la mesure à ces vues (noms du rapport).")
+        parser.add_argument("--sans-pdf", action="store_true", help="Ne mesure pas le PDF de facture.")
+        parser.add_argument("--sortie", default="benchmark_vues.json", help="Fichier JSON écrit (défaut : benchmark_vues.json).")
+        parser.add_argument("--comparer", help="JSON d'un passage précédent : affiche les écarts.")
+
+    def handle(self, *args, **options):
+        utilisateur = self.utilisateur(options["utilisateur"])
+        repetitions = max(1, options["repetitions"])
+        echauffement = max(0, options["echauffement"])
+
+        vues = [(nom, reverse(url), params) for nom, url, params in VUES]
+        if not options["sans_pdf"]:
+            self.commandes_pdf = list(
+                Commande.objects.filter(statut_vente="Payée")
+                .order_by("-date_commande", "-pk").values_list("pk", flat=True)[: echauffement + repetitions]
+            )
+            vues.append(("facture_pdf", reverse("telecharger_facture_service_pdf"), self.params_pdf))
+        if options["vues"]:
+            inconnues = set(options["vues"]) - {nom for nom, _, _ in vues}
+            if inconnues:
+                raise CommandError(f"Vue(s) inconnue(s) : {', '.join(sorted(inconnues))}.")
+            vues = [vue for vue in vues if vue[0] in options["vues"]]
+
+        # Autorise l'hôte « testserver » du client de test, comme sous manage.py test
+        setup_test_environment()
+        try:
+            client = Client()
+            client.force_login(utilisateur)
+            resultats = {nom: self.mesurer(client, url, params, repetitions, echauffement)
+                         for nom, url, params in vues}
+        finally:
+            teardown_test_environment()
+
+        rapport = {
+            "date": timezone.now().isoformat(timespec="seconds"),
+            "commit": commit_courant(),
+            "base": settings.DATABASES["default"]["ENGINE"].rsplit(".", 1)[-1],
+            "repetitions": repetitions,
+            "volumes": {
+                "entreprises": Entreprise.objects.count(),
+                "services": Service.objects.count(),
+                "commandes": Commande.objects.count(),
+                "lignes": LigneCommande.objects.count(),
+                "ventes": Vente.objects.count(),
+            },
+            "vues": resultats,
+        }
+        Path(options["sortie"]).write_text(json.dumps(rapport, indent=2, ensure_ascii=False), encoding="utf-8")
+
+        precedent = None
+        if options["comparer"]:
+            precedent = json.loads(Path(options["comparer"]).read_text(encoding="utf-8")).get("vues", {})
+        self.afficher(resultats, precedent)
+        self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['sortie']}."))
+
+    def utilisateur(self, identifiant):
+        utilisateurs = get_user_model().objects.filter(is_active=True)
+        if identifiant:
+            utilisateur = utilisateurs.filter(username=identifiant).first()
+        else:
+            utilisateur = utilisateurs.filter(is_superuser=True).order_by("pk").first()
+        if utilisateur is None:
+            raise CommandError("Aucun utilisateur actif trouvé : créez-en un ou passez --utilisateur.")
+        return utilisateur
+
+    def params_pdf(self, iteration):
+        # Une commande différente à chaque appel : on mesure la génération, pas le cache disque
+        if not self.commandes_pdf:
+            raise CommandError("Aucune commande payée pour mesurer le PDF de facture.")
+        return {"commande_id": self.commandes_pdf[iteration % len(self.commandes_pdf)], "type_facture": "FACTURE"}
+
+    def mesurer(self, client, url, params, repetitions, echauffement):
+        durees, requetes, statuts = [], [], set()
+        for iteration in range(echauffement + repetitions):
+            donnees = params(iteration) if callable(params) else params
+            with EnregistreurRequetes() as enregistreur:
+                debut = time.perf_counter()
+                reponse = client.get(url, donnees)
+                duree = time.perf_counter() - debut
+            if iteration < echauffement:
+                continue
+            durees.append(duree * 1000)
+            requetes.append(len(enregistreur))
+            statuts.add(reponse.status_code)
+        return {
+            "url": url,
+            "statuts": sorted(statuts),
+            "p50_ms": round(percentile(durees, 50), 2),
+            "p95_ms": round(percentile(durees, 95), 2),
+            "max_ms": round(max(durees), 2),
+            "requetes_p50": statistics.median(requetes),
+            "requetes_max": max(requetes),
+        }
+
+    def afficher(self, resultats, precedent=None):
+        self.stdout.write(f"{'vue':<28}{'p50 ms':>10}{'p95 ms':>10}{'requêtes':>10}  statuts")
+        for nom, r in resultats.items():
+            ligne = f"{nom:<28}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['requetes_p50']:>10g}  {r['statuts']}"
+            avant = (precedent or {}).get(nom)
+            if avant:
+                ecart = (r["p50_ms"] - avant["p50_ms"]) / max(avant["p50_ms"], 1e-9) * 100
+                ligne += f"  (p50 {ecart:+.0f} %, requêtes {r['requetes_p50'] - avant['requetes_p50']:+g})"
+            style = self.style.WARNING if any(s >= 400 for s in r["statuts"]) else (lambda s: s)
+            self.stdout.write(style(ligne))
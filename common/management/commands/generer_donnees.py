@@ -0,0 +1,290 @@
+# common/management/commands/generer_donnees.py
+import random
+from collections import defaultdict
+from datetime import timedelta
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from clients.models import Entreprise
+from common.constants import ETAT_CHOIX
+from common.models import Caisse, CompteurDocument, MouvementCaisse, Pages
+from services import catalogue
+from services.models import Service
+from vente.models import Commande, LigneCommande, SoldeClient, Vente
+
+STATUTS = [code for code, _ in ETAT_CHOIX]
+REPARTITION_STATUTS = "Payée=60,En attente=20,Planifiée=8,Livrée=5,Annulée=4,Reportée=2,Supprimée=1"
+
+PREFIXES_SOCIETE = ["SARL", "SA", "SURL", "EI", "Ets", "Groupe"]
+MOTS_SOCIETE = [
+    "Tsara", "Mahery", "Fanilo", "Soa", "Voninkazo", "Ravinala", "Andry", "Fitia",
+    "Hasina", "Lova", "Miaro", "Tiana", "Vatsy", "Zara", "Kintana", "Aina",
+]
+ACTIVITES = ["Commerce", "Restauration", "Textile", "Cosmétique", "Informatique", "Transport", "Artisanat"]
+REGIONS = ["Analamanga", "Vakinankaratra", "Atsinanana", "Boeny", "Diana", "Haute Matsiatra"]
+FAMILLES_SERVICE = [
+    ("Sponsorisation", 20000, 300000),
+    ("Création visuel", 10000, 80000),
+    ("Gestion de page", 50000, 400000),
+    ("Montage vidéo", 30000, 250000),
+    ("Shooting photo", 40000, 500000),
+    ("Rédaction", 5000, 60000),
+]
+MOYENS_PAIEMENT = ["MVola", "Orange Money", "Airtel Money", "Espèces", "Banque"]
+
+
+def repartition(texte):
+    """'Payée=60,En attente=20' -> ([statuts], [poids cumulés])."""
+    statuts, poids = [], []
+    for morceau in texte.split(","):
+        statut, _, valeur = morceau.partition("=")
+        statut = statut.strip()
+        if statut not in STATUTS:
+            raise CommandError(f"Statut inconnu : {statut!r} (attendus : {', '.join(STATUTS)}).")
+        try:
+            poids.append(float(valeur))
+        except ValueError:
+            raise CommandError(f"Poids invalide pour {statut!r} : {valeur!r}.")
+        statuts.append(statut)
+    if sum(poids) <= 0:
+        raise CommandError("La répartition des statuts doit avoir un poids total positif.")
+    return statuts, list(accumulate(poids))
+
+
+def poids_zipf(nombre, exposant):
+    """Poids cumulés 1/rang^exposant : quelques clients concentrent l'essentiel des commandes."""
+    return list(accumulate(1 / (rang ** exposant) for rang in range(1, nombre + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Remplit la base avec des données synthétiques en volume (entreprises, services, "
+        "pages, caisses, commandes avec lignes, ventes) pour les mesures de performance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entreprises", type=int, default=500, help="Défaut : 500.")
+        parser.add_argument("--services", type=int, default=200, help="Défaut : 200.")
+        parser.add_argument("--pages", type=int, default=5, help="Défaut : 5.")
+        parser.add_argument("--caisses", type=int, default=4, help="Défaut : 4.")
+        parser.add_argument("--commandes", type=int, default=5000, help="Défaut : 5000.")
+        parser.add_argument(
+            "--lignes", default="1-6",
+            help="Nombre de lignes par commande, MIN-MAX (défaut : 1-6).",
+        )
+        parser.add_argument(
+            "--quantite-max", type=int, default=5,
+            help="Quantité maximale par ligne (défaut : 5).",
+        )
+        parser.add_argument(
+            "--jours", type=int, default=365,
+            help="Les commandes sont réparties sur les N derniers jours (défaut : 365).",
+        )
+        parser.add_argument(
+            "--statuts", default=REPARTITION_STATUTS,
+            help=f"Poids des statuts de vente (défaut : {REPARTITION_STATUTS}). "
+                 "Les commandes « Payée » reçoivent une Vente.",
+        )
+        parser.add_argument(
+            "--concentration-clients", type=float, default=1.0,
+            help="Exposant de Zipf de la répartition des commandes entre clients ; "
+                 "0 = uniforme (défaut : 1.0).",
+        )
+        parser.add_argument(
+            "--delai-encaissement", type=int, default=7,
+            help="Écart maximal en jours entre commande et encaissement (défaut : 7).",
+        )
+        parser.add_argument("--graine", type=int, help="Graine aléatoire (jeu reproductible).")
+        parser.add_argument(
+            "--lot", type=int, default=1000,
+            help="Nombre de commandes insérées par transaction (défaut : 1000).",
+        )
+
+    def handle(self, *args, **options):
+        self.hasard = random.Random(options["graine"])
+        self.aujourdhui = timezone.now().date()
+        self.quantite_max = max(1, options["quantite_max"])
+        self.jours = max(1, options["jours"])
+        self.delai_encaissement = max(0, options["delai_encaissement"])
+        try:
+            mini, _, maxi = options["lignes"].partition("-")
+            self.lignes_min = int(mini)
+            self.lignes_max = int(maxi or mini)
+        except ValueError:
+            raise CommandError("--lignes attend MIN-MAX, ex. 1-6.")
+        if not 1 <= self.lignes_min <= self.lignes_max:
+            raise CommandError("--lignes : il faut 1 <= MIN <= MAX.")
+        self.statuts, self.poids_statuts = repartition(options["statuts"])
+
+        with transaction.atomic():
+            self.generer_pages(options["pages"])
+            self.generer_caisses(options["caisses"])
+            self.generer_entreprises(options["entreprises"])
+            self.generer_services(options["services"])
+
+        clients = list(Entreprise.objects.values_list("pk", flat=True))
+        services = list(Service.objects.values_list("pk", "tarif"))
+        pages = list(Pages.objects.values_list("pk", flat=True))
+        caisses = list(Caisse.objects.values_list("pk", flat=True))
+        if options["commandes"] > 0 and not (clients and services and pages and caisses):
+            raise CommandError("Il faut au moins une entreprise, un service, une page et une caisse.")
+        # Les clients sont mélangés pour que les plus actifs ne soient pas toujours les premiers créés
+        self.hasard.shuffle(clients)
+        poids_clients = poids_zipf(len(clients), max(0.0, options["concentration_clients"]))
+
+        restantes = max(0, options["commandes"])
+        taille_lot = max(1, options["lot"])
+        creees = ventes = lignes = 0
+        while restantes:
+            nombre = min(taille_lot, restantes)
+            with transaction.atomic():
+                n_lignes, n_ventes = self.generer_commandes(
+                    nombre, clients, poids_clients, services, pages, caisses
+                )
+            restantes -= nombre
+            creees += nombre
+            lignes += n_lignes
+            ventes += n_ventes
+            self.stdout.write(f"  {creees} commande(s)…")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['entreprises']} entreprise(s), {options['services']} service(s), "
+            f"{options['pages']} page(s), {options['caisses']} caisse(s), "
+            f"{creees} commande(s), {lignes} ligne(s), {ventes} vente(s) générée(s)."
+        ))
+
+    # --- Référentiels -------------------------------------------------------
+
+    def generer_pages(self, nombre):
+        Pages.objects.bulk_create([
+            Pages(nom=f"Page {self.hasard.choice(MOTS_SOCIETE)} {i}", contact=self.telephone(), type="SERVICE")
+            for i in range(1, nombre + 1)
+        ])
+
+    def generer_caisses(self, nombre):
+        Caisse.objects.bulk_create([
+            Caisse(nom=f"{MOYENS_PAIEMENT[i % len(MOYENS_PAIEMENT)]} {i // len(MOYENS_PAIEMENT) + 1}",
+                   responsable=f"Caissier {i + 1}")
+            for i in range(nombre)
+        ])
+
+    def generer_entreprises(self, nombre):
+        hasard = self.hasard
+        depart = Entreprise.objects.count()
+        dernier_id = Entreprise.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        entreprises = []
+        for i in range(depart + 1, depart + nombre + 1):
+            nom = f"{hasard.choice(MOTS_SOCIETE)} {hasard.choice(MOTS_SOCIETE)}"
+            entreprises.append(Entreprise(
+                raison_sociale=f"{hasard.choice(PREFIXES_SOCIETE)} {nom} {i}",
+                page_facebook=nom,
+                activite_produits=hasard.choice(ACTIVITES),
+                personne_de_contact=f"Contact {i}",
+                nif=f"{hasard.randrange(10 ** 9, 10 ** 10)}",
+                stat=f"{hasard.randrange(10 ** 10, 10 ** 11)}",
+                telephone=self.telephone(),
+                email=f"contact{i}@exemple.mg",
+                region=hasard.choice(REGIONS),
+                date_debut=self.aujourdhui - timedelta(days=hasard.randrange(30, 3000)),
+            ))
+        Entreprise.objects.bulk_create(entreprises, batch_size=1000)
+        # bulk_create ne passe pas par save() : index de recherche construit ici
+        Entreprise.indexer_recherche(Entreprise.objects.filter(pk__gt=dernier_id))
+
+    def generer_services(self, nombre):
+        hasard = self.hasard
+        existantes = set(Service.objects.filter(reference__startswith="SYN").values_list("reference", flat=True))
+        dernier_id = Service.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        services = []
+        numero = 0
+        while len(services) < nombre:
+            numero += 1
+            reference = f"SYN{numero:05d}"
+            if reference in existantes:
+                continue
+            famille, tarif_min, tarif_max = hasard.choice(FAMILLES_SERVICE)
+            services.append(Service(
+                nom=f"{famille} {numero}",
+                reference=reference,
+                tarif=hasard.randrange(tarif_min, tarif_max, 500),
+            ))
+        Service.objects.bulk_create(services, batch_size=1000)
+        # bulk_create ne passe ni par save() ni par post_save
+        Service.indexer_recherche(Service.objects.filter(pk__gt=dernier_id))
+        catalogue.invalider()
+
+    def telephone(self):
+        return f"03{self.hasard.choice('2348')} {self.hasard.randrange(10, 100)} {self.hasard.randrange(100, 1000)} {self.hasard.randrange(10, 100)}"
+
+    # --- Commandes ----------------------------------------------------------
+
+    def generer_commandes(self, nombre, clients, poids_clients, services, pages, caisses):
+        """Un lot : commandes, lignes puis ventes. Retourne (nombre de lignes, nombre de ventes)."""
+        hasard = self.hasard
+        commandes = []
+        for _ in range(nombre):
+            commandes.append(Commande(
+                date_commande=self.aujourdhui - timedelta(days=hasard.randrange(self.jours)),
+                client_id=hasard.choices(clients, cum_weights=poids_clients)[0],
+                page_id=hasard.choice(pages),
+                statut_vente=hasard.choices(self.statuts, cum_weights=self.poids_statuts)[0],
+            ))
+        # bulk_create ne passe pas par save() : numéros alloués par bloc, jour par jour
+        self.numeroter(commandes, Commande.PREFIXE_NUMERO, "numero_proforma", lambda c: c.date_commande)
+        Commande.objects.bulk_create(commandes)
+        if commandes[0].pk is None:
+            # Bases sans RETURNING (MySQL) : on relit les ids par numéro
+            ids = dict(Commande.objects.filter(
+                numero_proforma__in=[c.numero_proforma for c in commandes]
+            ).values_list("numero_proforma", "pk"))
+            for commande in commandes:
+                commande.pk = ids[commande.numero_proforma]
+
+        lignes = []
+        montants = {}
+        for commande in commandes:
+            nombre_lignes = min(hasard.randint(self.lignes_min, self.lignes_max), len(services))
+            montant = 0
+            for service_id, tarif in hasard.sample(services, nombre_lignes):
+                quantite = hasard.randint(1, self.quantite_max)
+                lignes.append(LigneCommande(
+                    commande_id=commande.pk, service_id=service_id, tarif=tarif, quantite=quantite,
+                ))
+                montant += tarif * quantite
+            montants[commande.pk] = montant
+        # LigneCommandeQuerySet.bulk_create recalcule montant_total des commandes du lot
+        LigneCommande.objects.bulk_create(lignes, batch_size=1000)
+
+        ventes = []
+        for commande in commandes:
+            if commande.statut_vente != "Payée":
+                continue
+            encaissement = min(
+                commande.date_commande + timedelta(days=hasard.randint(0, self.delai_encaissement)),
+                self.aujourdhui,
+            )
+            ventes.append(Vente(
+                commande_id=commande.pk,
+                date_encaissement=encaissement,
+                paiement_id=hasard.choice(caisses),
+                reference=f"REF{hasard.randrange(10 ** 7, 10 ** 8)}",
+                montant=montants[commande.pk],
+            ))
+        self.numeroter(ventes, Vente.PREFIXE_NUMERO, "numero_facture", lambda v: v.date_encaissement)
+        Vente.objects.bulk_create(ventes, batch_size=1000)
+        # bulk_create ne passe pas par Vente.save() : journal de caisse et soldes des clients
+        MouvementCaisse.enregistrer(vente.mouvement() for vente in ventes)
+        SoldeClient.recalculer({c.client_id for c in commandes if c.statut_vente == "Payée"})
+        return len(lignes), len(ventes)
+
+    def numeroter(self, objets, prefixe, champ, jour_de):
+        par_jour = defaultdict(list)
+        for objet in objets:
+            par_jour[jour_de(objet)].append(objet)
+        for jour, du_jour in sorted(par_jour.items()):
+            numeros = CompteurDocument.generer_numeros(prefixe, len(du_jour), jour)
+            for objet, numero in zip(du_jour, numeros):
+                setattr(objet, champ, numero)
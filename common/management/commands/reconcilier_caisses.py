@@ -0,0 +1,109 @@
+# common/management/commands/reconcilier_caisses.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from common.models import ArreteCaisse, Caisse, MouvementCaisse
+
+
+def cumul_subquery(sens):
+    """Expression SQL : SUM(montant) des mouvements `sens` de la caisse référencée."""
+    mouvements = (
+        MouvementCaisse.objects
+        .filter(caisse_id=OuterRef("pk"), sens=sens)
+        .order_by()
+        .values("caisse_id")
+        .annotate(total=Sum("montant"))
+        .values("total")[:1]
+    )
+    return Coalesce(Subquery(mouvements), Value(0))
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les cumuls des caisses (entree, sortie, solde) à partir du journal "
+        "MouvementCaisse, vérifie les arrêtés journaliers et crée ceux qui manquent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--jusqu-au", dest="jusqu_au",
+            help="Dernier jour arrêté, AAAA-MM-JJ (défaut : la veille).",
+        )
+        parser.add_argument(
+            "--verifier", action="store_true",
+            help="Signale les écarts sans rien corriger ni créer.",
+        )
+
+    def handle(self, *args, **options):
+        verifier = options["verifier"]
+        jusqu_au = timezone.localdate() - timedelta(days=1)
+        if options["jusqu_au"]:
+            jusqu_au = parse_date(options["jusqu_au"])
+            if jusqu_au is None:
+                raise CommandError("--jusqu-au attend une date AAAA-MM-JJ.")
+
+        ecarts = 0
+        for caisse in Caisse.objects.order_by("pk"):
+            ecarts += self.reconcilier_cumuls(caisse, verifier)
+            ecarts += self.verifier_arretes(caisse, verifier)
+
+        crees = 0
+        if not verifier:
+            crees = ArreteCaisse.arreter(jusqu_au)
+
+        if verifier:
+            style = self.style.WARNING if ecarts else self.style.SUCCESS
+            self.stdout.write(style(f"{ecarts} écart(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{ecarts} écart(s) corrigé(s), {crees} arrêté(s) créé(s) jusqu'au {jusqu_au:%d/%m/%Y}."
+            ))
+
+    def reconcilier_cumuls(self, caisse, verifier):
+        totaux = caisse.mouvements.aggregate(**MouvementCaisse.cumuls())
+        entree, sortie = totaux["entree"] or 0, totaux["sortie"] or 0
+        attendu = (entree, sortie, caisse.solde_initial + entree - sortie)
+        if (caisse.entree, caisse.sortie, caisse.solde) == attendu:
+            return 0
+        self.stdout.write(
+            f"  {caisse.nom} (id={caisse.pk}) : entree/sortie/solde "
+            f"stockés={caisse.entree}/{caisse.sortie}/{caisse.solde} journal={'/'.join(map(str, attendu))}"
+        )
+        if not verifier:
+            # Recalcul dans l'UPDATE : les écritures validées entre-temps sont comprises
+            entree, sortie = cumul_subquery(MouvementCaisse.ENTREE), cumul_subquery(MouvementCaisse.SORTIE)
+            Caisse.objects.filter(pk=caisse.pk).update(
+                entree=entree, sortie=sortie, solde=F("solde_initial") + entree - sortie,
+            )
+        return 1
+
+    def verifier_arretes(self, caisse, verifier):
+        """Compare chaque arrêté aux cumuls du journal ; supprime à partir du premier faux."""
+        arretes = list(caisse.arretes.order_by("date").values_list("date", "entree", "sortie", "nombre_mouvements"))
+        if not arretes:
+            return 0
+        jours = (
+            caisse.mouvements.filter(date__lte=arretes[-1][0])
+            .values("date").annotate(n=Count("pk"), **MouvementCaisse.cumuls()).order_by("date")
+        )
+        cumuls, entree, sortie, nombre = {}, 0, 0, 0
+        for jour in jours:
+            entree += jour["entree"] or 0
+            sortie += jour["sortie"] or 0
+            nombre += jour["n"]
+            cumuls[jour["date"]] = (entree, sortie, nombre)
+        for date, *stocke in arretes:
+            if cumuls.get(date) != tuple(stocke):
+                self.stdout.write(
+                    f"  {caisse.nom} (id={caisse.pk}) : arrêté du {date:%d/%m/%Y} "
+                    f"stocké={tuple(stocke)} journal={cumuls.get(date)}"
+                )
+                if not verifier:
+                    ArreteCaisse.objects.filter(caisse=caisse, date__gte=date).delete()
+                return 1
+        return 0
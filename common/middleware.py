@@ -1,4 +1,20 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
 import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+from common import profilage
+from common.requetes import EnregistreurRequetes
+
+logger_n_plus_1 = logging.getLogger("common.n_plus_1")
+logger_profilage = logging.getLogger("common.profilage")
 
 _user = threading.local()
 
@@ -17,3 +33,102 @@ class CurrentUserMiddleware:
         finally:
             _user.value = None  # Nettoyage important !
         return response
+
+
+class DetecteurNPlus1Middleware:
+    """
+    Signale les requêtes SQL répétées (N+1) d'une requête HTTP.
+    Actif seulement si settings.DETECTEUR_N_PLUS_1 est vrai : toutes les requêtes
+    sont enregistrées, regroupées par forme, et chaque forme exécutée au moins
+    DETECTEUR_N_PLUS_1_SEUIL fois est journalisée (logger "common.n_plus_1")
+    avec la ligne de template et de code qui l'a déclenchée.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "DETECTEUR_N_PLUS_1", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.seuil = getattr(settings, "DETECTEUR_N_PLUS_1_SEUIL", 5)
+
+    def __call__(self, request):
+        with EnregistreurRequetes() as enregistreur:
+            response = self.get_response(request)
+
+        repetitions = enregistreur.repetitions(self.seuil)
+        response["X-Requetes-SQL"] = str(len(enregistreur))
+        if repetitions:
+            response["X-N-Plus-1"] = str(len(repetitions))
+            logger_n_plus_1.warning(
+                "N+1 sur %s %s\n%s", request.method, request.path, enregistreur.rapport(self.seuil)
+            )
+        return response
+
+
+class ProfilageMiddleware:
+    """
+    Temps passé par requête : total, SQL (nombre et durée), templates, PDF.
+      - PROFILAGE_ACTIF : en-tête Server-Timing sur chaque réponse ;
+      - PROFILAGE_LOG : en plus, une ligne JSON par requête (logger "common.profilage") ;
+      - en-tête de requête X-Profile (staff uniquement) : la réponse est remplacée par
+        le rapport cProfile de la requête (X-Profile: tottime pour trier autrement).
+    Désactivé, la requête passe telle quelle (sans mesure ni Server-Timing) sauf
+    X-Profile d'un membre du staff.
+    À placer après AuthenticationMiddleware.
+    """
+    LIGNES_PROFIL = 60
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.actif = getattr(settings, "PROFILAGE_ACTIF", False)
+        self.log = getattr(settings, "PROFILAGE_LOG", False)
+        if self.actif:
+            profilage.instrumenter_templates()
+
+    def __call__(self, request):
+        x_profile = request.META.get("HTTP_X_PROFILE")
+        if x_profile and getattr(request, "user", None) is not None and request.user.is_staff:
+            return self.profil_cprofile(request, x_profile)
+        if not self.actif:
+            return self.get_response(request)
+
+        debut = time.perf_counter()
+        with profilage.session() as mesures:
+            response = self.get_response(request)
+        total = time.perf_counter() - debut
+
+        response["Server-Timing"] = self.server_timing(total, mesures)
+        if self.log:
+            logger_profilage.info(json.dumps({
+                "methode": request.method,
+                "chemin": request.path,
+                "statut": response.status_code,
+                "total_ms": round(total * 1000, 1),
+                "sql_nombre": mesures.nombres["sql"],
+                "sql_ms": round(mesures.durees["sql"] * 1000, 1),
+                "tpl_ms": round(mesures.durees["tpl"] * 1000, 1),
+                "pdf_ms": round(mesures.durees["pdf"] * 1000, 1),
+            }))
+        return response
+
+    @staticmethod
+    def server_timing(total, mesures):
+        parties = [
+            f"total;dur={total * 1000:.1f}",
+            f'sql;dur={mesures.durees["sql"] * 1000:.1f};desc="{mesures.nombres["sql"]} req"',
+            f"tpl;dur={mesures.durees['tpl'] * 1000:.1f}",
+        ]
+        if mesures.nombres["pdf"]:
+            parties.append(f"pdf;dur={mesures.durees['pdf'] * 1000:.1f}")
+        return ", ".join(parties)
+
+    def profil_cprofile(self, request, tri):
+        profil = cProfile.Profile()
+        profil.enable()
+        try:
+            self.get_response(request)
+        finally:
+            profil.disable()
+        tri = tri if tri in ("tottime", "ncalls", "cumulative") else "cumulative"
+        sortie = io.StringIO()
+        pstats.Stats(profil, stream=sortie).sort_stats(tri).print_stats(self.LIGNES_PROFIL)
+        return HttpResponse(sortie.getvalue(), content_type="text/plain; charset=utf-8")
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0006_pages_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefixe', models.CharField(max_length=5)),
+                ('jour', models.DateField()),
+                ('dernier_numero', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='compteurdocument',
+            constraint=models.UniqueConstraint(fields=('prefixe', 'jour'), name='unique_compteur_prefixe_jour'),
+        ),
+    ]
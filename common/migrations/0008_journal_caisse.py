@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('common', '0007_compteurdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArreteCaisse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('entree', models.PositiveBigIntegerField(default=0)),
+                ('sortie', models.PositiveBigIntegerField(default=0)),
+                ('nombre_mouvements', models.PositiveIntegerField(default=0)),
+                ('caisse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arretes', to='common.caisse')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MouvementCaisse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=django.utils.timezone.localdate)),
+                ('sens', models.CharField(choices=[('ENTREE', 'Entrée'), ('SORTIE', 'Sortie')], max_length=6)),
+                ('montant', models.PositiveIntegerField()),
+                ('libelle', models.CharField(blank=True, default='', max_length=255)),
+                ('piece', models.CharField(blank=True, default='', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('caisse', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='mouvements', to='common.caisse')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['caisse', 'date', 'id'], name='common_mouvement_caisse_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='arretecaisse',
+            constraint=models.UniqueConstraint(fields=('caisse', 'date'), name='unique_arrete_caisse_date'),
+        ),
+    ]
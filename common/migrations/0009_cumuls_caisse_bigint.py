@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0008_journal_caisse'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='caisse',
+            name='entree',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='caisse',
+            name='solde',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='caisse',
+            name='sortie',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
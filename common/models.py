@@ -1,4 +1,13 @@
-from django.db import models
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction, IntegrityError, OperationalError, connection
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
 from common.mixins import AuditMixin
 
 class Pages(AuditMixin):
@@ -24,16 +33,291 @@ class Caisse(AuditMixin):
     nom = models.CharField(max_length=100)
     responsable = models.CharField(max_length=100)
     solde_initial = models.PositiveIntegerField(default=0)
-    entree = models.PositiveIntegerField(default=0)
-    sortie = models.PositiveIntegerField(default=0)
-    solde = models.PositiveIntegerField(default=0)
+    entree = models.PositiveBigIntegerField(default=0)
+    sortie = models.PositiveBigIntegerField(default=0)
+    solde = models.PositiveBigIntegerField(default=0)
+
+    # Cumuls du journal (MouvementCaisse) : écrits uniquement par UPDATE ... F()
+    CHAMPS_CUMULS = ("entree", "sortie", "solde")
 
     def __str__(self):
         return self.nom
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.solde = int(self.solde_initial or 0) + self.entree - self.sortie
+        elif kwargs.get("update_fields") is None:
+            # Une instance chargée avant un encaissement ne doit pas écraser les cumuls
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CHAMPS_CUMULS
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if "solde_initial" in (kwargs.get("update_fields") or ()):
+                Caisse.objects.filter(pk=self.pk).update(solde=F("solde_initial") + F("entree") - F("sortie"))
+                self.refresh_from_db(fields=self.CHAMPS_CUMULS)
+
+    def solde_au(self, jour):
+        """
+        Solde en fin de journée : cumuls du dernier arrêté à cette date ou avant
+        (une lecture d'index), plus les mouvements postérieurs à cet arrêté.
+        """
+        arrete = self.arretes.filter(date__lte=jour).order_by("-date").first()
+        entree, sortie = (arrete.entree, arrete.sortie) if arrete else (0, 0)
+        if arrete is None or arrete.date != jour:
+            mouvements = self.mouvements.filter(date__lte=jour)
+            if arrete:
+                mouvements = mouvements.filter(date__gt=arrete.date)
+            totaux = mouvements.aggregate(**MouvementCaisse.cumuls())
+            entree += totaux["entree"] or 0
+            sortie += totaux["sortie"] or 0
+        return self.solde_initial + entree - sortie
+
+
+class JourneeCloturee(Exception):
+    """Écriture de caisse datée d'une journée déjà clôturée (voir encaissement.ClotureCaisse)."""
+
+
+class MouvementCaisseQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        raise ValueError("Le journal de caisse est en ajout seul : passer une écriture inverse.")
+
+    update.alters_data = True
+
+    def delete(self):
+        raise ValueError("Le journal de caisse est en ajout seul : passer une écriture inverse.")
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class MouvementCaisse(models.Model):
+    """
+    Journal des entrées / sorties d'une caisse, en ajout seul : une écriture n'est
+    jamais modifiée ni supprimée, une correction est une écriture inverse.
+    """
+    ENTREE = "ENTREE"
+    SORTIE = "SORTIE"
+    SENS_CHOIX = [(ENTREE, "Entrée"), (SORTIE, "Sortie")]
+
+    caisse = models.ForeignKey(Caisse, on_delete=models.PROTECT, related_name="mouvements")
+    date = models.DateField(default=timezone.localdate)
+    sens = models.CharField(max_length=6, choices=SENS_CHOIX)
+    montant = models.PositiveIntegerField()
+    libelle = models.CharField(max_length=255, blank=True, default="")
+    piece = models.CharField(max_length=50, blank=True, default="")  # ex. numéro de facture
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+
+    objects = MouvementCaisseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["caisse", "date", "id"], name="common_mouvement_caisse_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_sens_display()} {self.montant} Ar ({self.caisse_id}, {self.date})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Le journal de caisse est en ajout seul : passer une écriture inverse.")
+        self.__class__.enregistrer([self])
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Le journal de caisse est en ajout seul : passer une écriture inverse.")
+
+    @staticmethod
+    def cumuls():
+        """Agrégats {entree, sortie} d'un queryset de mouvements."""
+        return {
+            "entree": Sum("montant", filter=Q(sens=MouvementCaisse.ENTREE)),
+            "sortie": Sum("montant", filter=Q(sens=MouvementCaisse.SORTIE)),
+        }
+
+    @classmethod
+    def enregistrer(cls, mouvements):
+        """
+        Ajoute des écritures (bulk_create) et les reporte sur les cumuls des caisses :
+        un UPDATE ... SET entree = entree + x par caisse, sans lecture préalable ni
+        select_for_update, donc le verrou de ligne n'est pris qu'à ce moment et rendu
+        à la fin de la transaction. À appeler dans la transaction de la pièce, en
+        dernière écriture : le verrou de la caisse est alors tenu le moins longtemps.
+        Les arrêtés à partir de la plus ancienne date écrite sont supprimés
+        (reconstruits par la commande reconcilier_caisses).
+        Lève JourneeCloturee si une écriture (même de montant nul) tombe sur une
+        journée clôturée de sa caisse : la transaction de la pièce est annulée.
+        """
+        mouvements = list(mouvements)
+        if not mouvements:
+            return []
+        cumuls = defaultdict(lambda: {"entree": 0, "sortie": 0, "jours": set()})
+        for mouvement in mouvements:
+            if isinstance(mouvement.date, datetime):
+                mouvement.date = timezone.localdate(mouvement.date)
+            cumul = cumuls[mouvement.caisse_id]
+            cumul["entree" if mouvement.sens == cls.ENTREE else "sortie"] += mouvement.montant
+            cumul["jours"].add(mouvement.date)
+
+        with transaction.atomic():
+            crees = cls.objects.bulk_create([m for m in mouvements if m.montant], batch_size=1000)
+            # Caisses dans un ordre fixe : deux lots concurrents ne s'interbloquent pas
+            for caisse_id in sorted(cumuls):
+                cumul = cumuls[caisse_id]
+                ArreteCaisse.objects.filter(caisse_id=caisse_id, date__gte=min(cumul["jours"])).delete()
+                Caisse.objects.filter(pk=caisse_id).update(
+                    entree=F("entree") + cumul["entree"],
+                    sortie=F("sortie") + cumul["sortie"],
+                    solde=F("solde") + cumul["entree"] - cumul["sortie"],
+                )
+                # Après l'UPDATE : la caisse est verrouillée, comme pendant une clôture
+                jour = cls.journee_cloturee(caisse_id, cumul["jours"])
+                if jour is not None:
+                    nom = Caisse.objects.filter(pk=caisse_id).values_list("nom", flat=True).first()
+                    raise JourneeCloturee(f"La journée du {jour:%d/%m/%Y} est clôturée pour la caisse {nom}.")
+        return crees
+
+    @staticmethod
+    def journee_cloturee(caisse_id, jours):
+        """
+        Première journée clôturée parmi `jours` pour cette caisse, ou None. Lecture
+        verrouillante, à faire caisse verrouillée : ClotureCaisse.cloturer verrouille
+        aussi les caisses, donc une clôture concurrente est soit vue ici, soit écrite
+        après le commit de l'écriture (et la compte).
+        """
+        # encaissement dépend de common : modèle résolu à l'exécution, pas importé
+        try:
+            cloture = apps.get_model("encaissement", "ClotureCaisse")
+        except LookupError:
+            return None
+        return (
+            cloture.objects.select_for_update()
+            .filter(caisse_id=caisse_id, date__in=jours)
+            .order_by("date").values_list("date", flat=True).first()
+        )
+
+
+class ArreteCaisse(models.Model):
+    """
+    Cumuls du journal d'une caisse à la fin d'une journée (jours ayant des mouvements) :
+    le solde à une date se lit sur le dernier arrêté sans parcourir le journal.
+    """
+    caisse = models.ForeignKey(Caisse, on_delete=models.CASCADE, related_name="arretes")
+    date = models.DateField()
+    entree = models.PositiveBigIntegerField(default=0)
+    sortie = models.PositiveBigIntegerField(default=0)
+    nombre_mouvements = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["caisse", "date"], name="unique_arrete_caisse_date"),
+        ]
+
+    def __str__(self):
+        return f"Arrêté {self.caisse_id} au {self.date}"
+
+    @classmethod
+    def arreter(cls, jusqu_au=None, caisses=None):
+        """
+        Crée les arrêtés manquants jusqu'à `jusqu_au` inclus (défaut : la veille),
+        en repartant du dernier arrêté de chaque caisse. Retourne le nombre d'arrêtés créés.
+        """
+        jusqu_au = jusqu_au or timezone.localdate() - timedelta(days=1)
+        caisses = Caisse.objects.all() if caisses is None else caisses
+        crees = 0
+        for caisse_id in caisses.values_list("pk", flat=True):
+            dernier = cls.objects.filter(caisse_id=caisse_id, date__lte=jusqu_au).order_by("-date").first()
+            mouvements = MouvementCaisse.objects.filter(caisse_id=caisse_id, date__lte=jusqu_au)
+            entree = sortie = nombre = 0
+            if dernier:
+                mouvements = mouvements.filter(date__gt=dernier.date)
+                entree, sortie, nombre = dernier.entree, dernier.sortie, dernier.nombre_mouvements
+            arretes = []
+            jours = mouvements.values("date").annotate(n=Count("pk"), **MouvementCaisse.cumuls()).order_by("date")
+            for jour in jours:
+                entree += jour["entree"] or 0
+                sortie += jour["sortie"] or 0
+                nombre += jour["n"]
+                arretes.append(cls(
+                    caisse_id=caisse_id, date=jour["date"],
+                    entree=entree, sortie=sortie, nombre_mouvements=nombre,
+                ))
+            crees += len(cls.objects.bulk_create(arretes, batch_size=1000, ignore_conflicts=True))
+        return crees
+
 class PlanDesComptes(AuditMixin):
     compte_numero = models.CharField(max_length=20)
     libelle = models.CharField(max_length=255)
 
     def __str__(self):
         return f"{self.compte_numero} - {self.libelle}"
+
+
+class CompteurDocument(models.Model):
+    """
+    Compteur de numéros de pièces (proforma, facture…) par préfixe et par jour.
+    Une ligne par (prefixe, jour) : l'allocation est un UPDATE ... SET dernier_numero =
+    dernier_numero + n, sans parcours des pièces existantes.
+    """
+    prefixe = models.CharField(max_length=5)
+    jour = models.DateField()
+    dernier_numero = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["prefixe", "jour"], name="unique_compteur_prefixe_jour"),
+        ]
+
+    def __str__(self):
+        return f"{self.prefixe}{self.jour:%y%m%d} : {self.dernier_numero}"
+
+    TENTATIVES_VERROU = 10
+
+    @classmethod
+    def allouer(cls, prefixe, nombre=1, jour=None):
+        """
+        Réserve `nombre` numéros consécutifs pour (prefixe, jour) et retourne le range.
+        Le verrou de ligne est tenu jusqu'à la fin de la transaction englobante :
+        appelé dans la même transaction que l'enregistrement des pièces, un rollback
+        ne laisse pas de trou dans la numérotation.
+        Hors transaction, un conflit de verrou (deadlock, lock wait timeout, SQLite locked)
+        est retenté quelques fois.
+        """
+        if nombre < 1:
+            raise ValueError("nombre doit être >= 1")
+        jour = jour or timezone.now().date()
+
+        for tentative in range(cls.TENTATIVES_VERROU):
+            try:
+                return cls._allouer(prefixe, nombre, jour)
+            except OperationalError:
+                if connection.in_atomic_block or tentative == cls.TENTATIVES_VERROU - 1:
+                    raise
+                time.sleep(random.uniform(0.005, 0.02) * (tentative + 1))
+
+    @classmethod
+    def _allouer(cls, prefixe, nombre, jour):
+        compteur = cls.objects.filter(prefixe=prefixe, jour=jour)
+        with transaction.atomic():
+            if not compteur.update(dernier_numero=F("dernier_numero") + nombre):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(prefixe=prefixe, jour=jour, dernier_numero=nombre)
+                except IntegrityError:
+                    # Créé entre-temps par une autre transaction
+                    compteur.update(dernier_numero=F("dernier_numero") + nombre)
+            dernier = compteur.select_for_update().values_list("dernier_numero", flat=True).get()
+        return range(dernier - nombre + 1, dernier + 1)
+
+    @staticmethod
+    def formater(prefixe, jour, numero):
+        return f"{prefixe}{jour:%y%m%d}-{numero:03d}"
+
+    @classmethod
+    def generer_numeros(cls, prefixe, nombre=1, jour=None):
+        """Alloue et formate `nombre` numéros : ex. ["F250902-001", "F250902-002"]."""
+        jour = jour or timezone.now().date()
+        return [cls.formater(prefixe, jour, n) for n in cls.allouer(prefixe, nombre, jour)]
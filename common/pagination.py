@@ -0,0 +1,206 @@
+# common/pagination.py
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+PAGINATION_PAGES = "pages"
+PAGINATION_CURSEUR = "curseur"
+
+
+def resolve_pagination_mode(request, default=PAGINATION_PAGES):
+    """
+    Mode de pagination demandé :
+    1) ?pagination=pages|curseur
+    2) présence d’un ?cursor=... (lien suivant/précédent)
+    3) valeur par défaut de la vue
+    """
+    mode = (request.GET.get("pagination") or "").strip().lower()
+    if mode in (PAGINATION_PAGES, PAGINATION_CURSEUR):
+        return mode
+    if request.GET.get("cursor"):
+        return PAGINATION_CURSEUR
+    return default
+
+
+class CursorPage:
+    """Page obtenue par clé (keyset) : même interface utile aux templates qu’un Page Django."""
+    est_curseur = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @cached_property
+    def next_cursor(self):
+        if not self._has_next:
+            return ""
+        return self.paginator.encode_cursor(self.object_list[-1], "n")
+
+    @cached_property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return ""
+        return self.paginator.encode_cursor(self.object_list[0], "p")
+
+
+class CursorPaginator:
+    """
+    Pagination par clé sur un tri total, ex. ("-date_commande", "-id") :
+    WHERE (date, id) < (dernière date, dernier id) ORDER BY date DESC, id DESC LIMIT n+1.
+    Le coût ne dépend pas de la profondeur et il n’y a pas de COUNT(*) à chaque page.
+    Le total (`count`) n’est calculé que si le template le demande, et mis en cache.
+    """
+    count_cache_timeout = 60
+
+    def __init__(self, queryset, per_page, ordering):
+        if not ordering:
+            raise ValueError("CursorPaginator requiert un tri, ex. ('-date_commande', '-id')")
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [o.lstrip("-") for o in self.ordering]
+
+    # --- Jetons ---
+    def _field_value(self, obj, name):
+        return obj.pk if name in ("pk", "id") else getattr(obj, name)
+
+    def encode_cursor(self, obj, direction):
+        payload = {"d": direction, "v": [self._field_value(obj, f) for f in self.fields]}
+        raw = json.dumps(payload, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode_cursor(self, token):
+        """Retourne (direction, valeurs) ou None si le jeton est absent/invalide."""
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            payload = json.loads(raw)
+            direction, values = payload["d"], payload["v"]
+            if direction not in ("n", "p") or len(values) != len(self.fields):
+                return None
+            opts = self.queryset.model._meta
+            values = [
+                opts.pk.to_python(v) if f in ("pk", "id") else opts.get_field(f).to_python(v)
+                for f, v in zip(self.fields, values)
+            ]
+        except (binascii.Error, ValueError, KeyError, TypeError, ValidationError):
+            return None
+        return direction, values
+
+    # --- Requêtes ---
+    def _keyset_filter(self, values, reverse):
+        """
+        Condition lexicographique « strictement après » la clé dans l’ordre demandé
+        (ou « strictement avant » si reverse) : OR sur les préfixes d’égalité.
+        """
+        condition = Q()
+        for i, ordering in enumerate(self.ordering):
+            descending = ordering.startswith("-")
+            if reverse:
+                descending = not descending
+            lookup = f"{self.fields[i]}__{'lt' if descending else 'gt'}"
+            terme = Q(**{lookup: values[i]})
+            for j in range(i):
+                terme &= Q(**{self.fields[j]: values[j]})
+            condition |= terme
+        return condition
+
+    def _reversed_ordering(self):
+        return [o[1:] if o.startswith("-") else f"-{o}" for o in self.ordering]
+
+    def page(self, token=None):
+        decoded = self.decode_cursor(token)
+        qs = self.queryset.order_by(*self.ordering)
+
+        if decoded is None:
+            rows = list(qs[: self.per_page + 1])
+            has_next, has_previous = len(rows) > self.per_page, False
+            rows = rows[: self.per_page]
+        elif decoded[0] == "n":
+            rows = list(qs.filter(self._keyset_filter(decoded[1], reverse=False))[: self.per_page + 1])
+            has_next, has_previous = len(rows) > self.per_page, True
+            rows = rows[: self.per_page]
+        else:
+            qs = self.queryset.order_by(*self._reversed_ordering())
+            rows = list(qs.filter(self._keyset_filter(decoded[1], reverse=True))[: self.per_page + 1])
+            has_next, has_previous = True, len(rows) > self.per_page
+            rows = rows[: self.per_page][::-1]
+
+        return CursorPage(rows, self, has_next, has_previous)
+
+    @cached_property
+    def count(self):
+        """Total mis en cache quelques secondes (clé = SQL du comptage)."""
+        try:
+            sql = str(self.queryset.order_by().query)
+        except Exception:
+            return self.queryset.count()
+        key = "pagination:count:" + hashlib.md5(sql.encode()).hexdigest()
+        return cache.get_or_set(key, self.queryset.count, self.count_cache_timeout)
+
+
+class CursorPaginationMixin:
+    """
+    Pour ListView : bascule entre pagination par numéro (Paginator) et par clé
+    selon ?pagination=… / ?cursor=… (voir resolve_pagination_mode).
+    """
+    cursor_ordering = ()
+    pagination_par_defaut = PAGINATION_PAGES
+    cursor_afficher_total = True
+
+    def get_pagination_mode(self):
+        # En mode cartes, le curseur permet le défilement infini
+        defaut = PAGINATION_CURSEUR if self.request.GET.get("display") == "cards" else self.pagination_par_defaut
+        return resolve_pagination_mode(self.request, defaut)
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() != PAGINATION_CURSEUR:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        page = paginator.page(self.request.GET.get("cursor"))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def get_cursor_paginator(self, queryset, page_size):
+        return CursorPaginator(queryset, page_size, self.cursor_ordering)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["pagination_curseur_disponible"] = True
+        context["afficher_total"] = self.cursor_afficher_total
+        return context
+
+
+def paginer(request, queryset, per_page, cursor_ordering, default=PAGINATION_PAGES):
+    """Équivalent fonctionnel pour les vues View : retourne le page_obj du mode demandé."""
+    if resolve_pagination_mode(request, default) == PAGINATION_CURSEUR:
+        return CursorPaginator(queryset, per_page, cursor_ordering).page(request.GET.get("cursor"))
+    return Paginator(queryset, per_page).get_page(request.GET.get("page"))
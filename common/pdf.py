@@ -2,71 +2,147 @@
 from django.template.loader import render_to_string
 from django.http import HttpResponse
 from weasyprint import HTML, CSS
+from weasyprint.formatting_structure.boxes import MarginBox
+
+from common.pdf_ressources import cache_rendu, css_depuis_texte, feuilles_de_style, url_fetcher_local
+from common.profilage import mesurer
+
+
+def _document_html(html_str, base_url):
+    # /static/ et /media/ lus sur disque plutôt que redemandés au site en HTTP
+    return HTML(string=html_str, base_url=base_url, url_fetcher=url_fetcher_local(base_url))
+
+def render_pdf_bytes(template_name: str, context: dict, base_url: str, request=None) -> bytes:
+    """
+    Rend un template HTML -> PDF (bytes) via WeasyPrint, sans réponse HTTP
+    (utilisé aussi hors requête, ex. génération anticipée du cache des factures).
+    """
+    html_str = render_to_string(template_name, context, request=request)
+    with mesurer("pdf"):
+        html_str, feuilles = feuilles_de_style(html_str, base_url)
+        return _document_html(html_str, base_url).write_pdf(stylesheets=feuilles, cache=cache_rendu())
 
 def render_html_to_pdf(template_name: str, context: dict, request, filename: str = "document.pdf"):
     """
     Rend un template HTML -> PDF (bytes) via WeasyPrint et renvoie un HttpResponse PDF.
     - base_url est indispensable pour que {% static %} et les images fonctionnent.
     """
-    html_str = render_to_string(template_name, context, request=request)
     base_url = request.build_absolute_uri("/")  # résout les URLs statiques/relatives
-    pdf_bytes = HTML(string=html_str, base_url=base_url).write_pdf()
+    pdf_bytes = render_pdf_bytes(template_name, context, base_url, request=request)
 
     response = HttpResponse(pdf_bytes, content_type="application/pdf")
     response["Content-Disposition"] = f'inline; filename="{filename}"'
     return response
 
+A4_W, A4_H = 210.0, 297.0
+PX_PAR_MM = 96 / 25.4  # unité CSS de WeasyPrint : px à 96 dpi
+
+# Hauteurs essayées par le mode "paliers" ; la dernière sert de page de mesure
+HAUTEURS_PALIERS_MM = (420, 600, 840, 1000, 1300, 1600, 2000, 2400, 3000, 3600, 4200)
+
+MODE_MESURE = "mesure"    # 1 mise en page très haute, mesure, 1 rendu à la hauteur exacte
+MODE_PALIERS = "paliers"  # ancien comportement : une mise en page par hauteur essayée
+
+
+def _override_css(height_mm: float, margin_mm: float) -> CSS:
+    # CSS d'override pour le mode "single page"
+    return css_depuis_texte(f"""
+        @page {{
+            size: {A4_W}mm {height_mm}mm;   /* page très haute */
+            margin: {margin_mm}mm;
+        }}
+        /* Neutralise le saut forcé de votre template */
+        .page {{ page-break-after: auto !important; }}
+
+        /* Limite la casse des blocs importants */
+        h1, h2, h3, table, .avoid-break, .signatures, .pay-row {{
+            page-break-inside: avoid;
+        }}
+
+        /* Eviter qu'un petit bloc passe tout seul sur la page suivante */
+        .keep-with-next {{ page-break-after: avoid; }}
+    """)
+
+
+def _bas_du_contenu_mm(page) -> float:
+    """Bas de la boîte la plus basse de la page, en mm depuis le haut (marge haute comprise)."""
+    bas = 0
+    for enfant in page._page_box.children:
+        if isinstance(enfant, MarginBox):  # en-têtes/pieds @page
+            continue
+        for box in enfant.descendants():
+            bas = max(bas, box.position_y + box.margin_height())
+    return bas / PX_PAR_MM
+
+
+def pdf_une_page(html_str, base_url, mode=MODE_MESURE, heights_mm=HAUTEURS_PALIERS_MM,
+                 margin_mm=10, stats=None) -> bytes:
+    """
+    Rend le HTML sur une seule page, ramenée à la hauteur A4 par zoom.
+    - MODE_MESURE : mise en page unique sur la plus grande hauteur, mesure du contenu,
+      puis rendu final à la hauteur exacte (2 mises en page quelle que soit la longueur).
+    - MODE_PALIERS : hauteurs croissantes jusqu'à tenir sur 1 page (jusqu'à 11 mises en page).
+    Si rien ne tient, repli en A4 multipage. `stats` (dict) reçoit le nombre de mises en
+    page et la hauteur retenue.
+    """
+    stats = stats if stats is not None else {}
+    stats.update(mises_en_page=0, hauteur_mm=None)
+    html_str, feuilles = feuilles_de_style(html_str, base_url)
+    images = cache_rendu()  # partagé par les mises en page de ce seul rendu
+
+    def mise_en_page(h):
+        stats["mises_en_page"] += 1
+        return _document_html(html_str, base_url).render(
+            stylesheets=[*feuilles, _override_css(h, margin_mm)], cache=images)
+
+    def ecrire(doc, h):
+        stats["hauteur_mm"] = h
+        return doc.write_pdf(zoom=A4_H / h)  # ramène la hauteur totale à 297mm
+
+    if mode == MODE_MESURE:
+        h_max = max(heights_mm)
+        doc = mise_en_page(h_max)
+        if len(doc.pages) == 1:
+            # + marge basse, + 1mm pour absorber les arrondis de la seconde mise en page
+            h = min(h_max, max(A4_H, _bas_du_contenu_mm(doc.pages[0]) + margin_mm + 1))
+            if h < h_max:
+                ajuste = mise_en_page(h)
+                if len(ajuste.pages) == 1:
+                    return ecrire(ajuste, h)
+            return ecrire(doc, h_max)
+    else:
+        # On tente jusqu'à obtenir exactement 1 page
+        for h in heights_mm:
+            doc = mise_en_page(h)
+            if len(doc.pages) == 1:
+                return ecrire(doc, h)
+
+    # Fallback multipage A4 si jamais ça ne tient pas (cas extrême)
+    stats["mises_en_page"] += 1
+    normal_css = css_depuis_texte(f"@page {{ size: A4; margin: {margin_mm}mm; }}")
+    return _document_html(html_str, base_url).write_pdf(stylesheets=[*feuilles, normal_css], cache=images)
+
+
 def render_single_page_pdf(
     template_name,
     context,
     request,
     filename="document.pdf",
-    heights_mm=(420, 600, 840, 1000, 1300, 1600, 2000, 2400, 3000, 3600, 4200),
+    heights_mm=HAUTEURS_PALIERS_MM,
     margin_mm=10,
+    mode=MODE_MESURE,
 ):
     """
     Force le rendu sur 1 seule page en:
-      1) testant des hauteurs de page croissantes,
+      1) mesurant la hauteur du contenu (ou en testant des hauteurs croissantes, mode paliers),
       2) neutralisant les sauts .page { page-break-after },
       3) redimensionnant avec zoom pour retomber en A4.
     """
     html_str = render_to_string(template_name, context, request=request)
     base_url = request.build_absolute_uri("/")
 
-    A4_W, A4_H = 210.0, 297.0
-
-    # CSS d'override pour le mode "single page"
-    def override_css(height_mm: float) -> CSS:
-        return CSS(string=f"""
-            @page {{
-                size: {A4_W}mm {height_mm}mm;   /* page très haute */
-                margin: {margin_mm}mm;
-            }}
-            /* Neutralise le saut forcé de votre template */
-            .page {{ page-break-after: auto !important; }}
-
-            /* Limite la casse des blocs importants */
-            h1, h2, h3, table, .avoid-break, .signatures, .pay-row {{
-                page-break-inside: avoid;
-            }}
-
-            /* Eviter qu'un petit bloc passe tout seul sur la page suivante */
-            .keep-with-next {{ page-break-after: avoid; }}
-        """)
-
-    # On tente jusqu'à obtenir exactement 1 page
-    for h in heights_mm:
-        doc = HTML(string=html_str, base_url=base_url).render(stylesheets=[override_css(h)])
-        if len(doc.pages) == 1:
-            zoom = A4_H / h  # ramène la hauteur totale à 297mm
-            pdf_bytes = doc.write_pdf(zoom=zoom)
-            resp = HttpResponse(pdf_bytes, content_type="application/pdf")
-            resp["Content-Disposition"] = f'inline; filename="{filename}"'
-            return resp
-
-    # Fallback multipage A4 si jamais ça ne tient pas (cas extrême)
-    normal_css = CSS(string=f"@page {{ size: A4; margin: {margin_mm}mm; }}")
-    pdf_bytes = HTML(string=html_str, base_url=base_url).write_pdf(stylesheets=[normal_css])
+    with mesurer("pdf"):
+        pdf_bytes = pdf_une_page(html_str, base_url, mode, heights_mm, margin_mm)
     resp = HttpResponse(pdf_bytes, content_type="application/pdf")
     resp["Content-Disposition"] = f'inline; filename="{filename}"'
-    return resp
\ No newline at end of file
+    return resp
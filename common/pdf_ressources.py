@@ -0,0 +1,199 @@
+# common/pdf_ressources.py
+"""
+Ressources des rendus WeasyPrint sans aller-retour HTTP.
+
+Les templates PDF référencent /static/… et /media/… en URL absolue (base_url du
+site). Par défaut WeasyPrint les télécharge depuis notre propre serveur pendant le
+rendu : un second worker occupé et de la latence réseau à chaque PDF.
+Ici :
+  - url_fetcher_local(base_url) lit ces fichiers directement sur le disque
+    (les autres URL passent par le fetcher standard) ;
+  - le contenu des fichiers et les feuilles de style analysées (<style> du template,
+    <link> vers /static/, CSS construites en Python) sont gardés dans des LRU du
+    processus (voir feuilles_de_style) ;
+  - les images décodées ne sont partagées qu'à l'intérieur d'un rendu (cache_rendu).
+"""
+import html
+import mimetypes
+import os
+import re
+from functools import lru_cache
+from urllib.parse import unquote, urljoin, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from weasyprint import CSS
+
+try:  # WeasyPrint récent : fetchers sous forme de classe
+    from weasyprint.urls import URLFetcher, URLFetcherResponse
+except ImportError:  # anciennes versions : fonction renvoyant un dict
+    from weasyprint import default_url_fetcher
+    URLFetcher = URLFetcherResponse = None
+
+TAILLE_CACHE_FICHIERS = 64
+TAILLE_CACHE_CSS = 32
+
+
+def cache_rendu():
+    """
+    Cache d'images à passer à WeasyPrint (`cache=`), neuf pour chaque rendu.
+    WeasyPrint y range l'image décodée sous son URL et ses octets sous d'autres
+    clés ({id}-source-…) : une éviction partielle ferait échouer un rendu suivant,
+    et un échec de chargement y reste mémorisé (None). Le partage entre rendus se
+    fait au niveau des octets lus (lire_fichier).
+    """
+    return {}
+
+
+@lru_cache(maxsize=256)
+def _trouver_statique(relatif):
+    # STATICFILES_DIRS et static/ des applications, puis STATIC_ROOT (collectstatic)
+    try:
+        trouve = finders.find(relatif)
+    except SuspiciousFileOperation:
+        return None
+    if trouve:
+        return trouve
+    return _fichier_sous(settings.STATIC_ROOT, relatif)
+
+
+def _fichier_sous(racine, relatif):
+    if not racine:
+        return None
+    try:
+        chemin = safe_join(racine, relatif)
+    except SuspiciousFileOperation:
+        return None
+    return chemin if os.path.isfile(chemin) else None
+
+
+def chemin_local(chemin_url):
+    """Fichier disque correspondant à un chemin /static/… ou /media/… (None sinon)."""
+    if settings.STATIC_URL and chemin_url.startswith(settings.STATIC_URL):
+        return _trouver_statique(chemin_url[len(settings.STATIC_URL):])
+    if settings.MEDIA_URL and chemin_url.startswith(settings.MEDIA_URL):
+        return _fichier_sous(settings.MEDIA_ROOT, chemin_url[len(settings.MEDIA_URL):])
+    return None
+
+
+@lru_cache(maxsize=TAILLE_CACHE_FICHIERS)
+def _lire(chemin, mtime_ns):
+    with open(chemin, "rb") as f:
+        return f.read()
+
+
+def lire_fichier(chemin):
+    """Contenu du fichier, relu seulement s'il a été modifié."""
+    return _lire(chemin, os.stat(chemin).st_mtime_ns)
+
+
+def _chemin_pour_url(url, hote):
+    parties = urlsplit(url)
+    if parties.scheme in ("http", "https") and parties.netloc == hote:
+        return chemin_local(unquote(parties.path))
+    return None
+
+
+if URLFetcher is not None:
+    class FetcherLocal(URLFetcher):
+        def __init__(self, base_url, **kwargs):
+            super().__init__(**kwargs)
+            self.hote = urlsplit(base_url).netloc
+
+        def fetch(self, url, headers=None):
+            chemin = _chemin_pour_url(url, self.hote)
+            if chemin is None:
+                return super().fetch(url, headers)
+            type_mime = mimetypes.guess_type(chemin)[0] or "application/octet-stream"
+            return URLFetcherResponse(url, lire_fichier(chemin), {"Content-Type": type_mime})
+
+
+def url_fetcher_local(base_url):
+    """url_fetcher WeasyPrint : /static/ et /media/ du site lus sur disque."""
+    if URLFetcher is not None:
+        return FetcherLocal(base_url)
+
+    hote = urlsplit(base_url).netloc
+
+    def fetcher(url):
+        chemin = _chemin_pour_url(url, hote)
+        if chemin is None:
+            return default_url_fetcher(url)
+        return {
+            "string": lire_fichier(chemin),
+            "mime_type": mimetypes.guess_type(chemin)[0],
+            "redirected_url": url,
+        }
+    return fetcher
+
+
+@lru_cache(maxsize=TAILLE_CACHE_CSS)
+def css_depuis_texte(texte, base_url=None):
+    """Feuille de style construite une fois par contenu (réutilisable entre rendus)."""
+    if base_url is None:
+        return CSS(string=texte)
+    return CSS(string=texte, base_url=base_url, url_fetcher=url_fetcher_local(base_url))
+
+
+@lru_cache(maxsize=TAILLE_CACHE_CSS)
+def _css_fichier(chemin, mtime_ns, url):
+    texte = _lire(chemin, mtime_ns).decode("utf-8-sig")
+    return CSS(string=texte, base_url=url, url_fetcher=url_fetcher_local(url))
+
+
+_RE_COMMENTAIRE = re.compile(r"<!--.*?-->", re.S)
+_RE_FEUILLE = re.compile(
+    r"<style\b(?P<style>[^>]*)>(?P<texte>.*?)</style\s*>|<link\b(?P<lien>[^>]*)>", re.S | re.I
+)
+_RE_ATTRIBUT = re.compile(r"""([\w-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
+MEDIAS_PDF = ("", "all", "print")
+
+
+def _attributs(texte):
+    return {
+        m.group(1).lower(): html.unescape(next(v for v in m.groups()[1:] if v is not None))
+        for m in _RE_ATTRIBUT.finditer(texte)
+    }
+
+
+def feuilles_de_style(html_str, base_url):
+    """
+    Retire du HTML ses <style> et ses <link rel="stylesheet"> vers /static/ ou /media/
+    et retourne (html, [CSS, …]) dans l'ordre du document : à passer en tête de
+    `stylesheets=`, la cascade est inchangée. Chaque feuille n'est analysée qu'une
+    fois par contenu (<style>) ou par fichier et date de modification (<link>).
+
+    Si une feuille ne peut pas être reprise ainsi (lien distant, media autre que
+    all / print, balise en commentaire), le HTML est rendu tel quel.
+    """
+    if any(re.search(r"<(style|link)\b", c, re.I) for c in _RE_COMMENTAIRE.findall(html_str)):
+        return html_str, []
+    hote = urlsplit(base_url).netloc
+    reprises = []
+    for m in _RE_FEUILLE.finditer(html_str):
+        lien = m.group("lien") is not None
+        attributs = _attributs(m.group("lien") if lien else m.group("style"))
+        if lien and "stylesheet" not in attributs.get("rel", "").lower().split():
+            continue
+        if attributs.get("media", "").strip().lower() not in MEDIAS_PDF:
+            return html_str, []
+        if lien:
+            url = urljoin(base_url, attributs.get("href", ""))
+            chemin = _chemin_pour_url(url, hote)
+            if chemin is None:
+                return html_str, []
+            css = _css_fichier(chemin, os.stat(chemin).st_mtime_ns, url)
+        else:
+            if attributs.get("type", "text/css").strip().lower() != "text/css":
+                return html_str, []
+            css = css_depuis_texte(m.group("texte"), base_url)
+        reprises.append((m.span(), css))
+
+    morceaux, position = [], 0
+    for (debut, fin), _ in reprises:
+        morceaux.append(html_str[position:debut])
+        position = fin
+    morceaux.append(html_str[position:])
+    return "".join(morceaux), [css for _, css in reprises]
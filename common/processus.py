@@ -0,0 +1,14 @@
+# common/processus.py
+"""
+Initialisation des processus de travail (ProcessPoolExecutor en mode "spawn").
+
+Ce module ne doit importer ni modèles ni vues : il est importé par le processus
+enfant avant que Django ne soit prêt, puis `initialiser_django` charge les
+applications. Les tâches (fonctions de modules applicatifs) peuvent ensuite être
+désérialisées normalement.
+"""
+
+
+def initialiser_django():
+    import django
+    django.setup()
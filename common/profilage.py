@@ -0,0 +1,82 @@
+# common/profilage.py
+"""
+Mesures par requête HTTP : SQL, rendu des templates, rendu PDF.
+
+Les mesures ne sont collectées que dans une `session()` ouverte par
+common.middleware.ProfilageMiddleware ; hors session, `mesurer()` se limite à
+une lecture de variable locale au thread.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from django.template.base import Template
+
+_local = threading.local()
+
+
+class Mesures:
+    def __init__(self):
+        self.durees = defaultdict(float)   # secondes, par nom de mesure
+        self.nombres = Counter()
+        self._en_cours = Counter()
+
+    def ajouter(self, nom, duree):
+        self.durees[nom] += duree
+        self.nombres[nom] += 1
+
+
+@contextmanager
+def mesurer(nom):
+    """Ajoute la durée du bloc à la mesure `nom` ; les blocs imbriqués du même nom ne comptent qu'une fois."""
+    mesures = getattr(_local, "mesures", None)
+    if mesures is None or mesures._en_cours[nom]:
+        yield
+        return
+    mesures._en_cours[nom] += 1
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        mesures._en_cours[nom] -= 1
+        mesures.ajouter(nom, time.perf_counter() - debut)
+
+
+def _chronometrer_sql(mesures):
+    def wrapper(execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            mesures.ajouter("sql", time.perf_counter() - debut)
+    return wrapper
+
+
+@contextmanager
+def session():
+    """Active les mesures pour le thread courant (toutes connexions SQL comprises)."""
+    mesures = _local.mesures = Mesures()
+    try:
+        with ExitStack() as pile:
+            wrapper = _chronometrer_sql(mesures)
+            for alias in connections:
+                pile.enter_context(connections[alias].execute_wrapper(wrapper))
+            yield mesures
+    finally:
+        _local.mesures = None
+
+
+def instrumenter_templates():
+    """Chronomètre Template.render (une seule fois par processus)."""
+    if getattr(Template.render, "profilage", False):
+        return
+    render_original = Template.render
+
+    def render(self, context):
+        with mesurer("tpl"):
+            return render_original(self, context)
+
+    render.profilage = True
+    Template.render = render
@@ -0,0 +1,81 @@
+# common/recherche.py
+"""
+Recherche textuelle indexée : normalisation des textes et des saisies.
+
+Les textes sont repliés (minuscules, sans accents) puis découpés en mots
+[a-z0-9]+ ; la recherche se fait par préfixe de mot sur une colonne indexée
+(voir clients.models.MotCleEntreprise), jamais par LIKE '%…%'.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+_RE_MOT = re.compile(r"[a-z0-9]+")
+LONGUEUR_MOT = 64
+TERMES_MAX = 8
+
+
+def _replier_caractere(c):
+    decompose = unicodedata.normalize("NFKD", c)
+    base = "".join(x for x in decompose if not unicodedata.combining(x))
+    return (base[:1] or c).lower()
+
+
+def replier(texte):
+    """Minuscules sans accents, caractère pour caractère (les positions sont conservées)."""
+    return "".join(_replier_caractere(c) for c in texte or "")
+
+
+def mots(texte):
+    return [mot[:LONGUEUR_MOT] for mot in _RE_MOT.findall(replier(texte))]
+
+
+def termes(saisie):
+    """Termes distincts d'une saisie utilisateur, dans l'ordre, limités à TERMES_MAX."""
+    resultat = []
+    for mot in mots(saisie):
+        if mot not in resultat:
+            resultat.append(mot)
+    return resultat[:TERMES_MAX]
+
+
+def filtre_prefixe(champ, prefixe):
+    """
+    Q « champ commence par prefixe » évalué comme une plage d'index.
+    SQLite n'utilise pas d'index pour LIKE (insensible à la casse par défaut) :
+    on y borne explicitement [prefixe, successeur) ; MySQL le fait seul pour LIKE 'x%'.
+    """
+    if connection.vendor == "sqlite":
+        return Q(**{
+            f"{champ}__gte": prefixe,
+            f"{champ}__lt": prefixe[:-1] + chr(ord(prefixe[-1]) + 1),
+        })
+    return Q(**{f"{champ}__startswith": prefixe})
+
+
+def surligner(texte, termes_recherche):
+    """HTML de `texte` avec les débuts de mots correspondant aux termes entourés de <mark>."""
+    texte = "" if texte is None else str(texte)
+    if not texte or not termes_recherche:
+        return escape(texte)
+    replie = replier(texte)
+    zones = []
+    for terme in termes_recherche:
+        for m in re.finditer(rf"(?<![a-z0-9]){re.escape(terme)}", replie):
+            zones.append((m.start(), m.end()))
+    if not zones:
+        return escape(texte)
+    morceaux, position = [], 0
+    for debut, fin in sorted(zones):
+        debut = max(debut, position)
+        if debut >= fin:
+            continue
+        morceaux.append(escape(texte[position:debut]))
+        morceaux.append(f"<mark>{escape(texte[debut:fin])}</mark>")
+        position = fin
+    morceaux.append(escape(texte[position:]))
+    return mark_safe("".join(morceaux))
@@ -0,0 +1,126 @@
+# common/requetes.py
+"""
+Enregistrement des requêtes SQL et détection des N+1.
+
+EnregistreurRequetes capture toutes les requêtes exécutées pendant un bloc `with`
+(toutes connexions), les regroupe par forme normalisée (paramètres, listes IN et
+nombres remplacés) et retient pour chacune son origine : ligne de template en
+cours de rendu et première ligne de code du projet.
+
+Utilisé par common.middleware.DetecteurNPlus1Middleware et par
+common.testing.BudgetRequetesMixin.
+"""
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Node
+
+_RE_CHAINE = re.compile(r"'(?:[^']|'')*'")
+_RE_IN = re.compile(r"\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+_RE_NOMBRE = re.compile(r"\b\d+\b")
+_RE_ESPACES = re.compile(r"\s+")
+
+_CODE_RENDU_NOEUD = Node.render_annotated.__code__
+_RACINE_PROJET = str(Path(settings.BASE_DIR).resolve())
+
+
+def normaliser_sql(sql):
+    """Forme de la requête : mêmes N+1 => même forme, quels que soient les paramètres."""
+    sql = _RE_CHAINE.sub("?", sql)
+    sql = _RE_IN.sub("IN (...)", sql)
+    sql = _RE_NOMBRE.sub("?", sql)
+    return _RE_ESPACES.sub(" ", sql).strip()
+
+
+def _origine():
+    """(ligne de template, ligne de code projet) à l'origine de la requête courante."""
+    template = code = None
+    frame = sys._getframe(2)
+    while frame is not None and (template is None or code is None):
+        if template is None and frame.f_code is _CODE_RENDU_NOEUD:
+            noeud = frame.f_locals.get("self")
+            origine = getattr(noeud, "origin", None)
+            token = getattr(noeud, "token", None)
+            if origine is not None and token is not None:
+                template = f"{origine.template_name or origine.name}:{token.lineno}"
+        if code is None:
+            fichier = frame.f_code.co_filename
+            if fichier.startswith(_RACINE_PROJET) and fichier != __file__ and "site-packages" not in fichier:
+                code = f"{Path(fichier).relative_to(_RACINE_PROJET)}:{frame.f_lineno}"
+        frame = frame.f_back
+    return template, code
+
+
+class EnregistreurRequetes:
+    """Contexte qui enregistre (sql, forme, durée, origine) de chaque requête exécutée."""
+
+    def __init__(self, alias=None):
+        self.alias = alias
+        self.requetes = []
+        self._pile = None
+
+    def __enter__(self):
+        self._pile = ExitStack()
+        aliases = [self.alias] if self.alias else list(connections)
+        for alias in aliases:
+            self._pile.enter_context(connections[alias].execute_wrapper(self._enregistrer))
+        return self
+
+    def __exit__(self, *exc):
+        self._pile.close()
+        return False
+
+    def _enregistrer(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            template, code = _origine()
+            self.requetes.append({
+                "sql": sql,
+                "forme": normaliser_sql(sql),
+                "duree": time.perf_counter() - debut,
+                "template": template,
+                "code": code,
+            })
+
+    def __len__(self):
+        return len(self.requetes)
+
+    @property
+    def duree_totale(self):
+        return sum(r["duree"] for r in self.requetes)
+
+    def repetitions(self, seuil):
+        """
+        Formes exécutées au moins `seuil` fois, de la plus fréquente à la moins fréquente :
+        liste de dict (forme, nombre, duree, origines [(template, code), nombre]).
+        """
+        par_forme = defaultdict(list)
+        for requete in self.requetes:
+            par_forme[requete["forme"]].append(requete)
+        resultat = []
+        for forme, requetes in par_forme.items():
+            if len(requetes) >= seuil:
+                origines = Counter((r["template"], r["code"]) for r in requetes)
+                resultat.append({
+                    "forme": forme,
+                    "nombre": len(requetes),
+                    "duree": sum(r["duree"] for r in requetes),
+                    "origines": origines.most_common(3),
+                })
+        return sorted(resultat, key=lambda r: -r["nombre"])
+
+    def rapport(self, seuil=2):
+        lignes = [f"{len(self)} requête(s), {self.duree_totale * 1000:.1f} ms"]
+        for rep in self.repetitions(seuil):
+            lignes.append(f"  x{rep['nombre']} {rep['forme'][:200]}")
+            for (template, code), nombre in rep["origines"]:
+                lignes.append(f"      {nombre}x template={template or '-'} code={code or '-'}")
+        return "\n".join(lignes)
@@ -1,5 +1,7 @@
 from django import template
 
+from common import recherche
+
 register = template.Library()
 
 @register.filter
@@ -11,3 +13,9 @@ def couleur_page(nom_page):
         "Cozy Home": "rgb(255, 229, 180)",        # Orange pêche
     }
     return couleurs_pages.get(nom_page, "white")
+
+
+@register.filter
+def surligner(texte, termes):
+    """Met en évidence (<mark>) les mots commençant par l'un des termes recherchés."""
+    return recherche.surligner(texte, termes)
@@ -0,0 +1,24 @@
+# common/testing.py
+"""Outils de test partagés."""
+from common.requetes import EnregistreurRequetes
+
+
+class BudgetRequetesMixin:
+    """
+    Pour TestCase : vérifie le nombre de requêtes SQL d'une vue.
+
+        response = self.assertBudgetRequetes(reverse("vente"), 8)
+
+    En cas de dépassement, le message liste les formes répétées et la ligne de
+    template / de code à leur origine (voir common.requetes).
+    """
+
+    def assertBudgetRequetes(self, url, budget, methode="get", **kwargs):
+        with EnregistreurRequetes() as enregistreur:
+            response = getattr(self.client, methode)(url, **kwargs)
+        if len(enregistreur) > budget:
+            self.fail(
+                f"{methode.upper()} {url} : {len(enregistreur)} requêtes SQL pour un budget de {budget}\n"
+                + enregistreur.rapport()
+            )
+        return response
@@ -1,3 +1,564 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.http import HttpResponse, QueryDict
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import path
+from django.views.generic import ListView
+
+from clients.models import Entreprise
+from common.filtres import FiltreChoix, FiltreDate, FiltreEntier, FiltreExiste, FiltrePeriode, SpecFiltres, bornes_periode
+from common.listes import ListePipelineMixin
+from common.models import ArreteCaisse, Caisse, CompteurDocument, MouvementCaisse, Pages
+from common.pagination import CursorPaginator
+from common.requetes import EnregistreurRequetes, normaliser_sql
+from common.testing import BudgetRequetesMixin
+from services.models import Service
+from vente.models import Commande, LigneCommande, Vente, montant_lignes_subquery
+
+try:
+    from pypdf import PdfReader
+    from weasyprint import HTML
+
+    from common import pdf
+except (ImportError, OSError):  # WeasyPrint absent ou bibliothèques Pango manquantes
+    pdf = None
+
+try:
+    from common import pdf_ressources
+except (ImportError, OSError):
+    pdf_ressources = None
+
+
+def vue_clients_n_plus_1(request):
+    commandes = Commande.objects.order_by("id")
+    html = Template("{% for c in commandes %}\n{{ c.client.raison_sociale }}\n{% endfor %}")
+    return HttpResponse(html.render(Context({"commandes": commandes})))
+
+
+urlpatterns = [path("n-plus-1/", vue_clients_n_plus_1)]
+
+
+class CompteurDocumentTests(TestCase):
+    def test_allocation_sequentielle_par_prefixe_et_jour(self):
+        jour = date(2025, 9, 2)
+        self.assertEqual(CompteurDocument.generer_numeros("F", jour=jour), ["F250902-001"])
+        self.assertEqual(CompteurDocument.generer_numeros("F", jour=jour), ["F250902-002"])
+        self.assertEqual(CompteurDocument.generer_numeros("P", jour=jour), ["P250902-001"])
+        self.assertEqual(CompteurDocument.generer_numeros("F", jour=date(2025, 9, 3)), ["F250903-001"])
+
+    def test_reservation_de_bloc(self):
+        jour = date(2025, 9, 2)
+        CompteurDocument.allouer("F", jour=jour)
+        self.assertEqual(list(CompteurDocument.allouer("F", 3, jour)), [2, 3, 4])
+        self.assertEqual(list(CompteurDocument.allouer("F", jour=jour)), [5])
+
+    def test_format_au_dela_de_999(self):
+        jour = date(2025, 9, 2)
+        CompteurDocument.objects.create(prefixe="F", jour=jour, dernier_numero=999)
+        self.assertEqual(CompteurDocument.generer_numeros("F", jour=jour), ["F250902-1000"])
+
+
+class CompteurDocumentConcurrenceTests(TransactionTestCase):
+    NB_THREADS = 8
+    ALLOCATIONS_PAR_THREAD = 25
+
+    def test_allocations_concurrentes_sans_doublon(self):
+        jour = date(2025, 9, 2)
+        resultats, erreurs = [], []
+        verrou = threading.Lock()
+        depart = threading.Barrier(self.NB_THREADS)
+
+        def travailleur(index):
+            try:
+                depart.wait()
+                for i in range(self.ALLOCATIONS_PAR_THREAD):
+                    # Un thread sur deux réserve des blocs de 2
+                    nombre = 2 if index % 2 else 1
+                    numeros = list(CompteurDocument.allouer("F", nombre, jour))
+                    with verrou:
+                        resultats.append(numeros)
+            except Exception as e:  # remonté au thread principal
+                erreurs.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=travailleur, args=(i,)) for i in range(self.NB_THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(erreurs, [])
+        tous = [n for bloc in resultats for n in bloc]
+        self.assertEqual(len(tous), len(set(tous)))
+        self.assertEqual(sorted(tous), list(range(1, len(tous) + 1)))
+        for bloc in resultats:
+            self.assertEqual(bloc, list(range(bloc[0], bloc[0] + len(bloc))))
+        self.assertEqual(
+            CompteurDocument.objects.get(prefixe="F", jour=jour).dernier_numero, len(tous)
+        )
+
+
+class NPlus1Mixin:
+    @classmethod
+    def setUpTestData(cls):
+        page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        for i in range(6):
+            client = Entreprise.objects.create(raison_sociale=f"Client {i}")
+            Commande.objects.create(client=client, page=page)
+
+
+class DetectionNPlus1Tests(NPlus1Mixin, TestCase):
+    def test_normalisation(self):
+        self.assertEqual(
+            normaliser_sql('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) AND "nom" = \'x\' LIMIT 21'),
+            'SELECT * FROM "t" WHERE "id" IN (...) AND "nom" = ? LIMIT ?',
+        )
+        self.assertEqual(
+            normaliser_sql('SELECT 1 FROM "t" WHERE "id" IN (%s)'),
+            normaliser_sql('SELECT 2 FROM  "t" WHERE "id" IN (%s, %s)'),
+        )
+
+    def test_repetition_et_ligne_de_template(self):
+        with EnregistreurRequetes() as enregistreur:
+            vue_clients_n_plus_1(None)
+        self.assertEqual(len(enregistreur), 7)
+        repetition, = enregistreur.repetitions(seuil=5)
+        self.assertEqual(repetition["nombre"], 6)
+        self.assertIn('FROM "clients_entreprise"', repetition["forme"])
+        (template, code), nombre = repetition["origines"][0]
+        self.assertEqual(nombre, 6)
+        self.assertTrue(template.endswith(":2"))
+        self.assertTrue(code.startswith("common/tests.py:"))
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class BudgetRequetesTests(NPlus1Mixin, BudgetRequetesMixin, TestCase):
+    def test_budget_respecte(self):
+        self.assertBudgetRequetes("/n-plus-1/", 7)
+
+    def test_budget_depasse(self):
+        with self.assertRaisesMessage(AssertionError, "7 requêtes SQL pour un budget de 3"):
+            self.assertBudgetRequetes("/n-plus-1/", 3)
+
+    @override_settings(DETECTEUR_N_PLUS_1=True, MIDDLEWARE=["common.middleware.DetecteurNPlus1Middleware"])
+    def test_middleware(self):
+        with self.assertLogs("common.n_plus_1", "WARNING") as logs:
+            response = self.client.get("/n-plus-1/")
+        self.assertEqual(response["X-Requetes-SQL"], "7")
+        self.assertEqual(response["X-N-Plus-1"], "1")
+        self.assertIn("x6", logs.output[0])
+
+
+PROFILAGE_MIDDLEWARE = [
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "common.middleware.ProfilageMiddleware",
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, MIDDLEWARE=PROFILAGE_MIDDLEWARE)
+class ProfilageTests(NPlus1Mixin, TestCase):
+    def test_inactif_sans_en_tete(self):
+        response = self.client.get("/n-plus-1/")
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(PROFILAGE_ACTIF=True, PROFILAGE_LOG=True)
+    def test_server_timing_et_log(self):
+        with self.assertLogs("common.profilage", "INFO") as logs:
+            response = self.client.get("/n-plus-1/")
+        self.assertRegex(response["Server-Timing"], r'^total;dur=[\d.]+, sql;dur=[\d.]+;desc="\d+ req", tpl;dur=')
+        self.assertIn('"sql_nombre": 7', logs.output[0])
+
+    def test_x_profile_reserve_au_staff(self):
+        utilisateur = get_user_model().objects.create_user("admin", password="x", is_staff=True)
+        self.client.force_login(utilisateur)
+        response = self.client.get("/n-plus-1/", HTTP_X_PROFILE="1")
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertIn("function calls", response.content.decode())
+
+        utilisateur.is_staff = False
+        utilisateur.save()
+        response = self.client.get("/n-plus-1/", HTTP_X_PROFILE="1")
+        self.assertIn(b"Client 0", response.content)
+        self.assertNotIn("Server-Timing", response)
+
+        self.client.logout()
+        self.assertNotIn("Server-Timing", self.client.get("/n-plus-1/", HTTP_X_PROFILE="1"))
+
+
+class GenererDonneesTests(TestCase):
+    def test_volumes_numeros_et_montants(self):
+        call_command(
+            "generer_donnees", entreprises=5, services=8, pages=2, caisses=2, commandes=40,
+            lignes="2-3", statuts="Payée=1,En attente=1", graine=3, lot=15, stdout=io.StringIO(),
+        )
+        self.assertEqual(Entreprise.objects.count(), 5)
+        self.assertEqual(Commande.objects.count(), 40)
+        self.assertFalse(
+            Commande.objects.annotate(calcule=montant_lignes_subquery())
+            .exclude(montant_total=F("calcule")).exists()
+        )
+        payees = Commande.objects.filter(statut_vente="Payée")
+        self.assertEqual(Vente.objects.count(), payees.count())
+        self.assertFalse(Vente.objects.exclude(montant=F("commande__montant_total")).exists())
+        numeros = list(Commande.objects.values_list("numero_proforma", flat=True))
+        self.assertEqual(len(set(numeros)), 40)
+        self.assertEqual(MouvementCaisse.objects.count(), Vente.objects.count())
+
+
+class JournalCaisseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.caisse = Caisse.objects.create(nom="MVola", responsable="Caissier", solde_initial=1000)
+        cls.autre = Caisse.objects.create(nom="Espèces", responsable="Caissier")
+        page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        client = Entreprise.objects.create(raison_sociale="Client")
+        cls.commandes = [Commande.objects.create(client=client, page=page) for _ in range(3)]
+        cls.jour = date(2026, 3, 10)
+
+    def encaisser(self, commande, montant, jour, caisse=None):
+        return Vente.objects.create(
+            commande=commande, paiement=caisse or self.caisse, montant=montant, date_encaissement=jour
+        )
+
+    def test_cumuls_par_f_et_ecritures_inverses(self):
+        vente = self.encaisser(self.commandes[0], 500, self.jour)
+        self.encaisser(self.commandes[1], 300, self.jour + timedelta(days=1))
+        self.caisse.refresh_from_db()
+        self.assertEqual((self.caisse.entree, self.caisse.sortie, self.caisse.solde), (800, 0, 1800))
+
+        # Changement de caisse : annulation sur l'ancienne, entrée sur la nouvelle
+        vente.paiement = self.autre
+        vente.save()
+        self.caisse.refresh_from_db()
+        self.autre.refresh_from_db()
+        self.assertEqual((self.caisse.sortie, self.caisse.solde, self.autre.solde), (500, 1300, 500))
+        self.assertEqual(MouvementCaisse.objects.count(), 4)
+
+        with self.assertRaises(ValueError):
+            MouvementCaisse.objects.filter(caisse=self.caisse).delete()
+
+        # Une instance chargée avant les encaissements n'écrase pas les cumuls
+        ancienne = Caisse.objects.get(pk=self.autre.pk)
+        self.encaisser(self.commandes[2], 200, self.jour, caisse=self.autre)
+        ancienne.nom = "Caisse espèces"
+        ancienne.save()
+        self.autre.refresh_from_db()
+        self.assertEqual(self.autre.solde, 700)
+
+    def test_arretes_et_solde_a_une_date(self):
+        self.encaisser(self.commandes[0], 500, self.jour)
+        self.encaisser(self.commandes[1], 300, self.jour + timedelta(days=2))
+        self.assertEqual(ArreteCaisse.arreter(self.jour + timedelta(days=5)), 2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.caisse.solde_au(self.jour), 1500)
+        self.assertEqual(self.caisse.solde_au(self.jour + timedelta(days=1)), 1500)
+        self.assertEqual(self.caisse.solde_au(self.jour - timedelta(days=1)), 1000)
+
+        # Écriture antérieure : arrêtés suivants supprimés, solde toujours juste
+        self.encaisser(self.commandes[2], 100, self.jour + timedelta(days=1))
+        self.assertEqual(list(ArreteCaisse.objects.values_list("date", flat=True)), [self.jour])
+        self.assertEqual(self.caisse.solde_au(self.jour + timedelta(days=3)), 1900)
+
+    def test_reconcilier_caisses(self):
+        self.encaisser(self.commandes[0], 500, self.jour)
+        Caisse.objects.filter(pk=self.caisse.pk).update(entree=0, solde=0)
+        ArreteCaisse.objects.create(caisse=self.caisse, date=self.jour, entree=1)
+
+        sortie = io.StringIO()
+        call_command("reconcilier_caisses", "--verifier", stdout=sortie)
+        self.assertIn("2 écart(s)", sortie.getvalue())
+
+        call_command("reconcilier_caisses", jusqu_au=str(self.jour), stdout=io.StringIO())
+        self.caisse.refresh_from_db()
+        self.assertEqual((self.caisse.entree, self.caisse.solde), (500, 1500))
+        self.assertEqual(ArreteCaisse.objects.get(caisse=self.caisse).entree, 500)
+
+
+class FiltresTests(TestCase):
+    class Filtres(SpecFiltres):
+        date_commande = FiltreDate()
+        client_id = FiltreEntier()
+        statut = FiltreChoix("statut_vente", choix=("En attente", "Payée"), defaut="En attente")
+        service_id = FiltreExiste(LigneCommande, "commande", "service_id")
+
+    def test_lecture_et_validation(self):
+        filtres = self.Filtres(QueryDict("date_commande=2026-13-01&client_id=abc&service_id=+7+&display=cards"))
+        self.assertEqual(filtres.valeurs, {"statut": "En attente", "service_id": 7})
+        self.assertEqual(set(filtres.erreurs), {"date_commande", "client_id"})
+        self.assertEqual(filtres.donnees["date_commande"], "")
+        self.assertEqual(filtres.querystring(display="cards", page=""), "statut=En+attente&service_id=7&display=cards")
+
+        filtres = self.Filtres(QueryDict("statut=Inconnu&date_commande=2026-01-05"))
+        self.assertEqual(filtres.valeurs, {"date_commande": date(2026, 1, 5)})
+
+    def test_filtre_multiple_par_exists(self):
+        page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        client = Entreprise.objects.create(raison_sociale="Client")
+        service = Service.objects.create(nom="Sponsorisation", reference="SPO-01", tarif=10000)
+        commande = Commande.objects.create(client=client, page=page)
+        for _ in range(3):
+            LigneCommande.objects.create(commande=commande, service=service, tarif=10000, quantite=1)
+        Commande.objects.create(client=client, page=page)
+
+        qs = self.Filtres(QueryDict(f"service_id={service.pk}")).filtrer(Commande.objects.all())
+        self.assertNotIn("JOIN", str(qs.query))
+        # Une ligne par commande malgré trois lignes du même service : le total reste juste
+        self.assertEqual(qs.aggregate(total=Sum("montant_total"))["total"], 30000)
+        self.assertEqual(list(qs), [commande])
+
+    def test_periodes(self):
+        jour = date(2026, 11, 18)  # mercredi
+        self.assertEqual(bornes_periode("jour", jour), (jour, jour))
+        self.assertEqual(bornes_periode("semaine", jour), (date(2026, 11, 16), date(2026, 11, 22)))
+        self.assertEqual(bornes_periode("mois", date(2026, 12, 5)), (date(2026, 12, 1), date(2026, 12, 31)))
+        self.assertEqual(bornes_periode("trimestre", jour), (date(2026, 10, 1), date(2026, 12, 31)))
+        self.assertEqual(bornes_periode("trimestre", date(2026, 2, 28)), (date(2026, 1, 1), date(2026, 3, 31)))
+
+        class Filtres(SpecFiltres):
+            periode = FiltrePeriode("date_commande")
+            du = FiltreDate("date_commande", lookup="gte")
+
+        filtres = Filtres(QueryDict("periode=perso&du=2026-01-05"))
+        self.assertEqual(filtres.valeurs, {"du": date(2026, 1, 5)})
+        self.assertEqual(filtres.querystring(), "periode=perso&du=2026-01-05")
+        self.assertIn("periode", Filtres(QueryDict("periode=siecle")).erreurs)
+
+
+class CursorPaginatorTests(TestCase):
+    ORDRE = ("-date_commande", "-id")
+
+    @classmethod
+    def setUpTestData(cls):
+        page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        client = Entreprise.objects.create(raison_sociale="Client")
+        # Dates en double : l'id départage les commandes d'un même jour
+        for jour in (1, 1, 1, 2, 2, 3, 4):
+            Commande.objects.create(client=client, page=page, date_commande=date(2026, 1, jour))
+        cls.attendu = list(Commande.objects.order_by(*cls.ORDRE))
+
+    def paginator(self):
+        return CursorPaginator(Commande.objects.all(), 3, self.ORDRE)
+
+    def test_jeton_aller_retour(self):
+        paginator = self.paginator()
+        commande = self.attendu[2]
+        jeton = paginator.encode_cursor(commande, "n")
+        self.assertEqual(paginator.decode_cursor(jeton), ("n", [commande.date_commande, commande.pk]))
+
+    def test_jeton_altere_donne_la_premiere_page(self):
+        paginator = self.paginator()
+        commande = self.attendu[2]
+        for jeton in (
+            "!!!",
+            paginator.encode_cursor(commande, "x"),
+            CursorPaginator(Commande.objects.all(), 3, ("-id",)).encode_cursor(commande, "n"),
+            "eyJkIjoibiIsInYiOlsiMjAyNi0xMy0wMSIsMV19",  # {"d":"n","v":["2026-13-01",1]}
+        ):
+            self.assertIsNone(paginator.decode_cursor(jeton), jeton)
+            page = paginator.page(jeton)
+            self.assertEqual(page.object_list, self.attendu[:3])
+            self.assertFalse(page.has_previous())
+
+    def test_suivant_puis_precedent(self):
+        paginator = self.paginator()
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([c for p in pages for c in p], self.attendu)
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(pages[-1].has_previous())
+        self.assertEqual(pages[-1].next_cursor, "")
+
+        precedente = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(precedente.object_list, pages[1].object_list)
+        self.assertTrue(precedente.has_next())
+        premiere = paginator.page(precedente.previous_cursor)
+        self.assertEqual(premiere.object_list, pages[0].object_list)
+        self.assertFalse(premiere.has_previous())
+        self.assertEqual(premiere.previous_cursor, "")
+
+
+@skipIf(pdf is None, "WeasyPrint indisponible")
+class PdfUnePageTests(TestCase):
+    # Assez long pour dépasser plusieurs paliers de hauteur
+    HTML_LONG = "<html><body>" + "".join(f"<p>Ligne de facture {n}</p>" for n in range(400)) + "</body></html>"
+
+    def test_boite_de_page_accessible(self):
+        # common.pdf mesure le contenu par l'attribut privé Page._page_box (WeasyPrint==70.0
+        # dans requirements.txt) : ce test signale sa disparition lors d'une mise à jour.
+        document = HTML(string="<p>Facture</p>").render(stylesheets=[pdf._override_css(pdf.A4_H, 10)])
+        self.assertTrue(hasattr(document.pages[0], "_page_box"), "Page._page_box absent : voir common.pdf")
+        self.assertGreater(pdf._bas_du_contenu_mm(document.pages[0]), 10)  # sous la marge haute
+        self.assertLess(pdf._bas_du_contenu_mm(document.pages[0]), pdf.A4_H)
+
+    def test_mesure_en_deux_mises_en_page(self):
+        stats = {}
+        resultat = pdf.pdf_une_page(self.HTML_LONG, "http://testserver/", pdf.MODE_MESURE, stats=stats)
+        self.assertEqual(len(PdfReader(io.BytesIO(resultat)).pages), 1)
+        self.assertEqual(stats["mises_en_page"], 2)
+        self.assertLess(stats["hauteur_mm"], max(pdf.HAUTEURS_PALIERS_MM))
+
+        paliers = {}
+        pdf.pdf_une_page(self.HTML_LONG, "http://testserver/", pdf.MODE_PALIERS, stats=paliers)
+        self.assertGreater(paliers["mises_en_page"], stats["mises_en_page"])
+        self.assertGreaterEqual(paliers["hauteur_mm"], stats["hauteur_mm"])
+
+
+class ListePipelineTests(TestCase):
+    class Liste(ListePipelineMixin, ListView):
+        model = Commande
+        paginate_by = 3
+        cursor_ordering = ("-date_commande", "-id")
+        aggregats = {"total_montant": Sum("montant_total")}
+
+        def get_queryset(self):
+            return Commande.objects.order_by("-date_commande", "-id")
+
+    @classmethod
+    def setUpTestData(cls):
+        page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        client = Entreprise.objects.create(raison_sociale="Client")
+        for montant in (1000, 2000, 3000, 4000, 5000):
+            commande = Commande.objects.create(client=client, page=page)
+            Commande.objects.filter(pk=commande.pk).update(montant_total=montant)
+
+    def contexte(self, **params):
+        reponse = self.Liste.as_view()(RequestFactory().get("/", params))
+        return reponse.context_data
+
+    def test_un_agregat_et_une_page(self):
+        # Pas de COUNT séparé : le nombre vient de la requête d'agrégat
+        with self.assertNumQueries(2):
+            contexte = self.contexte(page=2)
+            self.assertEqual(contexte["paginator"].count, 5)
+            self.assertEqual(contexte["paginator"].num_pages, 2)
+            self.assertEqual(len(contexte["object_list"]), 2)
+        self.assertEqual(contexte["nombre_resultats"], 5)
+        self.assertEqual(contexte["total_montant"], 15000)
+        self.assertEqual(contexte["totaux"], {"total_montant": 15000})
+
+    def test_curseur(self):
+        with self.assertNumQueries(2):
+            contexte = self.contexte(pagination="curseur")
+            self.assertEqual(contexte["paginator"].count, 5)
+            self.assertEqual(len(contexte["object_list"]), 3)
+        self.assertTrue(contexte["page_obj"].has_next())
+        self.assertEqual(contexte["total_montant"], 15000)
+
+
+@skipIf(pdf_ressources is None, "WeasyPrint indisponible")
+class FetcherLocalTests(TestCase):
+    BASE_URL = "http://testserver/"
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.media = Path(dossier.name)
+        (self.media / "logo.png").write_bytes(b"logo local")
+        reglage = override_settings(MEDIA_ROOT=self.media)
+        reglage.enable()
+        self.addCleanup(reglage.disable)
+
+    def recuperer(self, url):
+        fetcher = pdf_ressources.url_fetcher_local(self.BASE_URL)
+        if pdf_ressources.URLFetcher is not None:
+            return fetcher.fetch(url).read()
+        return fetcher(url)["string"]
+
+    def fetcher_standard(self):
+        """Remplace le fetcher standard de WeasyPrint (accès HTTP) par une réponse fixe."""
+        if pdf_ressources.URLFetcher is not None:
+            return mock.patch.object(
+                pdf_ressources.URLFetcher, "fetch",
+                side_effect=lambda url, headers=None: pdf_ressources.URLFetcherResponse(url, b"distant"),
+            )
+        return mock.patch("common.pdf_ressources.default_url_fetcher", return_value={"string": b"distant"})
+
+    def test_fichiers_locaux_lus_sur_disque(self):
+        with self.fetcher_standard() as standard:
+            self.assertEqual(self.recuperer(self.BASE_URL + "media/logo.png"), b"logo local")
+            statique = self.recuperer(self.BASE_URL + "static/images/zara.png")
+        self.assertEqual(statique, pdf_ressources.lire_fichier(pdf_ressources.chemin_local("/static/images/zara.png")))
+        standard.assert_not_called()
+
+    def test_repli_sur_le_fetcher_standard(self):
+        with self.fetcher_standard() as standard:
+            for url in (
+                "https://cdn.example.com/static/images/zara.png",  # autre hôte
+                self.BASE_URL + "media/absent.png",
+                self.BASE_URL + "autre/chemin.css",
+            ):
+                self.assertEqual(self.recuperer(url), b"distant", url)
+        self.assertEqual(standard.call_count, 3)
+
+    def test_sortie_des_dossiers_refusee(self):
+        for chemin in ("/static/../settings.py", "/static/../../etc/passwd", "/media/../manage.py"):
+            self.assertIsNone(pdf_ressources.chemin_local(chemin), chemin)
+        with self.fetcher_standard():
+            self.assertEqual(self.recuperer(self.BASE_URL + "static/../settings.py"), b"distant")
+
+
+@skipIf(pdf is None, "WeasyPrint indisponible")
+class FeuillesDeStyleTests(TestCase):
+    BASE_URL = "http://testserver/"
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.feuille = Path(dossier.name) / "facture.css"
+        self.feuille.write_text("p { color: blue }", encoding="utf-8")
+        reglage = override_settings(MEDIA_ROOT=dossier.name)
+        reglage.enable()
+        self.addCleanup(reglage.disable)
+
+    def test_feuilles_analysees_une_fois(self):
+        html = ('<html><head><link rel="stylesheet" href="/media/facture.css">'
+                "<style>p { color: red }</style></head><body><p>Facture</p></body></html>")
+        sans_feuilles, feuilles = pdf_ressources.feuilles_de_style(html, self.BASE_URL)
+        self.assertEqual(sans_feuilles, "<html><head></head><body><p>Facture</p></body></html>")
+        self.assertEqual(len(feuilles), 2)  # ordre du document : <link> puis <style>
+
+        _, encore = pdf_ressources.feuilles_de_style(html, self.BASE_URL)
+        self.assertIs(encore[0], feuilles[0])
+        self.assertIs(encore[1], feuilles[1])
+
+        # Fichier modifié : seule la feuille liée est analysée à nouveau
+        mtime = self.feuille.stat().st_mtime + 10
+        os.utime(self.feuille, (mtime, mtime))
+        _, apres = pdf_ressources.feuilles_de_style(html, self.BASE_URL)
+        self.assertIsNot(apres[0], feuilles[0])
+        self.assertIs(apres[1], feuilles[1])
+
+    def test_html_inchange_si_une_feuille_ne_peut_pas_etre_reprise(self):
+        for html in (
+            '<link rel="stylesheet" href="https://cdn.example.com/x.css"><style>p {}</style>',
+            '<link rel="stylesheet" href="/media/facture.css" media="screen">',
+            '<!-- <style>p {}</style> --><link rel="stylesheet" href="/media/facture.css">',
+        ):
+            self.assertEqual(pdf_ressources.feuilles_de_style(html, self.BASE_URL), (html, []), html)
+
+    def test_cache_images_neuf_a_chaque_rendu(self):
+        html = '<html><head><style>p { color: red }</style></head><body><p>Facture</p></body></html>'
+        with mock.patch("common.pdf.render_to_string", return_value=html), \
+                mock.patch.object(pdf.HTML, "write_pdf", return_value=b"%PDF") as ecrire:
+            pdf.render_pdf_bytes("facture.html", {}, self.BASE_URL)
+            pdf.render_pdf_bytes("facture.html", {}, self.BASE_URL)
+        premier, second = (appel.kwargs for appel in ecrire.call_args_list)
+        self.assertEqual(premier["cache"], {})
+        self.assertIsNot(premier["cache"], second["cache"])
+        self.assertIs(premier["stylesheets"][0], second["stylesheets"][0])
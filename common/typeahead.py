@@ -0,0 +1,71 @@
+# common/typeahead.py
+"""
+Points d'accès JSON d'autocomplétion (clients, services) utilisés par static/js/typeahead.js.
+
+GET ?q=<saisie>&limite=<n> : au plus `limite` résultats, mis en cache quelques secondes
+(clé : saisie repliée sans accents, donc partagée entre « Café » et « cafe ») ;
+GET ?id=<pk>[&id=<pk>…] : libellés des valeurs déjà sélectionnées (formulaires pré-remplis).
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views import View
+
+from common import recherche
+
+LIMITE_DEFAUT = 20
+LIMITE_MAX = 50
+
+
+def duree_cache():
+    return getattr(settings, "TYPEAHEAD_CACHE_SECONDES", 30)
+
+
+class TypeaheadView(LoginRequiredMixin, View):
+    model = None
+    nom_cache = None
+
+    def rechercher(self, saisie):
+        """Queryset ordonné des objets correspondant à la saisie (vide : tous)."""
+        raise NotImplementedError
+
+    def serialiser(self, objet):
+        """dict avec au moins id, libelle (affiché dans le champ) et detail (ligne secondaire)."""
+        raise NotImplementedError
+
+    def version_cache(self):
+        """Fragment de clé changé à chaque modification des données (vide : expiration seule)."""
+        return ""
+
+    def cle_cache(self, saisie, limite):
+        empreinte = hashlib.md5(recherche.replier(saisie).strip().encode()).hexdigest()
+        nom = self.nom_cache or self.model._meta.label_lower
+        return f"typeahead:{nom}:{self.version_cache()}:{limite}:{empreinte}"
+
+    def get(self, request, *args, **kwargs):
+        ids = [pk for pk in request.GET.getlist("id") if pk.isdigit()]
+        if ids:
+            resultats = [self.serialiser(objet) for objet in self.model.objects.filter(pk__in=ids)]
+            return JsonResponse({"resultats": resultats})
+
+        saisie = (request.GET.get("q") or "").strip()
+        try:
+            limite = int(request.GET.get("limite") or LIMITE_DEFAUT)
+        except ValueError:
+            limite = LIMITE_DEFAUT
+        limite = min(max(limite, 1), LIMITE_MAX)
+
+        duree = duree_cache()
+        cle = self.cle_cache(saisie, limite)
+        resultats = cache.get(cle)
+        if resultats is None:
+            resultats = [self.serialiser(objet) for objet in self.rechercher(saisie)[:limite]]
+            cache.set(cle, resultats, duree)
+
+        response = JsonResponse({"resultats": resultats})
+        patch_cache_control(response, private=True, max_age=duree)
+        return response
@@ -0,0 +1,97 @@
+# encaissement/lots.py
+"""
+Encaissement groupé : plusieurs commandes réglées en une transaction.
+
+Nombre de requêtes indépendant du nombre de commandes : un SELECT ... FOR UPDATE
+pour verrouiller et contrôler toutes les commandes, un bloc de numéros de facture,
+un INSERT groupé des ventes, un UPDATE des statuts, les soldes clients, puis le
+journal de caisse en dernier (verrou de la caisse tenu le moins longtemps).
+"""
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from common.models import JourneeCloturee, MouvementCaisse
+from vente.models import Commande, SoldeClient, Vente
+
+from .models import ClotureCaisse
+
+STATUTS_ENCAISSABLES = ("En attente",)
+LOT_MAX = 200
+
+
+class LotRefuse(Exception):
+    """Le lot entier est refusé (caisse clôturée, trop de commandes…)."""
+
+
+def encaisser_lot(commande_ids, paiement, date_encaissement, reference=None, utilisateur=None):
+    """
+    Encaisse les commandes données sur la caisse `paiement`. Les commandes non
+    encaissables sont écartées sans bloquer les autres.
+
+    Retourne un dict :
+      ventes  -> ventes créées (numéros de facture consécutifs), dans l'ordre des commandes
+      refus   -> [(commande_id, numero_proforma ou None, motif)]
+    Lève LotRefuse si rien ne peut être encaissé sur cette caisse à cette date.
+    """
+    ids = sorted({int(pk) for pk in commande_ids})
+    if len(ids) > LOT_MAX:
+        raise LotRefuse(f"Au plus {LOT_MAX} commandes par encaissement groupé.")
+
+    utilisateur = utilisateur if utilisateur and utilisateur.is_authenticated else None
+    try:
+        return _encaisser(ids, paiement, date_encaissement, reference, utilisateur)
+    except JourneeCloturee as e:
+        raise LotRefuse(str(e)) from e
+
+
+@transaction.atomic
+def _encaisser(ids, paiement, date_encaissement, reference, utilisateur):
+    # Refus rapide ; le contrôle qui fait foi, caisse verrouillée, est dans MouvementCaisse.enregistrer
+    if ClotureCaisse.est_cloturee(date_encaissement, paiement.pk):
+        raise JourneeCloturee(f"La journée du {date_encaissement:%d/%m/%Y} est clôturée pour la caisse {paiement.nom}.")
+    # Un seul SELECT verrouille et contrôle tout le lot (ordre des id : pas d'interblocage)
+    commandes = {
+        c.pk: c for c in
+        Commande.objects.select_for_update()
+        .filter(pk__in=ids)
+        .annotate(a_deja_vente=Exists(Vente.objects.filter(commande_id=OuterRef("pk"))))
+        .order_by("pk")
+    }
+    acceptees, refus = [], []
+    for pk in ids:
+        commande = commandes.get(pk)
+        if commande is None:
+            refus.append((pk, None, "commande introuvable"))
+        elif commande.a_deja_vente:
+            refus.append((pk, commande.numero_proforma, "déjà encaissée"))
+        elif commande.statut_vente not in STATUTS_ENCAISSABLES:
+            refus.append((pk, commande.numero_proforma, f"statut {commande.statut_vente}"))
+        else:
+            acceptees.append(commande)
+    if not acceptees:
+        return {"ventes": [], "refus": refus}
+
+    # Bloc de numéros pris dans la transaction : un rollback ne laisse pas de trou
+    numeros = Vente.generer_numeros_facture(len(acceptees))
+    ventes = [
+        Vente(
+            commande=commande,
+            numero_facture=numero,
+            paiement=paiement,
+            montant=commande.montant_total,
+            date_encaissement=date_encaissement,
+            reference=reference or None,
+            created_by=utilisateur,
+        )
+        for commande, numero in zip(acceptees, numeros)
+    ]
+    # bulk_create ne passe ni par Vente.save() ni par le signal d'audit :
+    # statuts, journal de caisse et soldes clients sont écrits ici
+    Vente.objects.bulk_create(ventes)
+    Commande.objects.filter(pk__in=[c.pk for c in acceptees]).update(
+        statut_vente="Payée", updated_at=timezone.now(), updated_by=utilisateur,
+    )
+    SoldeClient.recalculer({c.client_id for c in acceptees})
+    MouvementCaisse.enregistrer(vente.mouvement() for vente in ventes)
+    return {"ventes": ventes, "refus": refus}
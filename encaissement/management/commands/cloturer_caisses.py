@@ -0,0 +1,40 @@
+# encaissement/management/commands/cloturer_caisses.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from encaissement.models import ClotureCaisse
+
+
+class Command(BaseCommand):
+    help = (
+        "Clôture les caisses jour par jour (une ligne par caisse et par jour) : "
+        "nombre, total, première et dernière facture. Les journées déjà clôturées "
+        "sont ignorées ; aujourd'hui n'est jamais clôturé."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--du", help="Premier jour, AAAA-MM-JJ (défaut : la veille).")
+        parser.add_argument("--au", help="Dernier jour, AAAA-MM-JJ (défaut : --du).")
+
+    def handle(self, *args, **options):
+        veille = timezone.localdate() - timedelta(days=1)
+        du = self.parse(options["du"], "--du") or veille
+        au = self.parse(options["au"], "--au") or du
+        if du > au:
+            raise CommandError("--du doit précéder --au.")
+
+        crees = ClotureCaisse.cloturer(du, au)
+        self.stdout.write(self.style.SUCCESS(
+            f"{crees} clôture(s) créée(s) du {du:%d/%m/%Y} au {min(au, veille):%d/%m/%Y}."
+        ))
+
+    def parse(self, valeur, option):
+        if not valeur:
+            return None
+        jour = parse_date(valeur)
+        if jour is None:
+            raise CommandError(f"{option} attend une date AAAA-MM-JJ.")
+        return jour
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('common', '0008_journal_caisse'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClotureCaisse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('nombre', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveBigIntegerField(default=0)),
+                ('premiere_facture', models.CharField(blank=True, default='', max_length=20)),
+                ('derniere_facture', models.CharField(blank=True, default='', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('caisse', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='clotures', to='common.caisse')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cloturecaisse',
+            constraint=models.UniqueConstraint(fields=('date', 'caisse'), name='unique_cloture_date_caisse'),
+        ),
+    ]
@@ -1,7 +1,143 @@
-from django.db import models, transaction, IntegrityError
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
 from django.utils import timezone
-import time
 
-from clients.models import Entreprise
+from common.models import Caisse
+from vente.models import Vente
+
+
+class ClotureCaisse(models.Model):
+    """
+    Clôture d'une caisse pour une journée : nombre et total des encaissements, première
+    et dernière facture. Écrite une fois (journée passée) et jamais modifiée ensuite ;
+    les rapports la lisent au lieu d'agréger les ventes du jour. Toute écriture de
+    caisse datée d'une journée clôturée (encaissement, modification, suppression) est
+    refusée par MouvementCaisse.enregistrer.
+    """
+    caisse = models.ForeignKey(Caisse, on_delete=models.PROTECT, related_name="clotures")
+    date = models.DateField()
+    nombre = models.PositiveIntegerField(default=0)
+    total = models.PositiveBigIntegerField(default=0)
+    premiere_facture = models.CharField(max_length=20, blank=True, default="")
+    derniere_facture = models.CharField(max_length=20, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "caisse"], name="unique_cloture_date_caisse"),
+        ]
+
+    def __str__(self):
+        return f"Clôture {self.caisse_id} du {self.date}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Une clôture de caisse n'est pas modifiable.")
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def agregats():
+        """
+        Agrégats des ventes groupées par (date_encaissement, paiement_id). Première et
+        dernière facture dans l'ordre d'émission (id) : l'ordre alphabétique des numéros
+        ne le suit plus au-delà de 999 factures par jour (F250902-1000 < F250902-999).
+        """
+        factures = Vente.objects.filter(
+            date_encaissement=OuterRef("date_encaissement"),
+            paiement_id=OuterRef("paiement_id"),
+            numero_facture__isnull=False,
+        ).values("numero_facture")
+        return {
+            "nombre": Count("pk"),
+            "total": Sum("montant"),
+            "premiere_facture": Subquery(factures.order_by("id")[:1]),
+            "derniere_facture": Subquery(factures.order_by("-id")[:1]),
+        }
+
+    @classmethod
+    def est_cloturee(cls, jour, caisse_id):
+        return cls.objects.filter(date=jour, caisse_id=caisse_id).exists()
+
+    @classmethod
+    def cloturer(cls, du, au=None):
+        """
+        Clôture les journées du..au incluses (au plus la veille) : une ligne par caisse
+        et par jour, encaissements ou non. Les clôtures existantes sont laissées telles
+        quelles, donc la commande peut être relancée sur n'importe quelle période.
+        Retourne le nombre de clôtures créées.
+        """
+        au = min(au or du, timezone.localdate() - timedelta(days=1))
+        if du > au:
+            return 0
+        jours = [du + timedelta(days=n) for n in range((au - du).days + 1)]
+
+        with transaction.atomic():
+            # Caisses verrouillées (ordre des id) avant l'agrégat : un encaissement en cours
+            # (qui verrouille sa caisse en écrivant au journal) se termine avant et est compté ;
+            # un encaissement ultérieur voit la clôture et est refusé (MouvementCaisse.enregistrer)
+            caisses = list(Caisse.objects.select_for_update().order_by("pk").values_list("pk", flat=True))
+            existantes = set(cls.objects.filter(date__range=(du, au)).values_list("date", "caisse_id"))
+
+            groupes = {
+                (g["date_encaissement"], g["paiement_id"]): g
+                for g in Vente.objects.filter(date_encaissement__range=(du, au))
+                .values("date_encaissement", "paiement_id").annotate(**cls.agregats()).order_by()
+            }
+            clotures = []
+            for jour in jours:
+                for caisse_id in caisses:
+                    if (jour, caisse_id) in existantes:
+                        continue
+                    g = groupes.get((jour, caisse_id), {})
+                    clotures.append(cls(
+                        caisse_id=caisse_id,
+                        date=jour,
+                        nombre=g.get("nombre") or 0,
+                        total=g.get("total") or 0,
+                        premiere_facture=g.get("premiere_facture") or "",
+                        derniere_facture=g.get("derniere_facture") or "",
+                    ))
+            # Clôture concurrente de la même journée : la première écrite est conservée
+            cls.objects.bulk_create(clotures, batch_size=1000, ignore_conflicts=True)
+        return len(clotures)
+
+    @classmethod
+    def recapitulatif(cls, du, au, caisse_id=None):
+        """
+        Encaissements par jour et par caisse sur du..au : clôtures pour les journées
+        clôturées, agrégat des ventes pour les autres (en pratique : aujourd'hui).
+        Retourne une liste de dict (date, caisse_id, nombre, total, premiere_facture,
+        derniere_facture, cloture) triée par date décroissante puis caisse.
+        """
+        clotures = cls.objects.filter(date__range=(du, au))
+        if caisse_id:
+            clotures = clotures.filter(caisse_id=caisse_id)
+        lignes = [
+            dict(c, cloture=True)
+            for c in clotures.filter(nombre__gt=0)
+            .values("date", "caisse_id", "nombre", "total", "premiere_facture", "derniere_facture")
+        ]
+        jours_clotures = set(clotures.values_list("date", flat=True).distinct())
 
-# Create your models here.
+        jours_ouverts = [
+            du + timedelta(days=n) for n in range((au - du).days + 1)
+            if du + timedelta(days=n) not in jours_clotures
+        ]
+        if jours_ouverts:
+            ventes = Vente.objects.filter(date_encaissement__in=jours_ouverts)
+            if caisse_id:
+                ventes = ventes.filter(paiement_id=caisse_id)
+            for g in ventes.values("date_encaissement", "paiement_id").annotate(**cls.agregats()).order_by():
+                lignes.append({
+                    "date": g["date_encaissement"],
+                    "caisse_id": g["paiement_id"],
+                    "nombre": g["nombre"],
+                    "total": g["total"] or 0,
+                    "premiere_facture": g["premiere_facture"] or "",
+                    "derniere_facture": g["derniere_facture"] or "",
+                    "cloture": False,
+                })
+        lignes.sort(key=lambda l: (-l["date"].toordinal(), l["caisse_id"]))
+        return lignes
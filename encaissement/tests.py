@@ -1,3 +1,256 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+
+from clients.models import Entreprise
+from common.models import Caisse, CompteurDocument, JourneeCloturee, MouvementCaisse, Pages
+from common.testing import BudgetRequetesMixin
+from services.models import Service
+from vente.models import Commande, LigneCommande, SoldeClient, Vente
+
+from .lots import encaisser_lot
+from .models import ClotureCaisse
+from .views import EncaissementServiceGroupeView, EncaissementServiceUnitaireView
+
+urlpatterns = [
+    path("", EncaissementServiceUnitaireView.as_view(), name="encaissement"),
+    path("unitaire/", EncaissementServiceUnitaireView.as_view(), name="encaissement_services"),
+    path("non-valides/", EncaissementServiceUnitaireView.as_view(), name="encaissement_non_valides"),
+    path("groupe/", EncaissementServiceGroupeView.as_view(), name="encaissement_service_groupe"),
+]
+
+
+class ClotureCaisseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mvola = Caisse.objects.create(nom="MVola", responsable="Caissier")
+        cls.especes = Caisse.objects.create(nom="Espèces", responsable="Caissier")
+        cls.page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        cls.client_ = Entreprise.objects.create(raison_sociale="Client")
+        cls.aujourd_hui = timezone.localdate()
+        cls.hier = cls.aujourd_hui - timedelta(days=1)
+
+    def encaisser(self, jour, montant, caisse=None):
+        commande = Commande.objects.create(client=self.client_, page=self.page)
+        return Vente.objects.create(
+            commande=commande, paiement=caisse or self.mvola, montant=montant, date_encaissement=jour
+        )
+
+    def test_cloture_idempotente(self):
+        premiere = self.encaisser(self.hier, 100)
+        derniere = self.encaisser(self.hier, 250)
+
+        self.assertEqual(ClotureCaisse.cloturer(self.hier - timedelta(days=1), self.aujourd_hui), 4)
+        cloture = ClotureCaisse.objects.get(caisse=self.mvola, date=self.hier)
+        self.assertEqual((cloture.nombre, cloture.total), (2, 350))
+        self.assertEqual((cloture.premiere_facture, cloture.derniere_facture), (premiere.numero_facture, derniere.numero_facture))
+        self.assertEqual(ClotureCaisse.objects.get(caisse=self.especes, date=self.hier).nombre, 0)
+
+        sortie = StringIO()
+        call_command("cloturer_caisses", du=str(self.hier), stdout=sortie)
+        self.assertIn("0 clôture(s) créée(s)", sortie.getvalue())
+        self.assertFalse(ClotureCaisse.objects.filter(date=self.aujourd_hui).exists())
+        with self.assertRaises(ValueError):
+            cloture.save()
+
+    def test_premiere_et_derniere_facture_au_dela_de_999(self):
+        # Compteur du jour à 998 : les deux ventes reçoivent les numéros 999 et 1000
+        CompteurDocument.objects.create(prefixe=Vente.PREFIXE_NUMERO, jour=self.aujourd_hui, dernier_numero=998)
+        premiere = self.encaisser(self.hier, 100)
+        derniere = self.encaisser(self.hier, 250)
+        self.assertEqual((premiere.numero_facture[-4:], derniere.numero_facture[-4:]), ("-999", "1000"))
+
+        attendu = (premiere.numero_facture, derniere.numero_facture)
+        ligne, = ClotureCaisse.recapitulatif(self.hier, self.hier)
+        self.assertEqual((ligne["premiere_facture"], ligne["derniere_facture"]), attendu)
+        ClotureCaisse.cloturer(self.hier)
+        cloture = ClotureCaisse.objects.get(caisse=self.mvola, date=self.hier)
+        self.assertEqual((cloture.premiere_facture, cloture.derniere_facture), attendu)
+
+    def test_recapitulatif_lit_les_clotures(self):
+        self.encaisser(self.hier, 100)
+        ClotureCaisse.cloturer(self.hier)
+        self.encaisser(self.aujourd_hui, 40, caisse=self.especes)
+        # Modification postérieure à la clôture : le récapitulatif garde la clôture
+        Vente.objects.filter(date_encaissement=self.hier).update(montant=999)
+
+        lignes = ClotureCaisse.recapitulatif(self.hier, self.aujourd_hui)
+        self.assertEqual(
+            [(l["date"], l["caisse_id"], l["total"], l["cloture"]) for l in lignes],
+            [(self.aujourd_hui, self.especes.pk, 40, False), (self.hier, self.mvola.pk, 100, True)],
+        )
+
+    def test_journee_cloturee_non_modifiable(self):
+        vente = self.encaisser(self.hier, 100)
+        ClotureCaisse.cloturer(self.hier)
+        self.mvola.refresh_from_db()
+        cumuls = (self.mvola.entree, self.mvola.sortie)
+
+        vente.montant = 150
+        with self.assertRaises(JourneeCloturee):
+            vente.save()
+        vente.refresh_from_db()
+        vente.date_encaissement = self.aujourd_hui
+        with self.assertRaises(JourneeCloturee):
+            vente.save()  # la contre-passation tombe sur la journée clôturée
+        vente.refresh_from_db()
+        pk = vente.pk
+        with self.assertRaises(JourneeCloturee):
+            vente.delete()
+        with self.assertRaises(JourneeCloturee):
+            vente.commande.delete()
+
+        self.assertEqual(Vente.objects.get(pk=pk).montant, 100)
+        self.mvola.refresh_from_db()
+        self.assertEqual((self.mvola.entree, self.mvola.sortie), cumuls)
+        # Toutes les caisses sont clôturées pour la journée ; aujourd'hui reste ouvert
+        with self.assertRaises(JourneeCloturee):
+            self.encaisser(self.hier, 40, caisse=self.especes)
+        self.encaisser(self.aujourd_hui, 40).delete()
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_encaissement_refuse_sur_journee_cloturee(self):
+        ClotureCaisse.cloturer(self.hier)
+        commande = Commande.objects.create(client=self.client_, page=self.page)
+        self.client.force_login(get_user_model().objects.create_user("caissier", password="x"))
+        self.client.post("/", {
+            "commande_id": commande.pk, "paiement": self.mvola.pk, "date_encaissement": str(self.hier),
+        })
+        self.assertFalse(Vente.objects.filter(commande=commande).exists())
+
+
+class EncaissementGroupeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mvola = Caisse.objects.create(nom="MVola", responsable="Caissier")
+        cls.page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        cls.service = Service.objects.create(nom="Sponsorisation", reference="SPO-01", tarif=10000)
+        cls.client_a = Entreprise.objects.create(raison_sociale="Client A")
+        cls.client_b = Entreprise.objects.create(raison_sociale="Client B")
+        cls.jour = timezone.localdate()
+
+    def commander(self, client, quantite):
+        commande = Commande.objects.create(client=client, page=self.page)
+        LigneCommande.objects.create(commande=commande, service=self.service, tarif=10000, quantite=quantite)
+        commande.refresh_from_db()
+        return commande
+
+    def test_lot_encaisse_et_ecarte_les_commandes_non_encaissables(self):
+        a1, a2, b1 = self.commander(self.client_a, 1), self.commander(self.client_a, 2), self.commander(self.client_b, 3)
+        supprimee = self.commander(self.client_b, 1)
+        Commande.objects.filter(pk=supprimee.pk).update(statut_vente="Supprimée")
+        payee = self.commander(self.client_b, 1)
+        Vente.objects.create(commande=payee, paiement=self.mvola, montant=10000, date_encaissement=self.jour)
+
+        resultat = encaisser_lot([b1.pk, a1.pk, a2.pk, supprimee.pk, payee.pk, 999999], self.mvola, self.jour)
+
+        ventes = resultat["ventes"]
+        self.assertEqual([v.commande_id for v in ventes], [a1.pk, a2.pk, b1.pk])
+        numeros = [int(v.numero_facture.rsplit("-", 1)[1]) for v in ventes]
+        self.assertEqual(numeros, list(range(numeros[0], numeros[0] + 3)))
+        self.assertEqual(
+            [(pk, motif) for pk, _, motif in resultat["refus"]],
+            [(supprimee.pk, "statut Supprimée"), (payee.pk, "déjà encaissée"), (999999, "commande introuvable")],
+        )
+        self.assertEqual(Commande.objects.filter(pk__in=[a1.pk, a2.pk, b1.pk], statut_vente="Payée").count(), 3)
+        self.mvola.refresh_from_db()
+        self.assertEqual(self.mvola.entree, 70000)
+        self.assertEqual(MouvementCaisse.objects.filter(caisse=self.mvola).count(), 4)
+        self.assertEqual(SoldeClient.objects.get(entreprise=self.client_a).montant_paye, 30000)
+
+    def derniere_ecriture(self, requetes):
+        ecritures = [q["sql"] for q in requetes if q["sql"].split(" ", 1)[0] in ("INSERT", "UPDATE", "DELETE")]
+        return ecritures[-1]
+
+    def test_journal_de_caisse_en_derniere_ecriture(self):
+        commande = self.commander(self.client_a, 1)
+        with CaptureQueriesContext(connection) as ctx:
+            encaisser_lot([commande.pk], self.mvola, self.jour)
+        self.assertTrue(self.derniere_ecriture(ctx.captured_queries).startswith('UPDATE "common_caisse"'))
+
+        commande = self.commander(self.client_a, 1)
+        self.client.force_login(get_user_model().objects.create_user("caissier", password="x"))
+        with override_settings(ROOT_URLCONF=__name__), CaptureQueriesContext(connection) as ctx:
+            self.client.post("/", {
+                "commande_id": commande.pk, "paiement": self.mvola.pk, "date_encaissement": str(self.jour),
+            })
+        self.assertTrue(Vente.objects.filter(commande=commande).exists())
+        self.assertTrue(self.derniere_ecriture(ctx.captured_queries).startswith('UPDATE "common_caisse"'))
+
+    def test_nombre_de_requetes_independant_du_lot(self):
+        def requetes(n):
+            ids = [self.commander(self.client_a, 1).pk for _ in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                encaisser_lot(ids, self.mvola, self.jour)
+            return len(ctx.captured_queries)
+
+        requetes(1)  # premier numéro du jour : création du compteur
+        self.assertEqual(requetes(2), requetes(10))
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_vue_groupe(self):
+        commandes = [self.commander(self.client_a, 1) for _ in range(2)]
+        self.client.force_login(get_user_model().objects.create_user("caissier", password="x"))
+        with self.captureOnCommitCallbacks() as rappels:
+            reponse = self.client.post("/groupe/", {
+                "commande_ids": [c.pk for c in commandes], "paiement": self.mvola.pk, "date_encaissement": str(self.jour),
+            })
+        self.assertRedirects(reponse, "/", fetch_redirect_response=False)
+        self.assertEqual(len(rappels), 1)
+        self.assertEqual(Vente.objects.filter(commande__in=commandes, created_by__username="caissier").count(), 2)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_vue_groupe_caisse_invalide(self):
+        commande = self.commander(self.client_a, 1)
+        inactive = Caisse.objects.create(nom="Espèces", responsable="Caissier", statut_publication="supprimé")
+        self.client.force_login(get_user_model().objects.create_user("caissier", password="x"))
+        for paiement in ("abc", "1.5", str(inactive.pk), "999999"):
+            with mock.patch("encaissement.views.encaisser_lot") as lot:
+                reponse = self.client.post("/groupe/", {"commande_ids": [commande.pk], "paiement": paiement})
+            self.assertRedirects(reponse, "/non-valides/", fetch_redirect_response=False)
+            lot.assert_not_called()
+        self.assertFalse(Vente.objects.exists())
+
+
+class ListesEncaissementBudgetTests(BudgetRequetesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mvola = Caisse.objects.create(nom="MVola", responsable="Caissier")
+        cls.page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        cls.service = Service.objects.create(nom="Sponsorisation", reference="SPO-01", tarif=10000)
+        cls.utilisateur = get_user_model().objects.create_user("caissier", password="x")
+
+    def setUp(self):
+        self.client.force_login(self.utilisateur)
+
+    def commander(self, nombre, payer=False):
+        for n in range(nombre):
+            commande = Commande.objects.create(
+                client=Entreprise.objects.create(raison_sociale=f"Client {n}"), page=self.page
+            )
+            LigneCommande.objects.bulk_create([
+                LigneCommande(commande=commande, service=self.service, tarif=10000, quantite=q) for q in (1, 2)
+            ])
+            if payer:
+                commande.refresh_from_db()
+                Vente.objects.create(commande=commande, paiement=self.mvola, montant=commande.montant_total)
+
+    def test_encaissements_valides(self):
+        for nombre in (2, 8):
+            self.commander(nombre, payer=True)
+            for params in ({}, {"display": "cards"}, {"pagination": "curseur"}):
+                self.assertBudgetRequetes(reverse("encaissement"), 5, data=params)
+
+    def test_commandes_a_encaisser(self):
+        for nombre in (2, 8):
+            self.commander(nombre)
+            for params in ({}, {"pagination": "curseur"}):
+                self.assertBudgetRequetes(reverse("encaissement_non_valides"), 7, data=params)
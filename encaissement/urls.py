@@ -1,9 +1,11 @@
 from django.urls import path
-from .views import EncaissementServicesView, EncaissementServiceUnitaireView, EncaissementValideView
+from .views import EncaissementServicesView, EncaissementServiceUnitaireView, EncaissementServiceGroupeView, EncaissementValideView, RecapitulatifEncaissementsView
 
 urlpatterns = [
     path("", EncaissementValideView.as_view(), name="encaissement"),
     path('non-valides', EncaissementServicesView.as_view(), name="encaissement_non_valides"),
     path("encaissement/unitaire/", EncaissementServiceUnitaireView.as_view(), name="encaissement_service_unitaire"),
+    path("encaissement/groupe/", EncaissementServiceGroupeView.as_view(), name="encaissement_service_groupe"),
+    path("recapitulatif/", RecapitulatifEncaissementsView.as_view(), name="encaissement_recapitulatif"),
      path("encaissements/valides/partial/", EncaissementValideView.as_view(), name="encaissement_valides_partial"),
 ]
@@ -1,36 +1,56 @@
-from django.shortcuts import redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
-from django.views.generic import ListView
+from django.views.generic import ListView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.utils.dateparse import parse_date
 from django.utils.timezone import now
 from django.db import transaction
 from django.db.models import Exists, OuterRef
-from django.http import QueryDict
-from django.core.paginator import Paginator
 from vente.models import Commande, Vente
-from common.models import Pages, Caisse
+from common.models import Pages, Caisse, JourneeCloturee, MouvementCaisse
 from django.db.models import F, Q, Sum
 from clients.models import Entreprise
+from common.constants import ETAT_CHOIX
+from common.filtres import PERIODES, FiltreChoix, FiltreDate, FiltreEntier, FiltrePeriode, FiltresMixin, SpecFiltres
+from common.listes import ListePipelineMixin
+from common.templatetags.nombre import intpoint
+from facturation.pdf_cache import generer_en_arriere_plan, generer_lot_en_arriere_plan
+from .lots import LotRefuse, encaisser_lot
+from .models import ClotureCaisse
 
-class EncaissementValideView(LoginRequiredMixin, ListView):
+
+class EncaissementRefuse(Exception):
+    """Annule la transaction d'encaissement ; le message est déjà ajouté."""
+
+class VenteFiltres(SpecFiltres):
+    date_encaissement = FiltreDate()
+    periode = FiltrePeriode("date_encaissement")
+    du = FiltreDate("date_encaissement", lookup="gte")
+    au = FiltreDate("date_encaissement", lookup="lte")
+    client_id = FiltreEntier("commande__client_id")
+    paiement_id = FiltreEntier()
+
+
+class CommandeAEncaisserFiltres(SpecFiltres):
+    date_commande = FiltreDate()
+    statut_vente = FiltreChoix(choix=ETAT_CHOIX, defaut="En attente")
+
+
+class EncaissementValideView(LoginRequiredMixin, FiltresMixin, ListePipelineMixin, ListView):
     login_url = 'login'
     template_name = "encaissement/encaissement_valides.html"
     context_object_name = "ventes"
     paginate_by = 10
+    cursor_ordering = ("-date_encaissement", "-id")
+    aggregats = {"total_encaisse": Sum("montant")}
+    filtres_class = VenteFiltres
 
     # --- Utilitaires ---
     def _display_mode(self):
         mode = self.request.GET.get("display", "").strip().lower()
         return mode if mode in ("table", "cards") else "table"
 
-    def _extra_querystring(self):
-        # Conserver les filtres dans la pagination (sauf 'page')
-        params = self.request.GET.copy()
-        params.pop("page", None)
-        return params.urlencode()
-
     # --- Queryset filtré ---
     def get_queryset(self):
         qs = (
@@ -38,50 +58,28 @@ class EncaissementValideView(LoginRequiredMixin, ListView):
             .filter(commande__statut_vente="Payée")
             .order_by("-date_encaissement", "-id")
         )
+        return self.get_filtres().filtrer(qs)
 
-        # Filtres
-        date_encaissement = (self.request.GET.get("date_encaissement") or "").strip()
-        client_id = (self.request.GET.get("client_id") or "").strip()
-        paiement_id = (self.request.GET.get("paiement_id") or "").strip()
-
-        if date_encaissement:
-            qs = qs.filter(date_encaissement=date_encaissement)
-
-        if client_id:
-            qs = qs.filter(commande__client_id=client_id)
-
-        if paiement_id:
-            qs = qs.filter(paiement_id=paiement_id)
-
-        return qs
-
-    # --- Contexte + pagination ---
+    # --- Contexte (page, total et querystring fournis par ListePipelineMixin) ---
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        queryset = self.get_queryset()
-
-        paginator = Paginator(queryset, self.paginate_by)
-        page_number = self.request.GET.get("page")
-        page_obj = paginator.get_page(page_number)
-
-        context["page_obj"] = page_obj
-        context["ventes"] = page_obj.object_list
-
-        total = queryset.aggregate(total=Sum("montant"))["total"] or 0
-        context["total_encaisse"] = total
+        filtres = self.get_filtres()
 
         # Sélecteurs
-        context["clients"] = Entreprise.objects.order_by("raison_sociale")
+        # Client du filtre actif ; les autres sont chargés à la demande (entreprise_typeahead)
+        context["client_selectionne"] = (
+            Entreprise.objects.filter(pk=filtres["client_id"]).first() if filtres["client_id"] else None
+        )
         context["paiements"] = Caisse.objects.order_by("nom")
+        context["periodes"] = PERIODES
 
         # Valeurs sélectionnées
-        context["date_encaissement"] = self.request.GET.get("date_encaissement", "")
-        context["client_id"] = self.request.GET.get("client_id", "")
-        context["paiement_id"] = self.request.GET.get("paiement_id", "")
+        context["date_encaissement"] = filtres.donnees["date_encaissement"]
+        context["client_id"] = filtres.donnees["client_id"]
+        context["paiement_id"] = filtres.donnees["paiement_id"]
 
-        # Affichage & pagination
+        # Affichage
         context["display_mode"] = self._display_mode()
-        context["extra_querystring"] = self._extra_querystring()
 
         # Date du jour
         context["today"] = now().date()
@@ -95,59 +93,30 @@ class EncaissementValideView(LoginRequiredMixin, ListView):
         return super().render_to_response(context, **response_kwargs)
 
 
-class EncaissementServicesView(LoginRequiredMixin, ListView):
+class EncaissementServicesView(LoginRequiredMixin, FiltresMixin, ListePipelineMixin, ListView):
     login_url = 'login'  # redirection si non connecté
     model = Commande
     template_name = "encaissement/encaissement_services.html"
     context_object_name = "commandes"
     paginate_by = 10
+    cursor_ordering = ("date_commande", "id")
+    aggregats = {"total_montant": Sum("montant_total")}
+    # Par défaut : uniquement en attente
+    filtres_class = CommandeAEncaisserFiltres
 
     def get_queryset(self):
         queryset = (Commande.objects
-                    .select_related("client", "page")
+                    .select_related("client", "page", "vente")
                     .prefetch_related("lignes_commandes__service")
-                    .order_by("date_commande"))
-
-        selected_date = self.request.GET.get("date_commande")
-        selected_statut_vente = self.request.GET.get("statut_vente") or "En attente"
-
-        # Par défaut : uniquement en attente
-        if not self.request.GET:
-            queryset = queryset.filter(statut_vente="En attente")
-        else:
-            if selected_statut_vente:
-                queryset = queryset.filter(statut_vente=selected_statut_vente)
-            if selected_date:
-                queryset = queryset.filter(date_commande=selected_date)
-
-        return queryset
+                    .order_by("date_commande", "id"))
+        return self.get_filtres().filtrer(queryset)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        queryset = self.get_queryset()
-
-        # total montant
-        context["total_montant"] = sum(c.montant_commande for c in queryset)
-
-        # pagination
-        paginator = Paginator(queryset, self.paginate_by)
-        page_number = self.request.GET.get("page")
-        page_obj = paginator.get_page(page_number)
-        context["page_obj"] = page_obj
-        context["commandes"] = page_obj.object_list
 
         # filtres
-        context["selected_date"] = self.request.GET.get("date_commande") or ""
-        context["selected_statut_vente"] = self.request.GET.get("statut_vente") or "En attente"
-
-        # querystring supplémentaire
-        params = self.request.GET.copy()
-        clean_params = QueryDict(mutable=True)
-        for key, values in params.lists():
-            clean_values = [v for v in values if v.strip()]
-            if clean_values and key != "page":
-                clean_params.setlist(key, clean_values)
-        context["extra_querystring"] = "&" + clean_params.urlencode() if clean_params else ""
+        context["selected_date"] = self.get_filtres().donnees["date_commande"]
+        context["selected_statut_vente"] = self.get_filtres().donnees["statut_vente"]
 
         # autres contextes
         context["caisses"] = Caisse.objects.all()
@@ -184,39 +153,58 @@ class EncaissementServiceUnitaireView(LoginRequiredMixin, View):
                             ))
                             .get(pk=commande_id))
 
-                paiement = Caisse.actifs.select_for_update().get(pk=paiement_id)
+                # Pas de verrou sur la caisse : ses cumuls sont incrémentés par F() (MouvementCaisse)
+                paiement = Caisse.actifs.get(pk=paiement_id)
 
                 if commande.statut_vente not in self.STATUTS_VENTE or commande.statut_vente in ("Payée", "Supprimée"):
                     messages.warning(
                         request,
                         f"La commande {commande.numero_proforma} n'est pas encaisseable (statut : {commande.statut_vente})."
                     )
-                    raise transaction.Rollback
+                    raise EncaissementRefuse
+
+                if ClotureCaisse.est_cloturee(date_encaissement, paiement.pk):
+                    messages.warning(
+                        request,
+                        f"La journée du {date_encaissement:%d/%m/%Y} est clôturée pour la caisse {paiement.nom}."
+                    )
+                    raise EncaissementRefuse
 
                 if commande.a_deja_vente:
                     messages.warning(
                         request,
                         f"La commande {commande.numero_proforma} est déjà encaissée."
                     )
-                    raise transaction.Rollback
+                    raise EncaissementRefuse
 
-                vente = Vente.objects.create(
+                vente = Vente(
                     commande=commande,
                     paiement=paiement,
                     montant=commande.montant_commande,
                     date_encaissement=date_encaissement,
                     reference=reference or None,
                 )
+                vente.save(journaliser=False)
 
                 commande.statut_vente = "Payée"
-                commande.save(update_fields=["statut_vente"])
+                commande.save(update_fields=["statut_vente", "updated_at"])
+
+                # Journal de caisse en dernière écriture : la caisse n'est verrouillée
+                # que le temps de la fin de transaction
+                MouvementCaisse.enregistrer([vente.mouvement()])
+
+                # PDF de la FACTURE prêt pour le premier téléchargement
+                generer_en_arriere_plan(commande.pk, "FACTURE", request.build_absolute_uri("/"))
 
         except Commande.DoesNotExist:
             messages.error(request, "Commande introuvable.")
         except Caisse.DoesNotExist:
             messages.error(request, "Caisse invalide ou inactive.")
-        except transaction.Rollback:
+        except EncaissementRefuse:
             pass
+        except JourneeCloturee as e:
+            # Clôture écrite entre le contrôle ci-dessus et l'écriture au journal
+            messages.warning(request, str(e))
         except Exception as e:
             messages.error(request, f"Erreur lors de l'encaissement : {e}")
         else:
@@ -230,3 +218,100 @@ class EncaissementServiceUnitaireView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         messages.warning(request, "Méthode non autorisée.")
         return redirect("encaissement")
+
+
+class EncaissementServiceGroupeView(LoginRequiredMixin, View):
+    """Encaissement de plusieurs commandes cochées, en une transaction (voir encaissement.lots)."""
+    login_url = 'login'
+
+    def post(self, request, *args, **kwargs):
+        commande_ids = [pk for pk in request.POST.getlist("commande_ids") if pk.isdigit()]
+        paiement_id = request.POST.get("paiement")
+        date_encaissement = parse_date(request.POST.get("date_encaissement") or "") or now().date()
+        reference = (request.POST.get("reference") or "").strip()
+        retour = redirect("encaissement_non_valides")
+
+        if not commande_ids:
+            messages.warning(request, "Veuillez sélectionner au moins une commande.")
+            return retour
+        if not paiement_id:
+            messages.warning(request, "Veuillez choisir un mode de paiement.")
+            return retour
+        if not paiement_id.isdigit():
+            messages.error(request, "Caisse invalide ou inactive.")
+            return retour
+
+        try:
+            paiement = Caisse.actifs.get(pk=paiement_id)
+        except Caisse.DoesNotExist:
+            messages.error(request, "Caisse invalide ou inactive.")
+            return retour
+
+        try:
+            resultat = encaisser_lot(commande_ids, paiement, date_encaissement, reference, request.user)
+        except LotRefuse as e:
+            messages.warning(request, str(e))
+            return retour
+        except Exception as e:
+            messages.error(request, f"Erreur lors de l'encaissement : {e}")
+            return retour
+
+        ventes = resultat["ventes"]
+        for commande_id, numero, motif in resultat["refus"]:
+            messages.warning(request, f"Commande {numero or commande_id} non encaissée : {motif}.")
+        if not ventes:
+            return retour
+
+        generer_lot_en_arriere_plan(
+            [vente.commande_id for vente in ventes], "FACTURE", request.build_absolute_uri("/")
+        )
+        total = sum(vente.montant for vente in ventes)
+        factures = ventes[0].numero_facture if len(ventes) == 1 else f"{ventes[0].numero_facture} à {ventes[-1].numero_facture}"
+        messages.success(
+            request,
+            f"{len(ventes)} commande(s) encaissée(s) sur {paiement.nom} pour {intpoint(total)} Ar. Factures : {factures}."
+        )
+        return redirect("encaissement")
+
+    def get(self, request, *args, **kwargs):
+        messages.warning(request, "Méthode non autorisée.")
+        return redirect("encaissement")
+
+
+class RecapitulatifEncaissementsView(LoginRequiredMixin, TemplateView):
+    """
+    Encaissements par jour et par caisse : les journées clôturées sont lues dans
+    ClotureCaisse, seules les journées ouvertes (aujourd'hui) agrègent les ventes.
+    """
+    login_url = 'login'
+    template_name = "encaissement/recapitulatif.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        aujourd_hui = now().date()
+        du = parse_date(self.request.GET.get("du") or "") or aujourd_hui.replace(day=1)
+        au = parse_date(self.request.GET.get("au") or "") or aujourd_hui
+        if du > au:
+            du, au = au, du
+        paiement_id = (self.request.GET.get("paiement_id") or "").strip()
+        caisse_id = int(paiement_id) if paiement_id.isdigit() else None
+
+        caisses = {c.pk: c for c in Caisse.objects.order_by("nom")}
+        lignes = ClotureCaisse.recapitulatif(du, au, caisse_id)
+        totaux = {}
+        for ligne in lignes:
+            ligne["caisse"] = caisses.get(ligne["caisse_id"])
+            total = totaux.setdefault(ligne["caisse_id"], {"caisse": ligne["caisse"], "nombre": 0, "total": 0})
+            total["nombre"] += ligne["nombre"]
+            total["total"] += ligne["total"]
+
+        context.update({
+            "du": du,
+            "au": au,
+            "paiement_id": paiement_id,
+            "paiements": caisses.values(),
+            "lignes": lignes,
+            "totaux_caisses": sorted(totaux.values(), key=lambda t: -t["total"]),
+            "total_general": sum(t["total"] for t in totaux.values()),
+        })
+        return context
@@ -0,0 +1,264 @@
+# facturation/export.py
+"""
+Export groupé des factures (fin de mois, impression en masse).
+
+Chaque facture est rendue dans un processus séparé (WeasyPrint est limité par le
+CPU), en passant par le cache disque de pdf_cache : une facture déjà rendue n'est
+pas recalculée. Les résultats sont ensuite :
+  - ajoutés à une archive ZIP au fur et à mesure qu'ils arrivent, ou
+  - fusionnés, dans l'ordre des commandes, en un seul PDF.
+
+Utilisé par la commande `exporter_factures` et par les vues d'export en arrière-plan
+(progression lue dans un petit fichier JSON à côté du résultat).
+"""
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from pypdf import PdfWriter
+
+from common.processus import initialiser_django
+from vente.models import Commande
+from . import pdf_cache
+
+logger = logging.getLogger(__name__)
+
+FORMAT_PDF = "pdf"
+FORMAT_ZIP = "zip"
+FORMATS = (FORMAT_PDF, FORMAT_ZIP)
+
+EXPORT_DUREE_CONSERVATION = 24 * 3600  # secondes
+
+
+class ExportsSatures(Exception):
+    """Trop d'exports en arrière-plan déjà en cours dans ce processus serveur."""
+
+
+def processus_max():
+    """Taille du pool de rendu (FACTURES_EXPORT_PROCESSUS, plafonnée au nombre de CPU)."""
+    cpu = os.cpu_count() or 1
+    return max(1, min(getattr(settings, "FACTURES_EXPORT_PROCESSUS", cpu), cpu))
+
+
+def type_par_defaut(statut_vente):
+    return "FACTURE" if statut_vente == "Payée" else "FACTURE PROFORMA"
+
+
+def selectionner_commandes(ids=None, date_debut=None, date_fin=None, statut_vente=None):
+    """Sélection explicite (ids) et/ou filtre date/statut, triée comme l'export."""
+    commandes = Commande.objects.all()
+    if ids:
+        commandes = commandes.filter(id__in=ids)
+    if date_debut:
+        commandes = commandes.filter(date_commande__gte=date_debut)
+    if date_fin:
+        commandes = commandes.filter(date_commande__lte=date_fin)
+    if statut_vente:
+        commandes = commandes.filter(statut_vente=statut_vente)
+    return commandes.order_by("date_commande", "id")
+
+
+# --- Travail exécuté dans les processus (spawn : voir common.processus) ---
+
+def _rendre(tache):
+    commande_id, type_facture, base_url = tache
+    try:
+        commande = Commande.objects.select_related("vente").get(pk=commande_id)
+        nom = f"{type_facture}_{commande.numero_proforma or commande.id}.pdf"
+        return commande_id, nom, pdf_cache.obtenir_pdf(commande, type_facture, base_url), None
+    except Exception as e:
+        logger.exception("Export : rendu impossible (commande %s)", commande_id)
+        return commande_id, None, None, str(e)
+
+
+# --- Export ---
+
+def preparer_taches(commandes, type_facture, base_url):
+    """Retourne (taches, erreurs) : FACTURE n'est possible que pour une commande Payée."""
+    taches, erreurs = [], []
+    for commande_id, numero, statut in commandes.values_list("id", "numero_proforma", "statut_vente"):
+        effectif = type_facture or type_par_defaut(statut)
+        if effectif == "FACTURE" and statut != "Payée":
+            erreurs.append(f"{numero} : FACTURE impossible (statut {statut}).")
+            continue
+        taches.append((commande_id, effectif, base_url))
+    return taches, erreurs
+
+
+def _resultats(taches, processus):
+    """Itère (commande_id, nom, pdf, erreur) dans l'ordre d'arrivée."""
+    if processus <= 1 or len(taches) <= 1:
+        for tache in taches:
+            yield _rendre(tache)
+        return
+    contexte = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processus, mp_context=contexte,
+                             initializer=initialiser_django) as pool:
+        futures = [pool.submit(_rendre, tache) for tache in taches]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def exporter(commandes, sortie, format_export=FORMAT_ZIP, base_url="", type_facture=None,
+             processus=None, progression=None):
+    """
+    Écrit l'export dans `sortie` (fichier binaire ouvert).
+    `progression(fait, total)` est appelé après chaque facture.
+    Retourne (nombre de factures exportées, liste des erreurs).
+    """
+    if format_export not in FORMATS:
+        raise ValueError(f"Format inconnu : {format_export}")
+    processus = processus or processus_max()
+    taches, erreurs = preparer_taches(commandes, type_facture, base_url)
+    total = len(taches)
+    if progression:
+        progression(0, total)
+
+    fait = exportees = 0
+    if format_export == FORMAT_ZIP:
+        with zipfile.ZipFile(sortie, "w", zipfile.ZIP_STORED) as archive:  # PDF déjà compressés
+            for commande_id, nom, contenu, erreur in _resultats(taches, processus):
+                fait += 1
+                if erreur:
+                    erreurs.append(f"Commande {commande_id} : {erreur}")
+                else:
+                    archive.writestr(nom, contenu)
+                    exportees += 1
+                if progression:
+                    progression(fait, total)
+        return exportees, erreurs
+
+    parties = {}
+    for commande_id, nom, contenu, erreur in _resultats(taches, processus):
+        fait += 1
+        if erreur:
+            erreurs.append(f"Commande {commande_id} : {erreur}")
+        else:
+            parties[commande_id] = contenu
+        if progression:
+            progression(fait, total)
+
+    fusion = PdfWriter()
+    for commande_id, *_ in taches:  # ordre de la sélection
+        if commande_id in parties:
+            fusion.append(io.BytesIO(parties[commande_id]))
+    fusion.write(sortie)
+    return len(parties), erreurs
+
+
+# --- Export en arrière-plan (vues web) ---
+
+def dossier_exports() -> Path:
+    return Path(getattr(settings, "FACTURES_EXPORT_DIR", Path(settings.BASE_DIR) / "exports" / "factures"))
+
+
+def _chemin_etat(export_id):
+    return dossier_exports() / f"{export_id}.json"
+
+
+def _ecrire_etat(export_id, etat):
+    chemin = _chemin_etat(export_id)
+    tmp = chemin.with_suffix(".tmp")
+    tmp.write_text(json.dumps(etat), encoding="utf-8")
+    os.replace(tmp, chemin)
+
+
+def lire_etat(export_id):
+    """État de l'export (dict) ou None si l'identifiant est inconnu."""
+    try:
+        uuid.UUID(hex=export_id)
+        return json.loads(_chemin_etat(export_id).read_text(encoding="utf-8"))
+    except (ValueError, FileNotFoundError):
+        return None
+
+
+def chemin_resultat(export_id, etat):
+    return dossier_exports() / f"{export_id}.{etat['format']}"
+
+
+def _purger_anciens_exports():
+    limite = time.time() - EXPORT_DUREE_CONSERVATION
+    for chemin in dossier_exports().iterdir():
+        try:
+            if chemin.stat().st_mtime < limite:
+                chemin.unlink()
+        except FileNotFoundError:
+            pass
+
+
+_verrou_exports = threading.Lock()
+_exports_en_cours = 0
+
+
+def _reserver_export():
+    """Réserve une place parmi FACTURES_EXPORTS_SIMULTANES ; lève ExportsSatures sinon."""
+    global _exports_en_cours
+    with _verrou_exports:
+        if _exports_en_cours >= getattr(settings, "FACTURES_EXPORTS_SIMULTANES", 1):
+            raise ExportsSatures("Un export est déjà en cours, réessayez dans quelques instants.")
+        _exports_en_cours += 1
+
+
+def _liberer_export():
+    global _exports_en_cours
+    with _verrou_exports:
+        _exports_en_cours -= 1
+
+
+def lancer_export(commandes, format_export, base_url, type_facture=None, user_id=None):
+    """
+    Démarre l'export dans un thread (les rendus restent dans le pool de processus)
+    et retourne son identifiant ; la requête HTTP n'attend pas la fin.
+    Au plus FACTURES_EXPORTS_SIMULTANES exports tournent à la fois : au-delà,
+    lève ExportsSatures (chaque export lance son propre pool de processus).
+    """
+    _reserver_export()
+    try:
+        return _demarrer_export(commandes, format_export, base_url, type_facture, user_id)
+    except BaseException:
+        _liberer_export()
+        raise
+
+
+def _demarrer_export(commandes, format_export, base_url, type_facture, user_id):
+    dossier_exports().mkdir(parents=True, exist_ok=True)
+    _purger_anciens_exports()
+
+    export_id = uuid.uuid4().hex
+    etat = {"etat": "en_cours", "fait": 0, "total": 0, "exportees": 0,
+            "erreurs": [], "format": format_export, "user_id": user_id}
+    _ecrire_etat(export_id, etat)
+    ids = list(commandes.values_list("id", flat=True))
+
+    def progression(fait, total):
+        etat.update(fait=fait, total=total)
+        _ecrire_etat(export_id, etat)
+
+    def travail():
+        try:
+            with open(chemin_resultat(export_id, etat), "wb") as sortie:
+                exportees, erreurs = exporter(
+                    selectionner_commandes(ids=ids), sortie, format_export,
+                    base_url, type_facture, progression=progression,
+                )
+            etat.update(etat="termine", exportees=exportees, erreurs=erreurs)
+        except Exception as e:
+            logger.exception("Export %s en échec", export_id)
+            etat.update(etat="erreur", erreurs=etat["erreurs"] + [str(e)])
+        finally:
+            _ecrire_etat(export_id, etat)
+            connection.close()
+            _liberer_export()
+
+    threading.Thread(target=travail, daemon=True).start()
+    return export_id
@@ -0,0 +1,67 @@
+# facturation/factures.py
+"""
+Données d'affichage des factures (facture.html), préparées une fois par commande.
+
+construire_factures() charge les commandes avec client, page, vente, paiement et
+lignes (+ service) en 2 requêtes quel que soit le nombre de commandes ; totaux,
+montant en lettres, numéro/date selon le type et lignes de remplissage sont
+calculés ici plutôt que dans le template.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch
+
+from common.templatetags.nombre import int2words
+from vente.models import Commande, LigneCommande
+
+LIGNES_MINIMUM = 10  # remplissage visuel du tableau des lignes
+TYPES_FACTURE = ("FACTURE", "FACTURE PROFORMA")
+
+
+class FactureVue:
+    """Une facture prête à afficher (commande + type de facture)."""
+
+    def __init__(self, commande, type_facture):
+        self.commande = commande
+        self.client = commande.client
+        self.type_facture = type_facture
+        self.est_facture = type_facture == "FACTURE"
+
+        try:
+            self.vente = commande.vente
+        except ObjectDoesNotExist:
+            self.vente = None
+        vente_facture = self.vente if self.est_facture else None
+
+        self.lignes = list(commande.lignes_commandes.all())
+        self.nombre_lignes = len(self.lignes)
+        self.lignes_vides = range(max(0, LIGNES_MINIMUM - self.nombre_lignes))
+        self.montant_total = sum(ligne.montant() for ligne in self.lignes)
+        self.montant_en_lettres = int2words(self.montant_total)
+
+        if vente_facture and vente_facture.numero_facture:
+            self.numero = vente_facture.numero_facture
+        else:
+            self.numero = commande.numero_proforma
+        if vente_facture and vente_facture.date_encaissement:
+            self.date = vente_facture.date_encaissement
+        else:
+            self.date = commande.date_commande
+        self.paiement_id = vente_facture.paiement_id if vente_facture else None
+        self.reference = vente_facture.reference if vente_facture else None
+
+
+def commandes_pour_factures(commande_ids):
+    return (
+        Commande.objects.filter(id__in=commande_ids)
+        .select_related("client", "page", "vente", "vente__paiement")
+        .prefetch_related(Prefetch(
+            "lignes_commandes",
+            queryset=LigneCommande.objects.select_related("service").order_by("id"),
+        ))
+        .order_by("date_commande", "id")
+    )
+
+
+def construire_factures(commande_ids, type_facture):
+    """Liste de FactureVue, dans l'ordre des commandes (date puis id)."""
+    return [FactureVue(commande, type_facture) for commande in commandes_pour_factures(commande_ids)]
@@ -0,0 +1,98 @@
+# facturation/management/commands/benchmark_pdf_une_page.py
+import io
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.template.loader import render_to_string
+from pypdf import PdfReader
+
+from common.pdf import MODE_MESURE, MODE_PALIERS, pdf_une_page
+from facturation import pdf_cache
+from facturation.export import type_par_defaut
+from vente.models import Commande
+
+MODES = (MODE_PALIERS, MODE_MESURE)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare les deux modes de render_single_page_pdf (paliers de hauteur / mesure "
+        "en une passe) sur des factures réelles : temps, mises en page, sortie."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ids", type=int, nargs="+", help="Commandes à rendre.")
+        parser.add_argument(
+            "--nombre", type=int, default=10,
+            help="Sans --ids : les N commandes les plus riches en lignes (défaut : 10).",
+        )
+        parser.add_argument("--repetitions", type=int, default=3, help="Rendus par mode (défaut : 3).")
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000/")
+        parser.add_argument("--json", dest="fichier_json", help="Écrit les résultats détaillés en JSON.")
+
+    def handle(self, *args, **options):
+        commandes = Commande.objects.select_related("vente").annotate(nb_lignes=Count("lignes_commandes"))
+        if options["ids"]:
+            commandes = commandes.filter(id__in=options["ids"]).order_by("id")
+        else:
+            # Les factures longues sont celles où les paliers coûtent le plus cher
+            commandes = commandes.order_by("-nb_lignes", "-id")[: options["nombre"]]
+        commandes = list(commandes)
+        if not commandes:
+            raise CommandError("Aucune commande à rendre.")
+
+        repetitions = max(1, options["repetitions"])
+        resultats = []
+        self.stdout.write(
+            f"{'commande':<16}{'lignes':>7}  "
+            + "  ".join(f"{m + ' (s)':>14}{'rendus':>7}{'h mm':>7}" for m in MODES)
+        )
+        for commande in commandes:
+            type_facture = type_par_defaut(commande.statut_vente)
+            html_str = render_to_string(
+                pdf_cache.TEMPLATE_FACTURE, pdf_cache.contexte_facture(commande, type_facture)
+            )
+            ligne = {"commande": commande.numero_proforma, "lignes": commande.nb_lignes}
+            for mode in MODES:
+                durees = []
+                for _ in range(repetitions):
+                    stats = {}
+                    debut = time.perf_counter()
+                    pdf_bytes = pdf_une_page(html_str, options["base_url"], mode, stats=stats)
+                    durees.append(time.perf_counter() - debut)
+                ligne[mode] = {
+                    "secondes": statistics.median(durees),
+                    "mises_en_page": stats["mises_en_page"],
+                    "hauteur_mm": stats["hauteur_mm"],
+                    "pages": len(PdfReader(io.BytesIO(pdf_bytes)).pages),
+                    "octets": len(pdf_bytes),
+                }
+            resultats.append(ligne)
+            self.stdout.write(
+                f"{ligne['commande']:<16}{ligne['lignes']:>7}  "
+                + "  ".join(
+                    f"{ligne[m]['secondes']:>14.3f}{ligne[m]['mises_en_page']:>7}"
+                    f"{ligne[m]['hauteur_mm'] or 0:>7.0f}"
+                    for m in MODES
+                )
+            )
+
+        totaux = {m: sum(r[m]["secondes"] for r in resultats) for m in MODES}
+        une_page = all(r[m]["pages"] == 1 for r in resultats for m in MODES)
+        self.stdout.write("")
+        self.stdout.write(
+            f"Total médian : paliers {totaux[MODE_PALIERS]:.2f}s, mesure {totaux[MODE_MESURE]:.2f}s "
+            f"(x{totaux[MODE_PALIERS] / max(totaux[MODE_MESURE], 1e-9):.1f})."
+        )
+        style = self.style.SUCCESS if une_page else self.style.WARNING
+        self.stdout.write(style(
+            "Toutes les sorties tiennent sur 1 page." if une_page
+            else "Certaines sorties ne tiennent pas sur 1 page (repli A4)."
+        ))
+
+        if options["fichier_json"]:
+            with open(options["fichier_json"], "w", encoding="utf-8") as f:
+                json.dump({"repetitions": repetitions, "totaux": totaux, "commandes": resultats}, f, indent=2)
@@ -0,0 +1,73 @@
+# facturation/management/commands/exporter_factures.py
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from facturation import export
+from facturation.factures import TYPES_FACTURE
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporte un lot de factures (sélection d'ids ou filtre date/statut) en un PDF "
+        "unique ou une archive ZIP, rendu en parallèle dans plusieurs processus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("sortie", help="Fichier de destination (.pdf ou .zip).")
+        parser.add_argument("--ids", type=int, nargs="+", help="Ids des commandes à exporter.")
+        parser.add_argument("--date-debut", help="Date de commande minimale (AAAA-MM-JJ).")
+        parser.add_argument("--date-fin", help="Date de commande maximale (AAAA-MM-JJ).")
+        parser.add_argument("--statut", help="Statut de vente (ex. « Payée »).")
+        parser.add_argument(
+            "--type", dest="type_facture", choices=TYPES_FACTURE,
+            help="Type forcé (défaut : FACTURE si Payée, sinon FACTURE PROFORMA).",
+        )
+        parser.add_argument(
+            "--format", choices=export.FORMATS,
+            help="pdf ou zip (défaut : d'après l'extension de la sortie).",
+        )
+        parser.add_argument(
+            "--processus", type=int,
+            help="Nombre de processus de rendu (défaut : FACTURES_EXPORT_PROCESSUS).",
+        )
+        parser.add_argument(
+            "--base-url", default="http://127.0.0.1:8000/",
+            help="URL du site, pour résoudre les fichiers statiques du template.",
+        )
+
+    def handle(self, *args, **options):
+        sortie = options["sortie"]
+        format_export = options["format"] or os.path.splitext(sortie)[1].lstrip(".").lower()
+        if format_export not in export.FORMATS:
+            raise CommandError("Format inconnu : utilisez --format pdf|zip ou une sortie .pdf/.zip.")
+
+        dates = {}
+        for option in ("date_debut", "date_fin"):
+            if options[option]:
+                dates[option] = parse_date(options[option])
+                if dates[option] is None:
+                    raise CommandError(f"Date invalide : {options[option]}")
+
+        commandes = export.selectionner_commandes(
+            ids=options["ids"], statut_vente=options["statut"], **dates
+        )
+        if not options["ids"] and not dates and not options["statut"]:
+            raise CommandError("Précisez --ids ou un filtre (--date-debut, --date-fin, --statut).")
+
+        def progression(fait, total):
+            if total:
+                self.stdout.write(f"\r  {fait}/{total} facture(s) rendue(s)", ending="")
+                self.stdout.flush()
+
+        with open(sortie, "wb") as f:
+            exportees, erreurs = export.exporter(
+                commandes, f, format_export, options["base_url"], options["type_facture"],
+                processus=options["processus"], progression=progression,
+            )
+        self.stdout.write("")
+
+        for erreur in erreurs:
+            self.stdout.write(self.style.WARNING(f"  {erreur}"))
+        self.stdout.write(self.style.SUCCESS(f"{exportees} facture(s) exportée(s) dans {sortie}."))
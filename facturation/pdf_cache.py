@@ -0,0 +1,196 @@
+# facturation/pdf_cache.py
+"""
+Cache disque des PDF de factures / proformas.
+
+Un fichier par (commande, type de facture) et par version :
+    <FACTURES_PDF_CACHE_DIR>/<commande_id>/<type>-<clé>.pdf
+La clé combine l'id de la commande, le type, updated_at (commande et vente) et
+l'empreinte du template : toute modification donne une nouvelle clé, l'ancienne
+version est supprimée à l'écriture suivante. La clé sert aussi d'ETag.
+
+Les fichiers sont sous MEDIA_ROOT : la clé est signée (SECRET_KEY) pour ne pas
+être devinable depuis l'URL média.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction
+from django.template.loader import get_template
+from django.utils.crypto import salted_hmac
+from django.utils.text import slugify
+
+from common.models import Caisse
+from common.pdf import render_pdf_bytes
+from vente.models import Commande
+from .factures import construire_factures
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_FACTURE = "facturation/facture.html"
+
+_verrou_eviction = threading.Lock()
+
+
+def dossier_cache() -> Path:
+    return Path(getattr(settings, "FACTURES_PDF_CACHE_DIR", Path(settings.MEDIA_ROOT) / "factures_cache"))
+
+
+def empreinte_template(template_name=TEMPLATE_FACTURE):
+    source = get_template(template_name).template.source
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+def version_commande(commande):
+    """Dernière modification de la commande ou de sa vente (n° et date de facture)."""
+    dates = [commande.updated_at]
+    try:
+        dates.append(commande.vente.updated_at)
+    except ObjectDoesNotExist:
+        pass
+    return max(d for d in dates if d is not None)
+
+
+def cle_cache(commande, type_facture):
+    valeur = "|".join([
+        str(commande.pk),
+        type_facture,
+        version_commande(commande).isoformat(),
+        empreinte_template(),
+    ])
+    return salted_hmac("facturation.pdf_cache", valeur).hexdigest()[:32]
+
+
+def _prefixe_type(type_facture):
+    return slugify(type_facture) or "facture"
+
+
+def chemin_cache(commande, type_facture, cle):
+    return dossier_cache() / str(commande.pk) / f"{_prefixe_type(type_facture)}-{cle}.pdf"
+
+
+def contexte_facture(commande, type_facture):
+    # Rechargée avec ses relations seulement ici : un PDF en cache n'en a pas besoin
+    return {
+        "factures": construire_factures([commande.pk], type_facture),
+        "impression": False,  # inutile ici, on rend en PDF
+        "type_facture": type_facture,
+        "caisses": Caisse.objects.all(),
+    }
+
+
+def obtenir_pdf(commande, type_facture, base_url, cle=None):
+    """
+    Retourne les octets du PDF : lus depuis le cache si la version existe,
+    sinon rendus par WeasyPrint puis enregistrés.
+    """
+    cle = cle or cle_cache(commande, type_facture)
+    chemin = chemin_cache(commande, type_facture, cle)
+    try:
+        contenu = chemin.read_bytes()
+    except FileNotFoundError:
+        pass
+    else:
+        os.utime(chemin)  # l'éviction par âge porte sur le dernier accès
+        return contenu
+
+    contenu = render_pdf_bytes(TEMPLATE_FACTURE, contexte_facture(commande, type_facture), base_url)
+    _ecrire(chemin, contenu)
+    evincer()
+    return contenu
+
+
+def _ecrire(chemin, contenu):
+    """Écriture atomique (fichier temporaire + rename), puis suppression des anciennes versions."""
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=chemin.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(contenu)
+        os.replace(tmp, chemin)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+    prefixe = chemin.name.rsplit("-", 1)[0]
+    for ancien in chemin.parent.glob("*.pdf"):
+        if ancien != chemin and ancien.name.rsplit("-", 1)[0] == prefixe:
+            ancien.unlink(missing_ok=True)
+
+
+def evincer(max_octets=None, max_age=None):
+    """
+    Supprime les PDF non consultés depuis plus de `max_age` secondes, puis les plus
+    anciens jusqu'à repasser sous `max_octets`. Retourne le nombre de fichiers supprimés.
+    """
+    if max_octets is None:
+        max_octets = getattr(settings, "FACTURES_PDF_CACHE_MAX_OCTETS", 200 * 1024 * 1024)
+    if max_age is None:
+        max_age = getattr(settings, "FACTURES_PDF_CACHE_MAX_AGE", 30 * 24 * 3600)
+
+    racine = dossier_cache()
+    if not racine.exists():
+        return 0
+
+    with _verrou_eviction:
+        fichiers = []
+        for chemin in racine.glob("*/*.pdf"):
+            try:
+                st = chemin.stat()
+            except FileNotFoundError:
+                continue
+            fichiers.append((st.st_mtime, st.st_size, chemin))
+
+        limite = time.time() - max_age
+        supprimes = 0
+        restants, total = [], 0
+        for mtime, taille, chemin in fichiers:
+            if mtime < limite:
+                chemin.unlink(missing_ok=True)
+                supprimes += 1
+            else:
+                restants.append((mtime, taille, chemin))
+                total += taille
+
+        restants.sort()
+        for mtime, taille, chemin in restants:
+            if total <= max_octets:
+                break
+            chemin.unlink(missing_ok=True)
+            total -= taille
+            supprimes += 1
+    return supprimes
+
+
+def generer_en_arriere_plan(commande_id, type_facture, base_url):
+    """
+    Génère le PDF dans un thread après le commit de la transaction courante
+    (ex. FACTURE juste après l'encaissement) : la requête n'attend pas WeasyPrint.
+    """
+    generer_lot_en_arriere_plan([commande_id], type_facture, base_url)
+
+
+def generer_lot_en_arriere_plan(commande_ids, type_facture, base_url):
+    """Comme generer_en_arriere_plan, pour plusieurs commandes : un seul thread, l'une après l'autre."""
+    commande_ids = list(commande_ids)
+
+    def travail():
+        try:
+            for commande_id in commande_ids:
+                try:
+                    commande = Commande.objects.select_related("vente").get(pk=commande_id)
+                    obtenir_pdf(commande, type_facture, base_url)
+                except Exception:
+                    logger.exception("Génération anticipée du PDF impossible (commande %s)", commande_id)
+        finally:
+            connection.close()
+
+    if commande_ids:
+        transaction.on_commit(lambda: threading.Thread(target=travail, daemon=True).start())
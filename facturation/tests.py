@@ -1,3 +1,237 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from clients.models import Entreprise
+from common.models import Caisse, Pages
+from common.testing import BudgetRequetesMixin
+from services.models import Service
+from vente.models import Commande, LigneCommande, Vente
+
+from . import export, pdf_cache
+from .factures import construire_factures
+
+
+class ConstruireFacturesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_entreprise = Entreprise.objects.create(raison_sociale="Client SARL")
+        cls.page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        cls.caisse = Caisse.objects.create(nom="MVola", responsable="Caissier")
+        cls.services = [
+            Service.objects.create(nom=f"Service {i}", reference=f"S{i}", tarif=1000 * i)
+            for i in range(1, 6)
+        ]
+
+    def creer_commande(self, nombre_lignes, payee=False):
+        commande = Commande.objects.create(
+            client=self.client_entreprise, page=self.page, date_commande=date(2025, 9, 2)
+        )
+        LigneCommande.objects.bulk_create([
+            LigneCommande(commande=commande, service=service, tarif=service.tarif, quantite=2)
+            for service in self.services[:nombre_lignes]
+        ])
+        if payee:
+            Vente.objects.create(commande=commande, paiement=self.caisse, montant=0, reference="REF-1")
+        return commande
+
+    def test_valeurs_precalculees(self):
+        commande = self.creer_commande(3, payee=True)
+        facture, = construire_factures([commande.pk], "FACTURE")
+        self.assertEqual(facture.montant_total, (1000 + 2000 + 3000) * 2)
+        self.assertEqual(facture.montant_en_lettres, "douze mille")
+        self.assertEqual(facture.numero, commande.vente.numero_facture)
+        self.assertEqual(facture.paiement_id, self.caisse.pk)
+        self.assertEqual(len(facture.lignes_vides), 7)
+
+        proforma, = construire_factures([commande.pk], "FACTURE PROFORMA")
+        self.assertEqual(proforma.numero, commande.numero_proforma)
+        self.assertIsNone(proforma.reference)
+
+    def test_nombre_de_requetes_independant_des_lignes(self):
+        ids = [self.creer_commande(1).pk, self.creer_commande(5, payee=True).pk]
+        caisses = list(Caisse.objects.all())
+        # commandes (+ client, page, vente, paiement) puis lignes (+ service)
+        with self.assertNumQueries(2):
+            factures = construire_factures(ids, "FACTURE PROFORMA")
+            html = render_to_string("facturation/facture.html", {
+                "factures": factures, "type_facture": "FACTURE PROFORMA", "caisses": caisses,
+            })
+        self.assertIn("Service 5", html)
+        self.assertEqual(html.count('class="page"'), 2)
+
+
+@mock.patch("facturation.pdf_cache.render_pdf_bytes", return_value=b"%PDF-1.7 test")
+class CachePdfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        cls.caisse = Caisse.objects.create(nom="MVola", responsable="Caissier")
+        cls.utilisateur = get_user_model().objects.create_user("caissier", password="x")
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.dossier = Path(dossier.name)
+        reglage = override_settings(FACTURES_PDF_CACHE_DIR=self.dossier)
+        reglage.enable()
+        self.addCleanup(reglage.disable)
+        self.client.force_login(self.utilisateur)
+        self.commande = Commande.objects.create(
+            client=Entreprise.objects.create(raison_sociale="Client"), page=self.page
+        )
+        self.url = reverse("telecharger_facture_service_pdf")
+
+    def fichiers(self):
+        return sorted(p.name for p in self.dossier.glob("*/*.pdf"))
+
+    def test_etag_et_304(self, rendu):
+        reponse = self.client.get(self.url, {"commande_id": self.commande.pk})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.content, b"%PDF-1.7 test")
+        etag = reponse["ETag"]
+
+        reponse = self.client.get(self.url, {"commande_id": self.commande.pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 304)
+        # Second GET sans If-None-Match : lu sur disque, pas rendu à nouveau
+        self.client.get(self.url, {"commande_id": self.commande.pk})
+        self.assertEqual(rendu.call_count, 1)
+
+    def test_type_inconnu_refuse(self, rendu):
+        reponse = self.client.get(self.url, {"commande_id": self.commande.pk, "type_facture": "../x"})
+        self.assertEqual(reponse.status_code, 302)
+        self.assertEqual(self.fichiers(), [])
+        rendu.assert_not_called()
+
+    def test_nouvelle_cle_a_chaque_modification(self, rendu):
+        commande = Commande.objects.select_related("vente").get(pk=self.commande.pk)
+        cle_proforma = pdf_cache.cle_cache(commande, "FACTURE PROFORMA")
+        pdf_cache.obtenir_pdf(commande, "FACTURE PROFORMA", "http://testserver/")
+
+        commande.remarque = "Modifiée"
+        commande.save()
+        commande = Commande.objects.select_related("vente").get(pk=commande.pk)
+        cle_modifiee = pdf_cache.cle_cache(commande, "FACTURE PROFORMA")
+        self.assertNotEqual(cle_modifiee, cle_proforma)
+        pdf_cache.obtenir_pdf(commande, "FACTURE PROFORMA", "http://testserver/")
+        # L'ancienne version est remplacée, pas accumulée
+        self.assertEqual(self.fichiers(), [f"facture-proforma-{cle_modifiee}.pdf"])
+
+        vente = Vente.objects.create(commande=commande, paiement=self.caisse, montant=0)
+        commande = Commande.objects.select_related("vente").get(pk=commande.pk)
+        cle_facture = pdf_cache.cle_cache(commande, "FACTURE")
+        vente.reference = "REF-2"
+        vente.save()
+        commande = Commande.objects.select_related("vente").get(pk=commande.pk)
+        self.assertNotEqual(pdf_cache.cle_cache(commande, "FACTURE"), cle_facture)
+
+    def test_eviction_par_age_puis_par_taille(self, rendu):
+        dossier = self.dossier / "1"
+        dossier.mkdir()
+        maintenant = time.time()
+        for nom, age in (("vieux", 3600), ("ancien", 300), ("recent", 200), ("neuf", 100)):
+            chemin = dossier / f"facture-{nom}.pdf"
+            chemin.write_bytes(b"x" * 100)
+            os.utime(chemin, (maintenant - age, maintenant - age))
+
+        self.assertEqual(pdf_cache.evincer(max_octets=250, max_age=1800), 2)
+        self.assertEqual(self.fichiers(), ["facture-neuf.pdf", "facture-recent.pdf"])
+
+
+class ExportFacturesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = get_user_model().objects.create_user("comptable", password="x")
+        cls.commande = Commande.objects.create(
+            client=Entreprise.objects.create(raison_sociale="Client"),
+            page=Pages.objects.create(nom="Page", contact="034", type="SERVICE"),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.utilisateur)
+        self.url = reverse("export_factures")
+
+    def test_type_inconnu_refuse(self):
+        with mock.patch("facturation.export.lancer_export") as lancer:
+            reponse = self.client.post(self.url, {"commande_ids": [self.commande.pk], "type_facture": "AVOIR"})
+        self.assertEqual(reponse.status_code, 400)
+        lancer.assert_not_called()
+
+    @override_settings(FACTURES_EXPORTS_SIMULTANES=1)
+    @mock.patch("facturation.export._demarrer_export", return_value="a" * 32)
+    def test_exports_simultanes_limites(self, demarrer):
+        donnees = {"commande_ids": [self.commande.pk]}
+        self.assertEqual(self.client.post(self.url, donnees).status_code, 202)
+        try:
+            # Le premier export n'est pas terminé : le suivant est refusé
+            self.assertEqual(self.client.post(self.url, donnees).status_code, 429)
+        finally:
+            export._liberer_export()
+        self.assertEqual(self.client.post(self.url, donnees).status_code, 202)
+        export._liberer_export()
+        self.assertEqual(demarrer.call_count, 2)
+
+    @override_settings(FACTURES_EXPORTS_SIMULTANES=1)
+    def test_place_liberee_si_le_demarrage_echoue(self):
+        with mock.patch("facturation.export._demarrer_export", side_effect=OSError("disque plein")):
+            with self.assertRaises(OSError):
+                export.lancer_export(Commande.objects.all(), export.FORMAT_PDF, "http://testserver/")
+        self.assertEqual(export._exports_en_cours, 0)
+
+    @mock.patch("facturation.export.os.cpu_count", return_value=8)
+    def test_processus_plafonnes(self, cpu):
+        with override_settings(FACTURES_EXPORT_PROCESSUS=2):
+            self.assertEqual(export.processus_max(), 2)
+        with override_settings(FACTURES_EXPORT_PROCESSUS=64):
+            self.assertEqual(export.processus_max(), 8)
+
+
+class FacturationListeTests(BudgetRequetesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = get_user_model().objects.create_user("facturier", password="x")
+
+    def setUp(self):
+        self.client.force_login(self.utilisateur)
+        self.url = reverse("facturation")
+
+    def test_bornes_export_incluent_date_commande(self):
+        jour = date(2024, 3, 14)
+        reponse = self.client.get(self.url, {"date_commande": "2024-03-14", "du": "2024-03-01", "au": "2024-03-31"})
+        self.assertEqual((reponse.context["date_debut"], reponse.context["date_fin"]), (jour, jour))
+
+        # Jour hors des bornes du / au : intervalle vide, comme la liste affichée
+        reponse = self.client.get(self.url, {"date_commande": "2024-03-14", "au": "2024-03-10"})
+        self.assertGreater(reponse.context["date_debut"], reponse.context["date_fin"])
+
+    def test_meme_ordre_en_pages_et_par_curseur(self):
+        page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        client = Entreprise.objects.create(raison_sociale="Client")
+        for jour in (1, 1, 2):
+            Commande.objects.create(client=client, page=page, date_commande=date(2024, 3, jour))
+        attendu = list(Commande.objects.order_by("-date_commande", "-id"))
+        par_pages = self.client.get(self.url).context["commandes"]
+        par_curseur = self.client.get(self.url, {"pagination": "curseur"}).context["commandes"]
+        self.assertEqual(list(par_pages), attendu)
+        self.assertEqual(list(par_curseur), attendu)
+
+    def test_budget_independant_du_nombre_de_commandes(self):
+        page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        caisse = Caisse.objects.create(nom="MVola", responsable="Caissier")
+        for nombre in (2, 8):
+            for n in range(nombre):
+                commande = Commande.objects.create(
+                    client=Entreprise.objects.create(raison_sociale=f"Client {n}"), page=page
+                )
+                if n % 2:
+                    Vente.objects.create(commande=commande, paiement=caisse, montant=0)
+            for params in ({}, {"pagination": "curseur"}, {"statut_vente": "Payée"}):
+                self.assertBudgetRequetes(self.url, 4, data=params)
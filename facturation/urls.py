@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import FacturationCommandesServicesView, FacturationCommandesServicesPartialView, VoirFacturesServicesView, ImprimerFacturesServicesView, TelechargerFactureServicePDFView
+from .views import ExporterFacturesServicesView, ExportFacturesStatutView, TelechargerExportFacturesView
 
 urlpatterns = [
     path('', FacturationCommandesServicesView.as_view(), name="facturation"),
@@ -23,4 +24,19 @@ urlpatterns = [
         TelechargerFactureServicePDFView.as_view(),
         name="telecharger_facture_service_pdf"
     ),
+    path(
+        "export/",
+        ExporterFacturesServicesView.as_view(),
+        name="export_factures"
+    ),
+    path(
+        "export/<str:export_id>/",
+        ExportFacturesStatutView.as_view(),
+        name="export_factures_statut"
+    ),
+    path(
+        "export/<str:export_id>/telecharger/",
+        TelechargerExportFacturesView.as_view(),
+        name="export_factures_telecharger"
+    ),
 ]
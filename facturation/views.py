@@ -1,7 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
 from django.core.paginator import Paginator
-from django.http import QueryDict
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.utils.dateparse import parse_date
 from vente.models import Commande, Caisse
 from encaissement.views import EncaissementServiceUnitaireView
@@ -10,54 +10,62 @@ from django.views.decorators.http import require_http_methods
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from common.pdf import render_html_to_pdf
+from django.utils.cache import get_conditional_response, patch_cache_control
+from common.filtres import PERIODES, FiltreChoix, FiltreDate, FiltrePeriode, SpecFiltres
+from common.pagination import paginer
+from django.urls import reverse
+from . import export, pdf_cache
+from .factures import TYPES_FACTURE, FactureVue, commandes_pour_factures
 
 # Create your views here.
+STATUTS_VENTE = ["En attente", "Payée", "Supprimée"]
+
+
+class FacturationFiltres(SpecFiltres):
+    date_commande = FiltreDate()
+    periode = FiltrePeriode("date_commande")
+    du = FiltreDate("date_commande", lookup="gte")
+    au = FiltreDate("date_commande", lookup="lte")
+    # Premier chargement : afficher tous les statuts
+    statut_vente = FiltreChoix(choix=STATUTS_VENTE)
+
+
 class FacturationCommandesServicesView(LoginRequiredMixin, View):
-    STATUTS_VENTE = ["En attente", "Payée", "Supprimée"]
+    STATUTS_VENTE = STATUTS_VENTE
 
     def get(self, request, *args, **kwargs):
-        params = request.GET.copy()
-        selected_date = params.get("date_commande")
-        selected_statut = params.get("statut_vente")
-        type_facture = params.get("type_facture")  # peut être None; l'UI mettra la valeur par défaut
-
-        # Premier chargement : afficher tous les statuts
-        if not request.GET:
-            selected_statut = ""
-
-        commandes = Commande.objects.all().order_by('-date_commande', '-numero_proforma')
-
-        # Filtres
-        if selected_date:
-            parsed_date = parse_date(selected_date)
-            if parsed_date:
-                commandes = commandes.filter(date_commande=parsed_date)
-
-        if selected_statut and selected_statut in self.STATUTS_VENTE:
-            commandes = commandes.filter(statut_vente=selected_statut)
-
-        # Pagination
-        paginator = Paginator(commandes, 10)
-        page_number = request.GET.get("page")
-        page_obj = paginator.get_page(page_number)
-
-        # Conserver les filtres dans la pagination (hors 'page')
-        clean_params = QueryDict(mutable=True)
-        for key, values in params.lists():
-            if key != 'page':
-                clean_values = [v for v in values if v.strip() or v == '']
-                clean_params.setlist(key, clean_values)
-        extra_querystring = '&' + clean_params.urlencode() if clean_params else ''
+        filtres = FacturationFiltres(request.GET)
+        type_facture = request.GET.get("type_facture")  # peut être None; l'UI mettra la valeur par défaut
+
+        commandes = filtres.filtrer(
+            Commande.objects.select_related('client', 'page', 'vente')
+            .order_by('-date_commande', '-id')
+        )
+
+        # Pagination (numéros de page ou curseur (date_commande, id))
+        page_obj = paginer(request, commandes, 10, ("-date_commande", "-id"))
+
+        # Bornes de la période filtrée, reprises par l'export groupé
+        periode = filtres["periode"] or (None, None)
+        jour = filtres["date_commande"]
+        date_debut = max((d for d in (jour, periode[0], filtres["du"]) if d), default=None)
+        date_fin = min((d for d in (jour, periode[1], filtres["au"]) if d), default=None)
 
         context = {
             "commandes": page_obj.object_list,
             "page_obj": page_obj,
-            "selected_date": selected_date or "",
-            "selected_statut": selected_statut or "",
-            "extra_querystring": extra_querystring,
+            "filtres": filtres,
+            "selected_date": filtres.donnees["date_commande"],
+            "selected_statut": filtres.donnees["statut_vente"],
+            # Conserver les filtres dans la pagination (hors position et mode)
+            "extra_querystring": filtres.querystring(type_facture=type_facture),
             "statuts_vente": self.STATUTS_VENTE,
+            "periodes": PERIODES,
+            "date_debut": date_debut,
+            "date_fin": date_fin,
             "type_facture": type_facture,
+            "pagination_curseur_disponible": True,
+            "afficher_total": True,
         }
         return render(request, "facturation/facturation.html", context)
 
@@ -92,7 +100,7 @@ class VoirFacturesServicesView(LoginRequiredMixin, View):
             messages.error(request, "Veuillez sélectionner une commande.")
             return redirect('facturation_commandes_services')
 
-        commande = get_object_or_404(Commande, id=commande_id)
+        commande = get_object_or_404(commandes_pour_factures([commande_id]))
         requested_type = request.POST.get("type_facture")
         effective_type = requested_type or _default_type_for_commande(commande)
 
@@ -104,7 +112,7 @@ class VoirFacturesServicesView(LoginRequiredMixin, View):
         caisses = Caisse.objects.all()
 
         return render(request, "facturation/facture.html", {
-            "commandes": Commande.objects.filter(id=commande.id),
+            "factures": [FactureVue(commande, effective_type)],
             "impression": False,
             "type_facture": effective_type,
             "caisses": caisses,
@@ -119,7 +127,7 @@ class ImprimerFacturesServicesView(LoginRequiredMixin, View):
             messages.error(request, "Veuillez sélectionner une commande.")
             return redirect('facturation')
 
-        commande = get_object_or_404(Commande, id=commande_id)
+        commande = get_object_or_404(commandes_pour_factures([commande_id]))
         requested_type = request.POST.get("type_facture")
         effective_type = requested_type or _default_type_for_commande(commande)
 
@@ -130,7 +138,7 @@ class ImprimerFacturesServicesView(LoginRequiredMixin, View):
         caisses = Caisse.objects.all()
 
         return render(request, 'facturation/facture.html', {
-            'commandes': Commande.objects.filter(id=commande.id),
+            'factures': [FactureVue(commande, effective_type)],
             'impression': True,
             'type_facture': effective_type,
             'caisses': caisses,  
@@ -143,34 +151,120 @@ class ImprimerFacturesServicesView(LoginRequiredMixin, View):
 
 class TelechargerFactureServicePDFView(LoginRequiredMixin, View):
     """
-    Génère un PDF de la facture/proforma pour la commande sélectionnée.
+    PDF de la facture/proforma pour la commande sélectionnée.
+    Servi depuis le cache disque tant que la commande n'a pas changé (voir pdf_cache) ;
+    en GET, l'ETag permet au navigateur de revalider sans retélécharger (304).
     """
 
+    def get(self, request, *args, **kwargs):
+        return self.telecharger(request, request.GET)
+
     def post(self, request, *args, **kwargs):
-        commande_id = request.POST.get("commande_id")
+        return self.telecharger(request, request.POST)
+
+    def telecharger(self, request, params):
+        commande_id = params.get("commande_id")
         if not commande_id:
             messages.error(request, "Veuillez sélectionner une commande.")
-            return redirect('facturation_commandes_services')
+            return redirect('facturation')
+
+        # Le type entre dans la clé et le nom du fichier en cache, et dans Content-Disposition
+        requested_type = params.get("type_facture")
+        if requested_type and requested_type not in TYPES_FACTURE:
+            messages.error(request, "Type de facture inconnu.")
+            return redirect('facturation')
 
-        commande = get_object_or_404(Commande, id=commande_id)
+        commande = get_object_or_404(Commande.objects.select_related("vente"), id=commande_id)
 
         # Type demandé ou défaut (FACTURE si Payée sinon PROFORMA)
-        requested_type = request.POST.get("type_facture")
-        effective_type = requested_type or ("FACTURE" if commande.statut_vente == "Payée" else "FACTURE PROFORMA")
+        effective_type = requested_type or _default_type_for_commande(commande)
 
         # FACTURE interdit si non Payée
         if effective_type == "FACTURE" and commande.statut_vente != "Payée":
             messages.error(request, "Type FACTURE non autorisé : la commande sélectionnée n'est pas Payée.")
-            return redirect('facturation_commandes_services')
+            return redirect('facturation')
 
-        caisses = Caisse.objects.all()
+        cle = pdf_cache.cle_cache(commande, effective_type)
+        etag = f'"{cle}"'
+        if request.method in ("GET", "HEAD"):
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
 
-        context = {
-            "commandes": Commande.objects.filter(id=commande.id),
-            "impression": False,  # inutile ici, on rend en PDF
-            "type_facture": effective_type,
-            "caisses": caisses,
-        }
+        pdf_bytes = pdf_cache.obtenir_pdf(commande, effective_type, request.build_absolute_uri("/"), cle=cle)
 
         filename = f"{effective_type}_{commande.numero_proforma or commande.id}.pdf"
-        return render_html_to_pdf("facturation/facture.html", context, request, filename)
\ No newline at end of file
+        response = HttpResponse(pdf_bytes, content_type="application/pdf")
+        response["Content-Disposition"] = f'inline; filename="{filename}"'
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+@method_decorator([require_http_methods(["POST"])], name="dispatch")
+class ExporterFacturesServicesView(LoginRequiredMixin, View):
+    """
+    Export groupé : sélection (commande_ids) ou filtre date/statut, en PDF unique ou ZIP.
+    Le rendu tourne en arrière-plan ; la réponse donne l'URL de suivi de la progression.
+    """
+
+    def post(self, request, *args, **kwargs):
+        format_export = request.POST.get("format") or export.FORMAT_PDF
+        if format_export not in export.FORMATS:
+            return JsonResponse({"erreur": "Format d'export inconnu."}, status=400)
+
+        type_facture = request.POST.get("type_facture") or None
+        if type_facture and type_facture not in TYPES_FACTURE:
+            return JsonResponse({"erreur": "Type de facture inconnu."}, status=400)
+
+        ids = [i for i in request.POST.getlist("commande_ids") if i.isdigit()]
+        date_commande = parse_date(request.POST.get("date_commande") or "")
+        date_debut = parse_date(request.POST.get("date_debut") or "") or date_commande
+        date_fin = parse_date(request.POST.get("date_fin") or "") or date_commande
+        statut = request.POST.get("statut_vente") or None
+        if statut and statut not in FacturationCommandesServicesView.STATUTS_VENTE:
+            statut = None
+
+        commandes = export.selectionner_commandes(ids, date_debut, date_fin, statut)
+        if not commandes.exists():
+            return JsonResponse({"erreur": "Aucune commande à exporter."}, status=400)
+
+        try:
+            export_id = export.lancer_export(
+                commandes, format_export, request.build_absolute_uri("/"),
+                type_facture=type_facture, user_id=request.user.pk,
+            )
+        except export.ExportsSatures as e:
+            return JsonResponse({"erreur": str(e)}, status=429)
+        return JsonResponse({
+            "id": export_id,
+            "statut_url": reverse("export_factures_statut", args=[export_id]),
+        }, status=202)
+
+
+def _etat_export_ou_404(request, export_id):
+    etat = export.lire_etat(export_id)
+    if etat is None or etat.get("user_id") != request.user.pk:
+        raise Http404("Export introuvable.")
+    return etat
+
+
+class ExportFacturesStatutView(LoginRequiredMixin, View):
+
+    def get(self, request, export_id, *args, **kwargs):
+        etat = _etat_export_ou_404(request, export_id)
+        donnees = {k: etat[k] for k in ("etat", "fait", "total", "exportees", "erreurs")}
+        if etat["etat"] == "termine":
+            donnees["telechargement_url"] = reverse("export_factures_telecharger", args=[export_id])
+        return JsonResponse(donnees)
+
+
+class TelechargerExportFacturesView(LoginRequiredMixin, View):
+
+    def get(self, request, export_id, *args, **kwargs):
+        etat = _etat_export_ou_404(request, export_id)
+        chemin = export.chemin_resultat(export_id, etat)
+        if etat["etat"] != "termine" or not chemin.exists():
+            raise Http404("Export non disponible.")
+        nom = f"factures_{export_id[:8]}.{etat['format']}"
+        return FileResponse(open(chemin, "rb"), as_attachment=True, filename=nom)
@@ -0,0 +1,75 @@
+# services/catalogue.py
+"""
+Catalogue des services mis en cache, avec numéro de version.
+
+Deux niveaux : une copie en mémoire du processus et une copie dans le cache
+Django (settings.CACHES), sous une clé qui contient la version.
+La version courante est lue en base à chaque appel (VersionCatalogue : une ligne
+lue par clé primaire), donc commune à tous les workers même quand le cache n'est
+pas partagé ; la copie locale n'est reconstruite que si elle a changé.
+
+Tout enregistrement ou suppression de Service change la version (services/signals.py) ;
+les écritures en masse (bulk_create, update) doivent appeler invalider().
+"""
+import json
+import threading
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from services.models import Service, VersionCatalogue
+
+CLE_DONNEES = "services:catalogue:{version}"
+CHAMPS = ("id", "reference", "nom", "tarif")
+
+DUREE_DONNEES = 24 * 3600  # les anciennes versions expirent d'elles-mêmes
+
+_verrou = threading.Lock()
+_copie = (None, None, None)  # (version, services, json) remplacé d'un bloc
+
+
+def version():
+    """Version courante du catalogue (créée au premier appel)."""
+    return VersionCatalogue.courante()
+
+
+def invalider():
+    """Nouvelle version, écrite dans la transaction en cours : visible de tous les workers à la validation."""
+    VersionCatalogue.changer()
+
+
+def _construire():
+    services = list(Service.objects.order_by("reference").values(*CHAMPS))
+    return {"services": services, "json": json.dumps(services, cls=DjangoJSONEncoder).encode()}
+
+
+def _charger():
+    global _copie
+    courante = version()
+    copie = _copie
+    if copie[0] == courante:
+        return copie
+    with _verrou:
+        if _copie[0] != courante:
+            cle = CLE_DONNEES.format(version=courante)
+            donnees = cache.get(cle)
+            if donnees is None:
+                donnees = _construire()
+                cache.set(cle, donnees, timeout=DUREE_DONNEES)
+            _copie = (courante, donnees["services"], donnees["json"])
+        return _copie
+
+
+def services():
+    """Liste de dict (id, reference, nom, tarif), triée par référence. Ne pas modifier."""
+    return _charger()[1]
+
+
+def catalogue_json():
+    """(version, JSON encodé en bytes) prêt à servir."""
+    courante, _, contenu = _charger()
+    return courante, contenu
+
+
+def etag(version_catalogue):
+    return f'"catalogue-{version_catalogue}"'
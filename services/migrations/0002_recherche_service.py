@@ -0,0 +1,76 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:53
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Copie figée de common.recherche.mots au moment de la migration : une évolution
+# du module ne doit pas changer ce que produit cette migration.
+_RE_MOT = re.compile(r"[a-z0-9]+")
+
+
+def _replier_caractere(c):
+    decompose = unicodedata.normalize("NFKD", c)
+    base = "".join(x for x in decompose if not unicodedata.combining(x))
+    return (base[:1] or c).lower()
+
+
+def mots(texte):
+    replie = "".join(_replier_caractere(c) for c in texte or "")
+    return [mot[:64] for mot in _RE_MOT.findall(replie)]
+
+
+def indexer_services(apps, schema_editor):
+    Service = apps.get_model('services', 'Service')
+    MotCleService = apps.get_model('services', 'MotCleService')
+    services = list(Service.objects.all())
+    for service in services:
+        service.cle_reference = "".join(mots(service.reference))[:50]
+    Service.objects.bulk_update(services, ['cle_reference'], batch_size=1000)
+    MotCleService.objects.bulk_create([
+        MotCleService(service_id=service.pk, mot=mot, tarif=service.tarif)
+        for service in services for mot in set(mots(service.nom))
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MotCleService',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mot', models.CharField(max_length=64)),
+                ('tarif', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='cle_reference',
+            field=models.CharField(default='', editable=False, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['cle_reference', 'tarif'], name='services_cle_reference_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['tarif'], name='services_tarif_idx'),
+        ),
+        migrations.AddField(
+            model_name='motcleservice',
+            name='service',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mots_recherche', to='services.service'),
+        ),
+        migrations.AddIndex(
+            model_name='motcleservice',
+            index=models.Index(fields=['mot', 'tarif', 'service'], name='services_mot_cle_mot_idx'),
+        ),
+        migrations.RunPython(indexer_services, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0002_recherche_service'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCatalogue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jeton', models.CharField(max_length=12)),
+            ],
+        ),
+    ]
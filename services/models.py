@@ -1,7 +1,8 @@
-from django.db import models
+import uuid
 
-# Create your models here.
-from django.db import models
+from django.db import models, transaction
+
+from common import recherche
 
 # Create your models here.
 class ActifsManager(models.Manager):
@@ -12,9 +13,136 @@ class Service(models.Model):
     nom = models.CharField("Nom de l'article", max_length=100)
     reference = models.CharField("Référence", max_length=50, unique=True)
     tarif = models.PositiveIntegerField("Tarif (Ar)")
+    # Référence repliée (minuscules, sans accents ni séparateurs) : « SPO-01 » -> « spo01 »
+    cle_reference = models.CharField(max_length=50, editable=False, default="")
 
     objects = models.Manager()   # manager par défaut
     actifs = ActifsManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["cle_reference", "tarif"], name="services_cle_reference_idx"),
+            models.Index(fields=["tarif"], name="services_tarif_idx"),
+        ]
+
+    def __str__(self):
+        return self.nom
+
+    @staticmethod
+    def normaliser_reference(texte):
+        return "".join(recherche.mots(texte))[:50]
+
+    def save(self, *args, **kwargs):
+        self.cle_reference = self.normaliser_reference(self.reference)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "reference" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "cle_reference"}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.__class__.indexer_recherche([self])
+
+    @classmethod
+    def indexer_recherche(cls, services):
+        """
+        Reconstruit cle_reference et les mots du nom (MotCleService) des services donnés ;
+        nécessaire après bulk_create / update, qui ne passent pas par save().
+        """
+        services = [s for s in services if s.pk]
+        if not services:
+            return 0
+        a_corriger = []
+        for service in services:
+            cle = cls.normaliser_reference(service.reference)
+            if service.cle_reference != cle:
+                service.cle_reference = cle
+                a_corriger.append(service)
+        mots_cles = [
+            MotCleService(service_id=service.pk, mot=mot, tarif=service.tarif)
+            for service in services for mot in set(recherche.mots(service.nom))
+        ]
+        with transaction.atomic():
+            if a_corriger:
+                cls.objects.bulk_update(a_corriger, ["cle_reference"])
+            MotCleService.objects.filter(service_id__in=[s.pk for s in services]).delete()
+            MotCleService.objects.bulk_create(mots_cles, batch_size=1000)
+        return len(mots_cles)
+
+    @classmethod
+    def rechercher(cls, saisie="", queryset=None, tarif_min=None, tarif_max=None):
+        """
+        Services dont la référence commence par la saisie ou dont chaque terme commence
+        un mot du nom (sans accents), dans la fourchette de tarif donnée.
+        Référence et mots du nom sont lus par plage d'index, tarif compris
+        ((cle_reference, tarif) et MotCleService (mot, tarif)) ; les services trouvés
+        par leur référence passent en premier.
+        """
+        queryset = cls.objects.all() if queryset is None else queryset
+        tarifs = {}
+        if tarif_min is not None:
+            tarifs["tarif__gte"] = tarif_min
+        if tarif_max is not None:
+            tarifs["tarif__lte"] = tarif_max
+        queryset = queryset.filter(**tarifs)
+
+        termes = recherche.termes(saisie)
+        if not termes:
+            return queryset.order_by("reference")
+
+        par_reference = recherche.filtre_prefixe("cle_reference", "".join(termes)[:50])
+        par_nom = models.Q()
+        for terme in termes:
+            par_nom &= models.Q(pk__in=MotCleService.objects.filter(
+                recherche.filtre_prefixe("mot", terme), **tarifs
+            ).values("service_id"))
+        return (
+            queryset.filter(par_reference | par_nom)
+            .annotate(par_reference=models.ExpressionWrapper(par_reference, output_field=models.BooleanField()))
+            .order_by("-par_reference", "reference")
+        )
+
+
+class MotCleService(models.Model):
+    """Mots du nom des services (repliés), avec le tarif pour filtrer dans l'index."""
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name="mots_recherche")
+    mot = models.CharField(max_length=recherche.LONGUEUR_MOT)
+    tarif = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["mot", "tarif", "service"], name="services_mot_cle_mot_idx"),
+        ]
+
     def __str__(self):
-        return self.nom
\ No newline at end of file
+        return self.mot
+
+
+class VersionCatalogue(models.Model):
+    """
+    Version du catalogue des services (voir services.catalogue) : une seule ligne,
+    relue par tous les workers. Changée dans la transaction qui modifie les services,
+    elle devient visible de tous au moment de la validation.
+    """
+    jeton = models.CharField(max_length=12)
+
+    PK = 1
+
+    def __str__(self):
+        return self.jeton
+
+    @classmethod
+    def courante(cls):
+        jeton = cls.objects.filter(pk=cls.PK).values_list("jeton", flat=True).first()
+        if jeton is None:
+            jeton = cls.objects.get_or_create(pk=cls.PK, defaults={"jeton": cls.nouveau_jeton()})[0].jeton
+        return jeton
+
+    @classmethod
+    def changer(cls):
+        jeton = cls.nouveau_jeton()
+        if not cls.objects.filter(pk=cls.PK).update(jeton=jeton):
+            cls.objects.update_or_create(pk=cls.PK, defaults={"jeton": jeton})
+        return jeton
+
+    @staticmethod
+    def nouveau_jeton():
+        return uuid.uuid4().hex[:12]
@@ -0,0 +1,12 @@
+# services/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from services import catalogue
+from services.models import Service
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalider_catalogue(sender, instance, **kwargs):
+    catalogue.invalider()
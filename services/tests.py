@@ -1,3 +1,139 @@
-from django.test import TestCase
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from . import catalogue
+from .models import Service, VersionCatalogue
+from .views import ServiceCatalogueView, ServiceTypeaheadView
+
+urlpatterns = [
+    path("typeahead/", ServiceTypeaheadView.as_view()),
+    path("catalogue.json", ServiceCatalogueView.as_view()),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ServiceTypeaheadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = get_user_model().objects.create_user("vendeur", password="x")
+        cls.sponso = Service.objects.create(nom="Sponsorisation Facebook", reference="SPO-01", tarif=50000)
+        cls.visuel = Service.objects.create(nom="Visuel sponsorisé", reference="VIS-01", tarif=20000)
+        Service.objects.create(nom="Montage vidéo", reference="MON-01", tarif=80000)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.utilisateur)
+
+    def test_reference_avant_nom(self):
+        resultats = self.client.get("/typeahead/", {"q": "spo"}).json()["resultats"]
+        # SPO-01 par sa référence, VIS-01 parce que son nom contient « spo »
+        self.assertEqual([r["id"] for r in resultats], [self.sponso.pk, self.visuel.pk])
+        self.assertEqual(resultats[0]["tarif"], 50000)
+
+    def test_limite(self):
+        resultats = self.client.get("/typeahead/", {"limite": 2}).json()["resultats"]
+        self.assertEqual([r["libelle"] for r in resultats], ["MON-01", "SPO-01"])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class CatalogueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = get_user_model().objects.create_user("vendeur", password="x")
+        cls.service = Service.objects.create(nom="Rédaction", reference="RED-01", tarif=10000)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.utilisateur)
+
+    def test_version_changee_a_l_enregistrement_et_a_la_suppression(self):
+        version = catalogue.version()
+        self.assertEqual([s["reference"] for s in catalogue.services()], ["RED-01"])
+        with self.assertNumQueries(1):  # lecture de la version seulement
+            catalogue.services()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(nom="Montage", reference="MON-01", tarif=5000)
+        self.assertNotEqual(catalogue.version(), version)
+        self.assertEqual([s["reference"] for s in catalogue.services()], ["MON-01", "RED-01"])
+
+        version = catalogue.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.delete()
+        self.assertNotEqual(catalogue.version(), version)
+        self.assertEqual([s["reference"] for s in catalogue.services()], ["MON-01"])
+
+    def test_version_commune_aux_workers(self):
+        version = catalogue.version()
+        catalogue.services()
+        # Cache vidé (autre worker, LocMemCache propre à chaque processus) : même version
+        cache.clear()
+        self.assertEqual(catalogue.version(), version)
+
+        # Modification faite par un autre worker : seule la base est commune
+        Service.objects.filter(pk=self.service.pk).update(tarif=15000)
+        VersionCatalogue.changer()
+        self.assertNotEqual(catalogue.version(), version)
+        self.assertEqual(catalogue.services()[0]["tarif"], 15000)
+
+    def test_version_annulee_avec_la_transaction(self):
+        version = catalogue.version()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.service.tarif = 1
+            self.service.save()
+            Service.objects.create(nom="Doublon", reference="RED-01", tarif=1)
+        self.assertEqual(catalogue.version(), version)
+
+    def test_etag_et_304(self):
+        reponse = self.client.get("/catalogue.json")
+        self.assertEqual(reponse.json()[0]["tarif"], 10000)
+        etag = reponse["ETag"]
+        self.assertEqual(self.client.get("/catalogue.json", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.tarif = 12000
+            self.service.save()
+        reponse = self.client.get("/catalogue.json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()[0]["tarif"], 12000)
+
+
+class RechercheServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.creation = Service.objects.create(nom="Création visuel", reference="CRE-01", tarif=30000)
+        cls.sponso = Service.objects.create(nom="Sponsorisation Facebook", reference="SPO-01", tarif=50000)
+        cls.montage = Service.objects.create(nom="Montage vidéo créatif", reference="MON-01", tarif=80000)
+
+    def test_nom_sans_accents_par_prefixe_de_mot(self):
+        self.assertEqual(list(Service.rechercher("creation VIS")), [self.creation])
+        self.assertEqual(list(Service.rechercher("Créa")), [self.creation, self.montage])
+
+    def test_reference_insensible_a_la_casse_et_aux_separateurs(self):
+        self.assertEqual(self.sponso.cle_reference, "spo01")
+        self.assertEqual(list(Service.rechercher("spo01")), [self.sponso])
+        self.assertEqual(list(Service.rechercher("spo 0")), [self.sponso])
+
+    def test_fourchette_de_tarif(self):
+        self.assertEqual(list(Service.rechercher("crea", tarif_min=40000)), [self.montage])
+        self.assertEqual(list(Service.rechercher(tarif_max=50000)), [self.creation, self.sponso])
+
+    def test_index_mis_a_jour_au_renommage(self):
+        self.montage.nom = "Tournage"
+        self.montage.save()
+        self.assertEqual(list(Service.rechercher("crea")), [self.creation])
+        self.assertEqual(list(Service.rechercher("tourn")), [self.montage])
+
+    @skipUnless(connection.vendor == "sqlite", "plan de requête propre à SQLite")
+    def test_plan_utilise_les_index(self):
+        sql, params = Service.rechercher("crea", tarif_min=1000).query.sql_with_params()
+        with connection.cursor() as curseur:
+            curseur.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = " ".join(str(ligne[-1]) for ligne in curseur.fetchall())
+        self.assertIn("services_cle_reference_idx", plan)
+        self.assertIn("services_mot_cle_mot_idx", plan)
@@ -6,6 +6,8 @@ from .views import (
     ServiceUpdateView,
     ServiceDeleteView,
     ServiceDetailModalView,
+    ServiceTypeaheadView,
+    ServiceCatalogueView,
 )
 
 urlpatterns = [
@@ -15,4 +17,6 @@ urlpatterns = [
     path('services/ajout/', ServiceCreateView.as_view(), name='create_services'),
     path('services/<int:pk>/edit/', ServiceUpdateView.as_view(), name='service_edit'),     # ← slash final
     path('services/<int:pk>/delete/', ServiceDeleteView.as_view(), name='service_delete'), # ← slash final
+    path('typeahead/', ServiceTypeaheadView.as_view(), name='service_typeahead'),
+    path('catalogue.json', ServiceCatalogueView.as_view(), name='service_catalogue'),
 ]
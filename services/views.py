@@ -4,10 +4,14 @@ from django.views.generic import CreateView, ListView, View
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import QueryDict, JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.template.loader import render_to_string
 
+from common.filtres import FiltreEntier, FiltresMixin, FiltreTexte, SpecFiltres
+from common.typeahead import TypeaheadView
 from common.utils import is_admin
+from . import catalogue
 from .models import Service
 from .forms import ServiceForm
 
@@ -21,53 +25,45 @@ class AdminRequiredMixin(UserPassesTestMixin):
         return redirect("services")
 
 
-class AccueilView(LoginRequiredMixin, ListView):
+class ServiceFiltres(SpecFiltres):
+    q = FiltreTexte()
+    tarif_min = FiltreEntier("tarif", lookup="gte")
+    tarif_max = FiltreEntier("tarif", lookup="lte")
+
+
+class AccueilView(LoginRequiredMixin, FiltresMixin, ListView):
     model = Service
     template_name = "services/services.html"
     context_object_name = "services"
     paginate_by = 30
+    filtres_class = ServiceFiltres
 
     def _display_mode(self):
         mode = (self.request.GET.get("display") or "auto").strip().lower()
         return mode if mode in ("auto", "table", "cards") else "auto"
 
     def get_queryset(self):
-        qs = Service.objects.all().order_by("id")
-        q = (self.request.GET.get('q') or '').strip()
-        tmin = (self.request.GET.get('tarif_min') or '').strip()
-        tmax = (self.request.GET.get('tarif_max') or '').strip()
-        if q:
-            qs = qs.filter(nom__icontains=q)
-        if tmin:
-            try:
-                qs = qs.filter(tarif__gte=int(tmin))
-            except ValueError:
-                pass
-        if tmax:
-            try:
-                qs = qs.filter(tarif__lte=int(tmax))
-            except ValueError:
-                pass
+        filtres = self.get_filtres()
+        q = filtres["q"] or ""
+
+        # Référence / mots du nom et fourchette de tarif dans la même requête indexée
+        # (Service.rechercher, plutôt que filtres.filtrer sur Service.tarif)
+        qs = Service.rechercher(q, tarif_min=filtres["tarif_min"], tarif_max=filtres["tarif_max"])
+        if not q:
+            qs = qs.order_by("id")
         return qs
 
+    def get_extra_querystring(self):
+        return self.get_filtres().querystring(display=self._display_mode())
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        params = self.request.GET.copy()
-        clean = QueryDict(mutable=True)
-        for k, vals in params.lists():
-            vals = [v for v in vals if (v or '').strip()]
-            if vals and k != "page":
-                clean.setlist(k, vals)
-        display_mode = self._display_mode()
-        if clean.get('display') != display_mode:
-            clean = clean.copy()
-            clean['display'] = display_mode
+        filtres = self.get_filtres()
         ctx.update({
-            "query": self.request.GET.get("q", ""),
-            "tarif_min": self.request.GET.get("tarif_min"),
-            "tarif_max": self.request.GET.get("tarif_max"),
-            "display_mode": display_mode,
-            "extra_querystring": f"&{clean.urlencode()}" if clean else "",
+            "query": filtres.donnees["q"],
+            "tarif_min": filtres.donnees["tarif_min"],
+            "tarif_max": filtres.donnees["tarif_max"],
+            "display_mode": self._display_mode(),
             "is_admin": is_admin(self.request.user),
         })
         return ctx
@@ -126,3 +122,43 @@ class ServiceDeleteView(LoginRequiredMixin, AdminRequiredMixin, View):
         service.delete()
         messages.success(request, "Service supprimé avec succès.")
         return redirect("services")
+
+
+class ServiceTypeaheadView(TypeaheadView):
+    model = Service
+
+    def version_cache(self):
+        # Un service modifié ou supprimé n'est plus servi par le cache des réponses
+        return catalogue.version()
+
+    def rechercher(self, saisie):
+        return Service.rechercher(saisie)
+
+    def serialiser(self, service):
+        return {
+            "id": service.pk,
+            "libelle": service.reference,
+            "detail": f"{service.nom} — {service.tarif} Ar",
+            "nom": service.nom,
+            "tarif": service.tarif,
+        }
+
+
+class ServiceCatalogueView(LoginRequiredMixin, View):
+    """
+    Catalogue complet en JSON (id, reference, nom, tarif), servi depuis services.catalogue.
+    L'ETag est la version du catalogue : tant qu'aucun service n'a changé, le navigateur
+    (et le service worker) revalident et reçoivent un 304 sans corps.
+    """
+
+    def get(self, request, *args, **kwargs):
+        version, contenu = catalogue.catalogue_json()
+        etag = catalogue.etag(version)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = HttpResponse(contenu, content_type="application/json")
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
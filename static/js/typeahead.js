@@ -0,0 +1,199 @@
+// static/js/typeahead.js
+// Sélecteurs à autocomplétion (clients, services) : les options sont chargées à la
+// demande depuis les points d'accès JSON (common/typeahead.py) au lieu d'être toutes
+// rendues dans un <select>.
+//
+//   <div data-typeahead data-url="{% url 'entreprise_typeahead' %}" data-name="client_id"
+//        data-id="client_id" data-value="12" data-label="SARL Exemple"
+//        data-placeholder="Rechercher un client" data-required></div>
+//
+// Le champ caché (name/id donnés) reçoit l'id choisi et déclenche « change » ; l'élément
+// racine émet « typeahead:choisi » avec l'objet JSON complet dans event.detail.
+//
+// Avec data-catalogue="{% url 'service_catalogue' %}" (au lieu de data-url), le catalogue
+// complet est chargé une fois par page et filtré localement ; le navigateur le revalide
+// par ETag et ne le retélécharge que si sa version a changé.
+(function () {
+  const DELAI_MS = 200;
+  const LIMITE = 20;
+  const catalogues = {};
+
+  const replier = (texte) =>
+    String(texte || "").normalize("NFD").replace(/[\u0300-\u036f]/g, "").toLowerCase().trim();
+  const mots = (texte) => replier(texte).match(/[a-z0-9]+/g) || [];
+
+  function chargerCatalogue(url) {
+    if (!catalogues[url]) {
+      // no-cache : requête conditionnelle (If-None-Match), 304 si la version n'a pas changé
+      catalogues[url] = fetch(url, { cache: "no-cache", credentials: "same-origin" })
+        .then((r) => { if (!r.ok) throw new Error(r.status); return r.json(); })
+        .then((services) => services.map((s) => ({
+          id: s.id,
+          libelle: s.reference,
+          detail: `${s.nom} — ${s.tarif} Ar`,
+          nom: s.nom,
+          tarif: s.tarif,
+          cle_reference: mots(s.reference).join(""),
+          mots_nom: mots(s.nom),
+        })))
+        .catch((e) => { delete catalogues[url]; throw e; });
+    }
+    return catalogues[url];
+  }
+
+  // Même règle que Service.rechercher : référence commençant par la saisie, sinon chaque
+  // terme commence un mot du nom
+  function filtrerCatalogue(services, q) {
+    const termes = mots(q);
+    if (!termes.length) return services.slice(0, LIMITE);
+    const reference = termes.join("");
+    const parReference = services.filter((s) => s.cle_reference.startsWith(reference));
+    const parNom = services.filter((s) => !s.cle_reference.startsWith(reference)
+      && termes.every((t) => s.mots_nom.some((m) => m.startsWith(t))));
+    return parReference.concat(parNom).slice(0, LIMITE);
+  }
+
+  function initialiser(racine) {
+    if (racine.dataset.typeaheadPret) return;
+    racine.dataset.typeaheadPret = "1";
+    racine.classList.add("position-relative");
+
+    const requis = racine.hasAttribute("data-required");
+    const saisie = document.createElement("input");
+    saisie.type = "search";
+    saisie.className = "form-control";
+    saisie.autocomplete = "off";
+    saisie.placeholder = racine.dataset.placeholder || "Rechercher…";
+    saisie.value = racine.dataset.label || "";
+
+    const cache = document.createElement("input");
+    cache.type = "hidden";
+    cache.name = racine.dataset.name;
+    if (racine.dataset.id) cache.id = racine.dataset.id;
+    cache.value = racine.dataset.value || "";
+
+    const liste = document.createElement("div");
+    liste.className = "dropdown-menu w-100 shadow-sm";
+    liste.style.maxHeight = "18rem";
+    liste.style.overflowY = "auto";
+
+    racine.append(saisie, cache, liste);
+
+    let minuteur = null;
+    let controleur = null;
+    let resultats = [];
+    let actif = -1;
+
+    function valider() {
+      saisie.setCustomValidity(requis && !cache.value ? "Choisissez une valeur dans la liste." : "");
+    }
+
+    function fermer() {
+      liste.classList.remove("show");
+      actif = -1;
+    }
+
+    function surligner() {
+      liste.querySelectorAll(".dropdown-item").forEach((el, i) => el.classList.toggle("active", i === actif));
+    }
+
+    function afficher(donnees) {
+      resultats = donnees;
+      actif = -1;
+      liste.replaceChildren();
+      if (!resultats.length) {
+        const vide = document.createElement("span");
+        vide.className = "dropdown-item-text text-muted small";
+        vide.textContent = "Aucun résultat";
+        liste.append(vide);
+      }
+      resultats.forEach((item, i) => {
+        const bouton = document.createElement("button");
+        bouton.type = "button";
+        bouton.className = "dropdown-item";
+        const libelle = document.createElement("div");
+        libelle.textContent = item.libelle;
+        bouton.append(libelle);
+        if (item.detail) {
+          const detail = document.createElement("div");
+          detail.className = "small text-muted";
+          detail.textContent = item.detail;
+          bouton.append(detail);
+        }
+        // mousedown : avant le blur du champ de saisie
+        bouton.addEventListener("mousedown", (e) => { e.preventDefault(); choisir(item); });
+        liste.append(bouton);
+      });
+      liste.classList.add("show");
+    }
+
+    function charger(q) {
+      if (racine.dataset.catalogue) {
+        chargerCatalogue(racine.dataset.catalogue)
+          .then((services) => { if (saisie.value.trim() === q || cache.value) afficher(filtrerCatalogue(services, q)); })
+          .catch(() => {});
+        return;
+      }
+      if (controleur) controleur.abort();
+      controleur = new AbortController();
+      const params = new URLSearchParams({ q: q, limite: LIMITE });
+      fetch(`${racine.dataset.url}?${params}`, {
+        signal: controleur.signal,
+        headers: { "X-Requested-With": "XMLHttpRequest" },
+      })
+        .then((r) => { if (!r.ok) throw new Error(r.status); return r.json(); })
+        .then((data) => afficher(data.resultats || []))
+        .catch(() => {});
+    }
+
+    function choisir(item) {
+      cache.value = item ? item.id : "";
+      saisie.value = item ? item.libelle : "";
+      racine.element = item;
+      valider();
+      fermer();
+      cache.dispatchEvent(new Event("change", { bubbles: true }));
+      racine.dispatchEvent(new CustomEvent("typeahead:choisi", { detail: item, bubbles: true }));
+    }
+
+    saisie.addEventListener("input", () => {
+      if (cache.value) {
+        cache.value = "";
+        racine.element = null;
+        // Champ vidé : le filtre est retiré
+        if (!saisie.value.trim()) cache.dispatchEvent(new Event("change", { bubbles: true }));
+      }
+      valider();
+      clearTimeout(minuteur);
+      minuteur = setTimeout(() => charger(saisie.value.trim()), DELAI_MS);
+    });
+    // Valeur déjà choisie : on propose toute la liste plutôt que le seul libellé courant
+    saisie.addEventListener("focus", () => charger(cache.value ? "" : saisie.value.trim()));
+    saisie.addEventListener("blur", () => setTimeout(fermer, 150));
+    saisie.addEventListener("keydown", (e) => {
+      if (!liste.classList.contains("show")) return;
+      if (e.key === "ArrowDown" || e.key === "ArrowUp") {
+        e.preventDefault();
+        const n = resultats.length;
+        if (!n) return;
+        actif = e.key === "ArrowDown" ? (actif + 1) % n : (actif - 1 + n) % n;
+        surligner();
+      } else if (e.key === "Enter" && actif >= 0) {
+        e.preventDefault();
+        choisir(resultats[actif]);
+      } else if (e.key === "Escape") {
+        fermer();
+      }
+    });
+    // Le « change » natif du champ de saisie ne doit pas soumettre les filtres HTMX
+    saisie.addEventListener("change", (e) => e.stopPropagation());
+
+    valider();
+  }
+
+  window.initialiserTypeaheads = function (conteneur) {
+    (conteneur || document).querySelectorAll("[data-typeahead]").forEach(initialiser);
+  };
+
+  document.addEventListener("DOMContentLoaded", () => window.initialiserTypeaheads());
+})();
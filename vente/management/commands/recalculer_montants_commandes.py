@@ -0,0 +1,62 @@
+# vente/management/commands/recalculer_montants_commandes.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from vente.models import Commande, montant_lignes_subquery
+
+
+class Command(BaseCommand):
+    help = (
+        "Vérifie et reconstruit Commande.montant_total à partir des lignes, "
+        "par lots de commandes (parcours par id)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lot", type=int, default=1000,
+            help="Nombre de commandes traitées par lot (défaut : 1000).",
+        )
+        parser.add_argument(
+            "--verifier", action="store_true",
+            help="Signale les écarts sans rien corriger.",
+        )
+
+    def handle(self, *args, **options):
+        taille_lot = max(1, options["lot"])
+        verifier = options["verifier"]
+
+        dernier_id = 0
+        nb_commandes = 0
+        ecarts = 0
+        while True:
+            ids = list(
+                Commande.objects.filter(pk__gt=dernier_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:taille_lot]
+            )
+            if not ids:
+                break
+            dernier_id = ids[-1]
+            nb_commandes += len(ids)
+
+            with transaction.atomic():
+                incorrectes = list(
+                    Commande.objects.filter(pk__in=ids)
+                    .annotate(montant_calcule=montant_lignes_subquery())
+                    .exclude(montant_total=F("montant_calcule"))
+                    .values_list("pk", "numero_proforma", "montant_total", "montant_calcule")
+                )
+                ecarts += len(incorrectes)
+                for pk, numero, stocke, calcule in incorrectes:
+                    self.stdout.write(f"  {numero} (id={pk}) : stocké={stocke} calculé={calcule}")
+                if incorrectes and not verifier:
+                    Commande.recalculer_montants(pk for pk, *_ in incorrectes)
+
+        if verifier:
+            style = self.style.WARNING if ecarts else self.style.SUCCESS
+            self.stdout.write(style(f"{nb_commandes} commande(s) vérifiée(s), {ecarts} écart(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{nb_commandes} commande(s) vérifiée(s), {ecarts} corrigée(s)."
+            ))
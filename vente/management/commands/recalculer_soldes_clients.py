@@ -0,0 +1,78 @@
+# vente/management/commands/recalculer_soldes_clients.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from clients.models import Entreprise
+from vente.models import SoldeClient
+
+
+class Command(BaseCommand):
+    help = (
+        "Vérifie et reconstruit les soldes clients (SoldeClient) à partir des commandes "
+        "et des encaissements, par lots de clients (parcours par id)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lot", type=int, default=500,
+            help="Nombre de clients traités par lot (défaut : 500).",
+        )
+        parser.add_argument(
+            "--verifier", action="store_true",
+            help="Signale les écarts sans rien corriger.",
+        )
+
+    def handle(self, *args, **options):
+        taille_lot = max(1, options["lot"])
+        verifier = options["verifier"]
+        champs = SoldeClient.CHAMPS_CALCULES
+        vide = {c: SoldeClient._meta.get_field(c).get_default() for c in champs}
+
+        dernier_id = 0
+        nb_clients = 0
+        ecarts = 0
+        while True:
+            ids = list(
+                Entreprise.objects.filter(pk__gt=dernier_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:taille_lot]
+            )
+            if not ids:
+                break
+            dernier_id = ids[-1]
+            nb_clients += len(ids)
+
+            with transaction.atomic():
+                calcules = {
+                    e["pk"]: e for e in
+                    Entreprise.objects.filter(pk__in=ids)
+                    .annotate(**{f"calcule_{c}": v for c, v in SoldeClient.valeurs_calculees("pk").items()})
+                    .values("pk", "raison_sociale", *(f"calcule_{c}" for c in champs))
+                }
+                stockes = {
+                    s["entreprise_id"]: s
+                    for s in SoldeClient.objects.filter(entreprise_id__in=ids).values("entreprise_id", *champs)
+                }
+                incorrects = []
+                for pk, calcule in calcules.items():
+                    # Client sans solde enregistré : équivalent à un solde vide
+                    stocke = stockes.get(pk) or vide
+                    differences = [
+                        f"{c} stocké={stocke[c]} calculé={calcule[f'calcule_{c}']}"
+                        for c in champs
+                        if stocke[c] != calcule[f"calcule_{c}"]
+                    ]
+                    if differences:
+                        incorrects.append(pk)
+                        self.stdout.write(f"  {calcule['raison_sociale']} (id={pk}) : {', '.join(differences)}")
+                ecarts += len(incorrects)
+                if incorrects and not verifier:
+                    SoldeClient.recalculer(incorrects)
+
+        if verifier:
+            style = self.style.WARNING if ecarts else self.style.SUCCESS
+            self.stdout.write(style(f"{nb_clients} client(s) vérifié(s), {ecarts} écart(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{nb_clients} client(s) vérifié(s), {ecarts} corrigé(s)."
+            ))
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:25
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def remplir_montant_total(apps, schema_editor):
+    Commande = apps.get_model('vente', 'Commande')
+    LigneCommande = apps.get_model('vente', 'LigneCommande')
+    lignes = (
+        LigneCommande.objects
+        .filter(commande_id=OuterRef('pk'))
+        .order_by()
+        .values('commande_id')
+        .annotate(total=Sum(F('tarif') * F('quantite')))
+        .values('total')[:1]
+    )
+    Commande.objects.update(
+        montant_total=Coalesce(Subquery(lignes), 0, output_field=models.PositiveIntegerField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vente', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='montant_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(remplir_montant_total, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:35
+
+import datetime
+import re
+
+from django.db import migrations
+
+NUMERO_RE = re.compile(r"^([A-Z]+)(\d{6})-(\d+)$")
+
+
+def initialiser_compteurs(apps, schema_editor):
+    """Reprend le plus grand numéro existant par (préfixe, jour) pour les proformas et factures."""
+    Commande = apps.get_model('vente', 'Commande')
+    Vente = apps.get_model('vente', 'Vente')
+    CompteurDocument = apps.get_model('common', 'CompteurDocument')
+
+    maximums = {}
+    numeros = list(Commande.objects.values_list('numero_proforma', flat=True))
+    numeros += list(Vente.objects.exclude(numero_facture=None).values_list('numero_facture', flat=True))
+    for numero in numeros:
+        m = NUMERO_RE.match(numero or "")
+        if not m:
+            continue
+        prefixe, date_str, n = m.group(1), m.group(2), int(m.group(3))
+        try:
+            jour = datetime.datetime.strptime(date_str, "%y%m%d").date()
+        except ValueError:
+            continue
+        cle = (prefixe, jour)
+        maximums[cle] = max(maximums.get(cle, 0), n)
+
+    for (prefixe, jour), dernier in maximums.items():
+        CompteurDocument.objects.update_or_create(
+            prefixe=prefixe, jour=jour, defaults={'dernier_numero': dernier}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0007_compteurdocument'),
+        ('vente', '0004_commande_montant_total'),
+    ]
+
+    operations = [
+        migrations.RunPython(initialiser_compteurs, migrations.RunPython.noop),
+    ]
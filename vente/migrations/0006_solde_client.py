@@ -0,0 +1,72 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db.models import Count, Max, Sum
+
+# Copie figée de vente.models.STATUTS_EXCLUS_DU_TOTAL
+STATUTS_EXCLUS_DU_TOTAL = ("Annulée", "Supprimée")
+
+
+def initialiser_soldes(apps, schema_editor):
+    Commande = apps.get_model('vente', 'Commande')
+    Vente = apps.get_model('vente', 'Vente')
+    SoldeClient = apps.get_model('vente', 'SoldeClient')
+
+    soldes = {}
+    commandes = (
+        Commande.objects.exclude(statut_vente__in=STATUTS_EXCLUS_DU_TOTAL)
+        .values("client_id")
+        .annotate(nombre=Count("pk"), montant=Sum("montant_total"), derniere=Max("date_commande"))
+        .order_by()
+    )
+    for g in commandes:
+        soldes[g["client_id"]] = SoldeClient(
+            entreprise_id=g["client_id"],
+            nombre_commandes=g["nombre"],
+            montant_commande=g["montant"] or 0,
+            derniere_activite=g["derniere"],
+        )
+    ventes = (
+        Vente.objects.exclude(commande__statut_vente__in=STATUTS_EXCLUS_DU_TOTAL)
+        .values("commande__client_id")
+        .annotate(montant=Sum("montant"), derniere=Max("date_encaissement"))
+        .order_by()
+    )
+    for g in ventes:
+        solde = soldes[g["commande__client_id"]]
+        solde.montant_paye = g["montant"] or 0
+        if g["derniere"] and (solde.derniere_activite is None or g["derniere"] > solde.derniere_activite):
+            solde.derniere_activite = g["derniere"]
+    for solde in soldes.values():
+        solde.reste_a_payer = solde.montant_commande - solde.montant_paye
+    SoldeClient.objects.bulk_create(soldes.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0003_recherche_entreprise'),
+        ('vente', '0005_initialiser_compteurs_documents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SoldeClient',
+            fields=[
+                ('entreprise', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='solde', serialize=False, to='clients.entreprise')),
+                ('nombre_commandes', models.PositiveIntegerField(default=0)),
+                ('montant_commande', models.PositiveBigIntegerField(default=0)),
+                ('montant_paye', models.PositiveBigIntegerField(default=0)),
+                ('reste_a_payer', models.BigIntegerField(default=0)),
+                ('derniere_activite', models.DateField(blank=True, null=True)),
+                ('mis_a_jour', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['client', 'date_commande', 'id'], name='vente_commande_client_date_idx'),
+        ),
+        migrations.RunPython(initialiser_soldes, migrations.RunPython.noop),
+    ]
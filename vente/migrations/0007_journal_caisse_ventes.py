@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:00
+
+from django.db import migrations
+from django.db.models import Q, Sum
+
+
+def journaliser_ventes(apps, schema_editor):
+    """Une écriture ENTREE par vente existante, puis cumuls des caisses recalculés."""
+    Vente = apps.get_model('vente', 'Vente')
+    Caisse = apps.get_model('common', 'Caisse')
+    MouvementCaisse = apps.get_model('common', 'MouvementCaisse')
+
+    lot = []
+    ventes = Vente.objects.order_by("pk").values_list(
+        "paiement_id", "date_encaissement", "montant", "numero_facture", "created_by_id"
+    )
+    for caisse_id, date, montant, numero, auteur in ventes.iterator(chunk_size=1000):
+        if not montant:
+            continue
+        lot.append(MouvementCaisse(
+            caisse_id=caisse_id, date=date, sens="ENTREE", montant=montant,
+            piece=numero or "", libelle=f"Encaissement {numero or ''}", created_by_id=auteur,
+        ))
+        if len(lot) >= 5000:
+            MouvementCaisse.objects.bulk_create(lot)
+            lot = []
+    MouvementCaisse.objects.bulk_create(lot)
+
+    for caisse in Caisse.objects.all():
+        totaux = MouvementCaisse.objects.filter(caisse_id=caisse.pk).aggregate(
+            entree=Sum("montant", filter=Q(sens="ENTREE")),
+            sortie=Sum("montant", filter=Q(sens="SORTIE")),
+        )
+        entree, sortie = totaux["entree"] or 0, totaux["sortie"] or 0
+        Caisse.objects.filter(pk=caisse.pk).update(
+            entree=entree, sortie=sortie, solde=caisse.solde_initial + entree - sortie,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0008_journal_caisse'),
+        ('vente', '0006_solde_client'),
+    ]
+
+    operations = [
+        migrations.RunPython(journaliser_ventes, migrations.RunPython.noop),
+    ]
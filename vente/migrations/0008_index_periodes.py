@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vente', '0007_journal_caisse_ventes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['statut_vente', 'date_commande'], name='vente_commande_statut_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vente',
+            index=models.Index(fields=['paiement', 'date_encaissement'], name='vente_vente_paiement_date_idx'),
+        ),
+    ]
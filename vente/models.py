@@ -1,15 +1,21 @@
 from django.db import models
 from django.db import models, transaction, IntegrityError
-import time
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
 
 from django.utils import timezone 
 from clients.models import Entreprise
-from common.models import Pages, Caisse
+from common.models import Pages, Caisse, CompteurDocument, MouvementCaisse
 from common.constants import ETAT_CHOIX
 from common.mixins import AuditMixin 
 from services.models import Service
 
+# Statuts exclus des totaux « chiffre d'affaires » (comme l'ancien total de VenteView)
+STATUTS_EXCLUS_DU_TOTAL = ("Annulée", "Supprimée")
+
 class Commande(AuditMixin):   
+    PREFIXE_NUMERO = "P"
+
     numero_proforma = models.CharField(max_length=20, unique=True, editable=False)
     date_commande = models.DateField(default=timezone.now)
     client = models.ForeignKey(Entreprise, on_delete=models.CASCADE)
@@ -17,31 +23,92 @@ class Commande(AuditMixin):
     remarque = models.TextField(blank=True, null=True)
     
     statut_vente = models.CharField(max_length=20, choices=ETAT_CHOIX, default='En attente')
+
+    # Somme des lignes (tarif x quantite), tenue à jour par LigneCommande
+    montant_total = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Relevé client : commandes d'un client parcourues par (date, id) ;
+            # sert aussi aux filtres client + période des listes
+            models.Index(fields=["client", "date_commande", "id"], name="vente_commande_client_date_idx"),
+            # Listes filtrées par statut et période (encaissement, facturation, ventes)
+            models.Index(fields=["statut_vente", "date_commande"], name="vente_commande_statut_date_idx"),
+        ]
     
     def __str__(self):
         return f"Proforma {self.numero_proforma} - {self.client.raison_sociale}"
     
     @property
     def montant_commande(self):
-        return sum(ligne.montant() for ligne in self.lignes_commandes.all()) 
+        return self.montant_total
+
+    @classmethod
+    def recalculer_montants(cls, commande_ids):
+        """
+        Recalcule montant_total pour les commandes données en une seule requête
+        UPDATE (sous-requête SUM sur les lignes). Retourne le nombre de commandes mises à jour.
+        """
+        ids = {pk for pk in commande_ids if pk}
+        if not ids:
+            return 0
+        with transaction.atomic():
+            lignes = cls.objects.filter(pk__in=ids).update(
+                montant_total=montant_lignes_subquery(),
+                updated_at=timezone.now(),
+            )
+            SoldeClient.recalculer(
+                cls.objects.filter(pk__in=ids).values_list("client_id", flat=True).distinct()
+            )
+        return lignes
+
+    def recalculer_montant(self):
+        """Recalcule le total de cette commande et rafraîchit l'instance."""
+        self.__class__.recalculer_montants([self.pk])
+        self.refresh_from_db(fields=["montant_total", "updated_at"])
+        return self.montant_total
  
     def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # montant_total n'est écrit que par recalculer_montants() : une instance
+            # chargée avant une modification des lignes ne doit pas l'écraser.
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != "montant_total"
+            ]
+        # Client d'origine : son solde doit aussi être corrigé si la commande change de client
+        clients = {self.client_id}
+        if not self._state.adding:
+            clients.update(Commande.objects.filter(pk=self.pk).values_list("client_id", flat=True))
         max_attempts = 5
         for attempt in range(max_attempts):
-            if not self.numero_proforma:
+            genere = not self.numero_proforma
+            if genere:
                 self.numero_proforma = self.__class__.generer_numero_proforma_atomic()
             try:
-                super().save(*args, **kwargs)
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                    SoldeClient.recalculer(clients)
                 break  # Success
-            except IntegrityError as e:
-                if "Duplicate entry" in str(e):
-                    time.sleep(0.1)  # backoff léger
-                    self.numero_proforma = None  # forcer la régénération
-                    continue
-                raise
+            except IntegrityError:
+                # Numéro déjà pris (pièce saisie avant le compteur) : on en alloue un autre
+                if not genere or not self.__class__.objects.filter(numero_proforma=self.numero_proforma).exists():
+                    raise
+                self.numero_proforma = None
         else:
             raise IntegrityError("Impossible de générer un numero_proforma unique après plusieurs tentatives")
 
+    def delete(self, *args, **kwargs):
+        client_id = self.client_id
+        with transaction.atomic():
+            # La suppression en cascade de la vente ne passe pas par Vente.delete()
+            annulations = [vente.mouvement(MouvementCaisse.SORTIE) for vente in Vente.objects.filter(commande_id=self.pk)]
+            result = super().delete(*args, **kwargs)
+            SoldeClient.recalculer([client_id])
+            # Journal de caisse en dernier : verrou de la caisse tenu le moins longtemps
+            MouvementCaisse.enregistrer(annulations)
+        return result
+
     # Désactiver la modification selon les statuts 
     def actions_desactivees(self):
         return (
@@ -51,39 +118,116 @@ class Commande(AuditMixin):
     
     @classmethod
     def generer_numero_proforma_atomic(cls):
-        with transaction.atomic():
-            prefix = "P"
-            date_str = timezone.now().strftime("%y%m%d")
-
-            last_commande = (
-                cls.objects
-                .select_for_update()
-                .filter(numero_proforma__startswith=f"{prefix}{date_str}")
-                .order_by('-numero_proforma')
-                .first()
-            )
+        return CompteurDocument.generer_numeros(cls.PREFIXE_NUMERO)[0]
+
+
+class LigneCommandeQuerySet(models.QuerySet):
+    """
+    Les écritures en masse ne passent pas par save()/delete() :
+    on recalcule ici le montant_total des commandes concernées.
+    """
+    CHAMPS_MONTANT = {"commande", "commande_id", "tarif", "quantite"}
+
+    def _commande_ids(self):
+        return set(self.values_list("commande_id", flat=True))
+
+    def sans_recalcul(self):
+        """
+        Même sélection, écritures en masse sans recalcul : pour enchaîner plusieurs
+        écritures puis appeler Commande.recalculer_montants une seule fois.
+        """
+        return models.QuerySet(self.model, query=self.query.chain(), using=self._db)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            Commande.recalculer_montants({obj.commande_id for obj in objs})
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            ids = set()
+            if self.CHAMPS_MONTANT.intersection(fields):
+                # Une ligne déplacée doit aussi corriger son ancienne commande
+                ids = set(
+                    self.model.objects.filter(pk__in=[obj.pk for obj in objs])
+                    .values_list("commande_id", flat=True)
+                )
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            if ids:
+                Commande.recalculer_montants(ids | {obj.commande_id for obj in objs})
+        return rows
+
+    def update(self, **kwargs):
+        if not self.CHAMPS_MONTANT.intersection(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            ids = self._commande_ids()
+            rows = super().update(**kwargs)
+            nouvelle = kwargs.get("commande_id", kwargs.get("commande"))
+            if nouvelle is not None:
+                ids.add(getattr(nouvelle, "pk", nouvelle))
+            Commande.recalculer_montants(ids)
+        return rows
+
+    update.alters_data = True
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            ids = self._commande_ids()
+            result = super().delete()
+            Commande.recalculer_montants(ids)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
-            if last_commande:
-                last_number = int(last_commande.numero_proforma.split("-")[-1])
-            else:
-                last_number = 0
 
-            new_number = last_number + 1
-            return f"{prefix}{date_str}-{new_number:03d}"
-        
 class LigneCommande(AuditMixin):
     commande = models.ForeignKey(Commande, on_delete=models.CASCADE, related_name="lignes_commandes")
     service = models.ForeignKey(Service, on_delete=models.PROTECT, related_name="lignes_commandes")
     tarif = models.PositiveIntegerField()
     quantite = models.PositiveIntegerField()
 
+    objects = LigneCommandeQuerySet.as_manager()
+
     def montant(self):
         return self.tarif * self.quantite
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Commande.recalculer_montants([self.commande_id])
+
+    def delete(self, *args, **kwargs):
+        commande_id = self.commande_id
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Commande.recalculer_montants([commande_id])
+        return result
+
     def __str__(self):
         return f"{self.service.nom} x {self.quantite}"
+
+
+def montant_lignes_subquery(outer_ref="pk"):
+    """Expression SQL : SUM(tarif * quantite) des lignes de la commande référencée."""
+    lignes = (
+        LigneCommande.objects
+        .filter(commande_id=OuterRef(outer_ref))
+        .order_by()
+        .values("commande_id")
+        .annotate(total=Sum(F("tarif") * F("quantite")))
+        .values("total")[:1]
+    )
+    return Coalesce(Subquery(lignes), 0, output_field=models.PositiveIntegerField())
+
     
 class Vente(AuditMixin):
+    PREFIXE_NUMERO = "F"
+
     commande = models.OneToOneField(Commande, on_delete=models.CASCADE, related_name='vente')
     numero_facture = models.CharField(max_length=20, unique=True, editable=False, null=True, blank=True,)
     date_encaissement = models.DateField(default=timezone.now)
@@ -91,44 +235,162 @@ class Vente(AuditMixin):
     reference = models.CharField(max_length=50, blank=True, null=True)
     montant = models.PositiveIntegerField()
 
+    class Meta:
+        indexes = [
+            # Encaissements d'une caisse sur une période (liste, clôtures)
+            models.Index(fields=["paiement", "date_encaissement"], name="vente_vente_paiement_date_idx"),
+        ]
+
     def __str__(self):
         return f"Facture {self.numero_facture} - {self.montant} Ar"
 
-    def save(self, *args, **kwargs):
+    def mouvement(self, sens=MouvementCaisse.ENTREE):
+        """Écriture de caisse de cet encaissement (SORTIE : son annulation)."""
+        numero = self.numero_facture or ""
+        return MouvementCaisse(
+            caisse_id=self.paiement_id,
+            date=self.date_encaissement,
+            sens=sens,
+            montant=self.montant,
+            piece=numero,
+            libelle=f"Encaissement {numero}" if sens == MouvementCaisse.ENTREE else f"Annulation encaissement {numero}",
+            created_by_id=self.updated_by_id or self.created_by_id,
+        )
+
+    def mouvements_modification(self, ancienne):
+        """Écritures à passer pour un encaissement nouveau (ancienne=None) ou modifié."""
+        if ancienne is None:
+            return [self.mouvement()]
+        date = self._meta.get_field("date_encaissement").to_python(self.date_encaissement)
+        if (ancienne.paiement_id, ancienne.montant, ancienne.date_encaissement) == (self.paiement_id, self.montant, date):
+            return []
+        return [ancienne.mouvement(MouvementCaisse.SORTIE), self.mouvement()]
+
+    def save(self, *args, journaliser=True, **kwargs):
+        """
+        journaliser=False (création seulement) : l'appelant passe lui-même
+        MouvementCaisse.enregistrer([vente.mouvement()]) en dernière écriture de sa
+        transaction, après ses autres mises à jour.
+        """
+        ancienne = None
+        if not self._state.adding:
+            ancienne = Vente.objects.filter(pk=self.pk).only(
+                "paiement_id", "montant", "date_encaissement", "numero_facture", "created_by_id", "updated_by_id"
+            ).first()
         max_attempts = 5
         for attempt in range(max_attempts):
-            if not self.numero_facture:
+            genere = not self.numero_facture
+            if genere:
                 self.numero_facture = self.__class__.generer_numero_facture_atomic()
             try:
-                super().save(*args, **kwargs)
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                    SoldeClient.recalculer(
+                        Commande.objects.filter(pk=self.commande_id).values_list("client_id", flat=True)
+                    )
+                    # Journal de caisse en dernier : verrou de la caisse tenu le moins longtemps
+                    if journaliser or ancienne is not None:
+                        MouvementCaisse.enregistrer(self.mouvements_modification(ancienne))
                 break
-            except IntegrityError as e:
-                if "Duplicate entry" in str(e):
-                    time.sleep(0.1)
-                    self.numero_facture = None
-                    continue
-                raise
+            except IntegrityError:
+                if not genere or not self.__class__.objects.filter(numero_facture=self.numero_facture).exists():
+                    raise
+                self.numero_facture = None
         else:
             raise IntegrityError("Impossible de générer un numero_facture unique après plusieurs tentatives")
 
-    @classmethod
-    def generer_numero_facture_atomic(cls):
+    def delete(self, *args, **kwargs):
+        commande_id = self.commande_id
         with transaction.atomic():
-            prefix = "F"
-            date_str = timezone.now().strftime("%y%m%d")
-
-            last_vente = (
-                cls.objects
-                .select_for_update()
-                .filter(numero_facture__startswith=f"{prefix}{date_str}")
-                .order_by('-numero_facture')
-                .first()
+            result = super().delete(*args, **kwargs)
+            SoldeClient.recalculer(
+                Commande.objects.filter(pk=commande_id).values_list("client_id", flat=True)
             )
+            MouvementCaisse.enregistrer([self.mouvement(MouvementCaisse.SORTIE)])
+        return result
 
-            if last_vente:
-                last_number = int(last_vente.numero_facture.split("-")[-1])
-            else:
-                last_number = 0
+    @classmethod
+    def generer_numero_facture_atomic(cls):
+        return CompteurDocument.generer_numeros(cls.PREFIXE_NUMERO)[0]
 
-            new_number = last_number + 1
-            return f"{prefix}{date_str}-{new_number:03d}"
+    @classmethod
+    def generer_numeros_facture(cls, nombre):
+        """Réserve un bloc de numéros consécutifs (traitements en masse)."""
+        return CompteurDocument.generer_numeros(cls.PREFIXE_NUMERO, nombre)
+
+
+class SoldeClient(models.Model):
+    """
+    Totaux d'un client, tenus à jour à chaque modification de ses commandes,
+    de leurs lignes ou de leurs encaissements (voir recalculer).
+    Les commandes « Annulée » / « Supprimée » ne comptent pas.
+    """
+    entreprise = models.OneToOneField(Entreprise, on_delete=models.CASCADE, primary_key=True, related_name="solde")
+    nombre_commandes = models.PositiveIntegerField(default=0)
+    montant_commande = models.PositiveBigIntegerField(default=0)
+    montant_paye = models.PositiveBigIntegerField(default=0)
+    reste_a_payer = models.BigIntegerField(default=0)
+    derniere_activite = models.DateField(null=True, blank=True)
+    mis_a_jour = models.DateTimeField(default=timezone.now)
+
+    CHAMPS_CALCULES = ("nombre_commandes", "montant_commande", "montant_paye", "reste_a_payer", "derniere_activite")
+
+    def __str__(self):
+        return f"Solde {self.entreprise_id} : {self.reste_a_payer} Ar"
+
+    @staticmethod
+    def valeurs_calculees(outer_ref="entreprise_id"):
+        """
+        Expressions SQL des champs calculés pour le client référencé (sous-requêtes
+        GROUP BY client sur les commandes retenues et leurs ventes).
+        """
+        commandes = (
+            Commande.objects
+            .filter(client_id=OuterRef(outer_ref))
+            .exclude(statut_vente__in=STATUTS_EXCLUS_DU_TOTAL)
+            .order_by()
+            .values("client_id")
+        )
+        ventes = (
+            Vente.objects
+            .filter(commande__client_id=OuterRef(outer_ref))
+            .exclude(commande__statut_vente__in=STATUTS_EXCLUS_DU_TOTAL)
+            .order_by()
+            .values("commande__client_id")
+        )
+
+        def agreger(qs, expression, champ):
+            return Coalesce(Subquery(qs.annotate(v=expression).values("v")[:1]), 0, output_field=champ)
+
+        montant_commande = agreger(commandes, Sum("montant_total"), models.BigIntegerField())
+        montant_paye = agreger(ventes, Sum("montant"), models.BigIntegerField())
+        derniere_commande = Subquery(commandes.annotate(v=Max("date_commande")).values("v")[:1])
+        dernier_encaissement = Subquery(ventes.annotate(v=Max("date_encaissement")).values("v")[:1])
+        return {
+            "nombre_commandes": agreger(commandes, Count("pk"), models.IntegerField()),
+            "montant_commande": montant_commande,
+            "montant_paye": montant_paye,
+            "reste_a_payer": montant_commande - montant_paye,
+            # GREATEST renvoie NULL dès qu'un argument l'est
+            "derniere_activite": Greatest(
+                Coalesce(derniere_commande, dernier_encaissement),
+                Coalesce(dernier_encaissement, derniere_commande),
+                output_field=models.DateField(),
+            ),
+        }
+
+    @classmethod
+    def recalculer(cls, entreprise_ids):
+        """
+        Recalcule les soldes des clients donnés en une requête UPDATE (après création
+        des lignes manquantes). Appelé dans la transaction de la modification : le
+        solde est validé ou annulé avec elle. Retourne le nombre de soldes mis à jour.
+        """
+        ids = {pk for pk in entreprise_ids if pk}
+        if not ids:
+            return 0
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(entreprise_id=pk) for pk in ids], ignore_conflicts=True)
+            return cls.objects.filter(entreprise_id__in=ids).update(
+                mis_a_jour=timezone.now(), **cls.valeurs_calculees()
+            )
@@ -0,0 +1,64 @@
+# vente/statistiques.py
+from django.db.models import Count, F, Sum
+
+from .models import STATUTS_EXCLUS_DU_TOTAL, LigneCommande
+
+
+def resume_commandes(commandes):
+    """
+    Résumé chiffré d'un queryset de Commande déjà filtré, calculé côté SQL :
+      - 1 requête GROUP BY (statut_vente, page) sur montant_total
+      - 1 requête GROUP BY service sur les lignes des commandes retenues
+        (commande_id IN (sous-requête) : ni JOIN ni distinct())
+
+    Retourne un dict :
+      total, nombre           -> commandes hors statuts exclus
+      par_statut              -> [{statut_vente, nombre, montant}] (tous statuts)
+      par_page                -> [{page_id, page__nom, nombre, montant}]
+      par_service             -> [{service_id, service__reference, quantite_totale, montant}]
+    """
+    commandes = commandes.order_by()
+
+    groupes = (
+        commandes
+        .values("statut_vente", "page_id", "page__nom")
+        .annotate(nombre=Count("pk"), montant=Sum("montant_total"))
+        .order_by()
+    )
+
+    par_statut = {}
+    par_page = {}
+    total = nombre = 0
+    for g in groupes:
+        montant = g["montant"] or 0
+        statut = par_statut.setdefault(
+            g["statut_vente"], {"statut_vente": g["statut_vente"], "nombre": 0, "montant": 0}
+        )
+        statut["nombre"] += g["nombre"]
+        statut["montant"] += montant
+
+        if g["statut_vente"] in STATUTS_EXCLUS_DU_TOTAL:
+            continue
+        total += montant
+        nombre += g["nombre"]
+        page = par_page.setdefault(
+            g["page_id"], {"page_id": g["page_id"], "page__nom": g["page__nom"], "nombre": 0, "montant": 0}
+        )
+        page["nombre"] += g["nombre"]
+        page["montant"] += montant
+
+    par_service = list(
+        LigneCommande.objects
+        .filter(commande__in=commandes.exclude(statut_vente__in=STATUTS_EXCLUS_DU_TOTAL).values("pk"))
+        .values("service_id", "service__reference")
+        .annotate(quantite_totale=Sum("quantite"), montant=Sum(F("tarif") * F("quantite")))
+        .order_by("-montant", "service__reference")
+    )
+
+    return {
+        "total": total,
+        "nombre": nombre,
+        "par_statut": sorted(par_statut.values(), key=lambda s: -s["montant"]),
+        "par_page": sorted(par_page.values(), key=lambda p: -p["montant"]),
+        "par_service": par_service,
+    }
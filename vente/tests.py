@@ -1,3 +1,347 @@
+from datetime import date
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.http import QueryDict
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from clients.models import Entreprise
+from common.models import Caisse, Pages
+from common.testing import BudgetRequetesMixin
+from encaissement.views import VenteFiltres
+from services.models import Service
+
+from .models import Commande, LigneCommande, LigneCommandeQuerySet, SoldeClient, Vente
+from .statistiques import resume_commandes
+from .views import CommandeFiltres, appliquer_lignes
+
+
+class SoldeClientTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        cls.caisse = Caisse.objects.create(nom="MVola", responsable="Caissier")
+        cls.service = Service.objects.create(nom="Sponsorisation", reference="SPO-01", tarif=10000)
+        cls.client_a = Entreprise.objects.create(raison_sociale="Client A")
+        cls.client_b = Entreprise.objects.create(raison_sociale="Client B")
+
+    def commander(self, client, quantite, jour):
+        commande = Commande.objects.create(client=client, page=self.page, date_commande=jour)
+        LigneCommande.objects.create(commande=commande, service=self.service, tarif=10000, quantite=quantite)
+        return commande
+
+    def solde(self, client):
+        return SoldeClient.objects.get(entreprise=client)
+
+    def test_commandes_lignes_et_encaissements(self):
+        premiere = self.commander(self.client_a, 2, date(2026, 1, 5))
+        self.commander(self.client_a, 1, date(2026, 2, 1))
+        solde = self.solde(self.client_a)
+        self.assertEqual((solde.nombre_commandes, solde.montant_commande, solde.montant_paye), (2, 30000, 0))
+        self.assertEqual(solde.reste_a_payer, 30000)
+
+        vente = Vente.objects.create(
+            commande=premiere, paiement=self.caisse, montant=20000, date_encaissement=date(2026, 3, 1)
+        )
+        solde = self.solde(self.client_a)
+        self.assertEqual((solde.montant_paye, solde.reste_a_payer), (20000, 10000))
+        self.assertEqual(solde.derniere_activite, date(2026, 3, 1))
+
+        vente.delete()
+        self.assertEqual(self.solde(self.client_a).montant_paye, 0)
+
+    def test_annulation_et_changement_de_client(self):
+        commande = self.commander(self.client_a, 3, date(2026, 1, 5))
+        commande.client = self.client_b
+        commande.save()
+        self.assertEqual(self.solde(self.client_a).montant_commande, 0)
+        self.assertEqual(self.solde(self.client_b).montant_commande, 30000)
+
+        commande.statut_vente = "Annulée"
+        commande.save(update_fields=["statut_vente"])
+        solde = self.solde(self.client_b)
+        self.assertEqual((solde.nombre_commandes, solde.montant_commande), (0, 0))
+        self.assertIsNone(solde.derniere_activite)
+
+    def test_commande_reconstruit_les_soldes(self):
+        self.commander(self.client_a, 2, date(2026, 1, 5))
+        SoldeClient.objects.filter(entreprise=self.client_a).update(montant_commande=1, reste_a_payer=1)
+
+        sortie = StringIO()
+        call_command("recalculer_soldes_clients", "--verifier", stdout=sortie)
+        self.assertIn("1 écart(s)", sortie.getvalue())
+        self.assertEqual(self.solde(self.client_a).montant_commande, 1)
+
+        call_command("recalculer_soldes_clients", stdout=StringIO())
+        solde = self.solde(self.client_a)
+        self.assertEqual((solde.montant_commande, solde.reste_a_payer), (20000, 20000))
+
+
+class AppliquerLignesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        cls.client_ = Entreprise.objects.create(raison_sociale="Client")
+        cls.services = [
+            Service.objects.create(nom=f"Service {n}", reference=f"SRV-{n}", tarif=1000) for n in range(5)
+        ]
+
+    def test_seules_les_differences_sont_ecrites(self):
+        s0, s1, s2, s3, s4 = self.services
+        commande = Commande.objects.create(client=self.client_, page=self.page)
+        inchangee, modifiee, par_service, supprimee = LigneCommande.objects.bulk_create([
+            LigneCommande(commande=commande, service=s0, tarif=1000, quantite=1),
+            LigneCommande(commande=commande, service=s1, tarif=1000, quantite=1),
+            LigneCommande(commande=commande, service=s2, tarif=1000, quantite=1),
+            LigneCommande(commande=commande, service=s3, tarif=1000, quantite=1),
+        ])
+        modifiee_avant = LigneCommande.objects.get(pk=modifiee.pk).updated_at
+        inchangee_avant = LigneCommande.objects.get(pk=inchangee.pk).updated_at
+
+        with CaptureQueriesContext(connection) as ctx:
+            resultat = appliquer_lignes(
+                commande,
+                [(s0, 1000, 1), (s1, 1000, 3), (s2, 2000, 1), (s4, 500, 2)],
+                [str(inchangee.pk), str(modifiee.pk), None, ""],
+                None,
+            )
+
+        self.assertEqual(resultat, {"crees": 1, "modifiees": 2, "supprimees": 1})
+        lignes = {l.service_id: l for l in commande.lignes_commandes.all()}
+        self.assertEqual(set(lignes), {s0.pk, s1.pk, s2.pk, s4.pk})
+        self.assertEqual(lignes[s0.pk].updated_at, inchangee_avant)
+        self.assertEqual((lignes[s1.pk].pk, lignes[s1.pk].quantite), (modifiee.pk, 3))
+        self.assertNotEqual(lignes[s1.pk].updated_at, modifiee_avant)
+        # Ligne sans id rapprochée par service : même ligne, tarif mis à jour
+        self.assertEqual((lignes[s2.pk].pk, lignes[s2.pk].tarif), (par_service.pk, 2000))
+        self.assertFalse(LigneCommande.objects.filter(pk=supprimee.pk).exists())
+
+        commande.refresh_from_db()
+        self.assertEqual(commande.montant_total, 1000 + 3000 + 2000 + 1000)
+        self.assertEqual(SoldeClient.objects.get(entreprise=self.client_).montant_commande, 7000)
+        recalculs = [q for q in ctx.captured_queries if q["sql"].startswith('UPDATE "vente_commande"')]
+        self.assertEqual(len(recalculs), 1)
+
+    def test_rien_a_ecrire(self):
+        commande = Commande.objects.create(client=self.client_, page=self.page)
+        ligne = LigneCommande.objects.create(commande=commande, service=self.services[0], tarif=1000, quantite=1)
+        with self.assertNumQueries(1):
+            resultat = appliquer_lignes(commande, [(self.services[0], 1000, 1)], [str(ligne.pk)], None)
+        self.assertEqual(resultat, {"crees": 0, "modifiees": 0, "supprimees": 0})
+
+
+class CreerCommandeServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        cls.client_ = Entreprise.objects.create(raison_sociale="Client")
+        cls.services = [
+            Service.objects.create(nom=f"Service {n}", reference=f"SRV-{n}", tarif=1000) for n in range(2)
+        ]
+        cls.utilisateur = get_user_model().objects.create_user("vendeur", password="x")
+
+    def setUp(self):
+        self.client.force_login(self.utilisateur)
+        self.url = reverse("creer_commande_service")
+
+    def poster(self, service, tarif, quantite):
+        return self.client.post(self.url, {
+            "client_id": self.client_.pk, "page": self.page.pk, "date_commande": "2026-03-02",
+            "service": service, "tarif": tarif, "quantite": quantite,
+        })
+
+    def test_creation(self):
+        s0, s1 = self.services
+        reponse = self.poster([s0.pk, s1.pk], [1000, 2500], [2, 1])
+        self.assertRedirects(reponse, reverse("accueil"), fetch_redirect_response=False)
+        commande = Commande.objects.get()
+        self.assertEqual(commande.montant_total, 4500)
+        # Lignes créées par bulk_create : created_by renseigné malgré l'absence de signal
+        self.assertEqual(
+            sorted(commande.lignes_commandes.values_list("service_id", "created_by__username")),
+            [(s0.pk, "vendeur"), (s1.pk, "vendeur")],
+        )
+
+    def test_lignes_invalides_aucune_commande(self):
+        s0 = self.services[0]
+        for service, tarif, quantite in (
+            ([s0.pk, 999999], [1000, 1000], [1, 1]),   # service inconnu
+            ([s0.pk, "abc"], [1000, 1000], [1, 1]),    # identifiant invalide
+            ([s0.pk], [1000], [-1]),                   # quantité négative
+            ([s0.pk, s0.pk], [1000], [1, 1]),          # listes incomplètes
+        ):
+            reponse = self.poster(service, tarif, quantite)
+            self.assertRedirects(reponse, self.url, fetch_redirect_response=False)
+        self.assertFalse(Commande.objects.exists())
+        self.assertFalse(LigneCommande.objects.exists())
+
+    def test_tout_ou_rien(self):
+        with mock.patch.object(LigneCommandeQuerySet, "bulk_create", side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.poster([self.services[0].pk], [1000], [1])
+        self.assertFalse(Commande.objects.exists())
+
+
+class MontantTotalEcrituresEnMasseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        cls.client_ = Entreprise.objects.create(raison_sociale="Client")
+        cls.service = Service.objects.create(nom="Sponsorisation", reference="SPO-01", tarif=1000)
+
+    def setUp(self):
+        self.commande = Commande.objects.create(client=self.client_, page=self.page)
+        self.autre = Commande.objects.create(client=self.client_, page=self.page)
+        self.lignes = LigneCommande.objects.bulk_create([
+            LigneCommande(commande=self.commande, service=self.service, tarif=1000, quantite=q) for q in (1, 2, 3)
+        ])
+
+    def montants(self):
+        return [c.montant_total for c in Commande.objects.filter(pk__in=[self.commande.pk, self.autre.pk]).order_by("pk")]
+
+    def test_bulk_create(self):
+        self.assertEqual(self.montants(), [6000, 0])
+
+    def test_bulk_update(self):
+        premiere, deuxieme, _ = self.lignes
+        premiere.tarif = 5000
+        deuxieme.commande = self.autre  # ligne déplacée : les deux commandes sont recalculées
+        LigneCommande.objects.bulk_update([premiere, deuxieme], ["tarif", "commande"])
+        self.assertEqual(self.montants(), [5000 + 3000, 2000])
+
+    def test_bulk_update_hors_montant_sans_recalcul(self):
+        with CaptureQueriesContext(connection) as ctx:
+            LigneCommande.objects.bulk_update(self.lignes, ["updated_at"])
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "vente_commande"' in q["sql"]
+                          or q["sql"].startswith('UPDATE "vente_commande"')])
+
+    def test_update(self):
+        LigneCommande.objects.filter(quantite__gte=2).update(quantite=10)
+        self.assertEqual(self.montants(), [1000 + 20000, 0])
+        LigneCommande.objects.filter(quantite=1).update(commande=self.autre)
+        self.assertEqual(self.montants(), [20000, 1000])
+
+    def test_delete(self):
+        LigneCommande.objects.filter(quantite__lte=2).delete()
+        self.assertEqual(self.montants(), [3000, 0])
+        self.commande.lignes_commandes.all().delete()
+        self.assertEqual(self.montants(), [0, 0])
+
+
+class ResumeCommandesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.page_a = Pages.objects.create(nom="Page A", contact="034", type="SERVICE")
+        cls.page_b = Pages.objects.create(nom="Page B", contact="033", type="SERVICE")
+        client = Entreprise.objects.create(raison_sociale="Client")
+        for page, statut, montant in (
+            (cls.page_a, "En attente", 1000),
+            (cls.page_a, "Payée", 4000),
+            (cls.page_b, "Payée", 2500),
+            (cls.page_b, "Annulée", 9000),
+        ):
+            Commande.objects.filter(
+                pk=Commande.objects.create(client=client, page=page, statut_vente=statut).pk
+            ).update(montant_total=montant)
+
+    def test_totaux_par_statut_et_par_page(self):
+        with self.assertNumQueries(2):
+            resume = resume_commandes(Commande.objects.all())
+        self.assertEqual((resume["total"], resume["nombre"]), (7500, 3))
+        # Les statuts exclus du total restent visibles dans par_statut
+        self.assertEqual(
+            [(s["statut_vente"], s["nombre"], s["montant"]) for s in resume["par_statut"]],
+            [("Annulée", 1, 9000), ("Payée", 2, 6500), ("En attente", 1, 1000)],
+        )
+        self.assertEqual(
+            [(p["page__nom"], p["nombre"], p["montant"]) for p in resume["par_page"]],
+            [("Page A", 2, 5000), ("Page B", 1, 2500)],
+        )
+
+    def test_queryset_filtre(self):
+        resume = resume_commandes(Commande.objects.filter(page=self.page_b))
+        self.assertEqual((resume["total"], resume["nombre"]), (2500, 1))
+        self.assertEqual([p["page__nom"] for p in resume["par_page"]], ["Page B"])
+
+    def test_totaux_par_service(self):
+        sponso = Service.objects.create(nom="Sponsorisation", reference="SPO-01", tarif=10000)
+        visuel = Service.objects.create(nom="Visuel", reference="VIS-01", tarif=5000)
+        commandes = {c.statut_vente: c for c in Commande.objects.filter(page=self.page_a)}
+        annulee = Commande.objects.get(statut_vente="Annulée")
+        LigneCommande.objects.bulk_create([
+            LigneCommande(commande=commandes["En attente"], service=sponso, tarif=10000, quantite=2),
+            LigneCommande(commande=commandes["Payée"], service=sponso, tarif=8000, quantite=1),
+            LigneCommande(commande=commandes["Payée"], service=visuel, tarif=5000, quantite=3),
+            # Commande annulée : hors du total, donc hors du détail par service
+            LigneCommande(commande=annulee, service=visuel, tarif=5000, quantite=10),
+        ])
+
+        with self.assertNumQueries(2):
+            resume = resume_commandes(Commande.objects.all())
+        self.assertEqual(
+            [(s["service__reference"], s["quantite_totale"], s["montant"]) for s in resume["par_service"]],
+            [("SPO-01", 3, 28000), ("VIS-01", 3, 15000)],
+        )
+        # Seule la commande payée de Page B (2500, sans lignes) manque au détail
+        self.assertEqual(sum(s["montant"] for s in resume["par_service"]), resume["total"] - 2500)
+
+        # Suit les filtres de la liste
+        resume = resume_commandes(Commande.objects.filter(statut_vente="Payée"))
+        self.assertEqual(
+            [(s["service__reference"], s["montant"]) for s in resume["par_service"]],
+            [("VIS-01", 15000), ("SPO-01", 8000)],
+        )
+
+
+class VenteListeBudgetTests(BudgetRequetesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.page = Pages.objects.create(nom="Page", contact="034", type="SERVICE")
+        cls.service = Service.objects.create(nom="Sponsorisation", reference="SPO-01", tarif=10000)
+        cls.utilisateur = get_user_model().objects.create_user("vendeur", password="x")
+
+    def commander(self, nombre):
+        for n in range(nombre):
+            commande = Commande.objects.create(
+                client=Entreprise.objects.create(raison_sociale=f"Client {n}"), page=self.page
+            )
+            LigneCommande.objects.bulk_create([
+                LigneCommande(commande=commande, service=self.service, tarif=10000, quantite=q) for q in (1, 2)
+            ])
+
+    def test_budget_independant_du_nombre_de_commandes(self):
+        self.client.force_login(self.utilisateur)
+        url = reverse("accueil")
+        for nombre in (2, 8):
+            self.commander(nombre)
+            for params in ({}, {"display": "cards"}, {"pagination": "curseur"}):
+                self.assertBudgetRequetes(url, 8, data=params)
+
+
+@skipUnless(connection.vendor == "sqlite", "plan de requête propre à SQLite")
+class IndexPeriodesTests(TestCase):
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as curseur:
+            curseur.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return " ".join(str(ligne[-1]) for ligne in curseur.fetchall())
+
+    def commandes(self, querystring):
+        return CommandeFiltres(QueryDict(querystring)).filtrer(Commande.objects.order_by("-date_commande", "-id"))
+
+    def test_statut_et_periode(self):
+        plan = self.plan(self.commandes("statut=Payée&periode=mois"))
+        self.assertIn("vente_commande_statut_date_idx", plan)
+
+    def test_client_et_bornes(self):
+        plan = self.plan(self.commandes("client_id=1&du=2026-01-01&au=2026-03-31"))
+        self.assertIn("vente_commande_client_date_idx", plan)
 
-# Create your tests here.
+    def test_caisse_et_periode(self):
+        ventes = VenteFiltres(QueryDict("paiement_id=1&periode=trimestre")).filtrer(Vente.objects.all())
+        self.assertIn("vente_vente_paiement_date_idx", self.plan(ventes))
@@ -1,14 +1,17 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import TemplateView, ListView
 from django.utils.timezone import now
-from django.core.serializers.json import DjangoJSONEncoder
-import json
 from django.views import View
 from django.core.paginator import Paginator
+from django.db import transaction
 from services.models import Service
 from datetime import date
 from .models import Commande, LigneCommande
+from .statistiques import resume_commandes
+from common.constants import ETAT_CHOIX
+from common.filtres import PERIODES, FiltreChoix, FiltreDate, FiltreEntier, FiltreExiste, FiltrePeriode, FiltresMixin, SpecFiltres
 from common.models import Pages
+from common.pagination import CursorPaginationMixin
 from clients.models import Entreprise
 from urllib.parse import urlencode
 from django.template.loader import render_to_string
@@ -19,113 +22,178 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 
 # Create your views here.
 
-class VenteView(LoginRequiredMixin, ListView):
+class CommandeFiltres(SpecFiltres):
+    date_commande = FiltreDate()
+    periode = FiltrePeriode("date_commande")
+    du = FiltreDate("date_commande", lookup="gte")
+    au = FiltreDate("date_commande", lookup="lte")
+    service_id = FiltreExiste(LigneCommande, "commande", "service_id")
+    client_id = FiltreEntier()
+    statut = FiltreChoix("statut_vente", choix=ETAT_CHOIX)
+    page_id = FiltreEntier()
+
+
+class VenteView(LoginRequiredMixin, FiltresMixin, CursorPaginationMixin, ListView):
     template_name= "vente/vente.html"
     context_object_name = "commandes"
     paginate_by = 10
+    cursor_ordering = ("-date_commande", "-id")
+    filtres_class = CommandeFiltres
 
     # ✅ AJOUTER CETTE MÉTHODE DANS LA CLASSE
     def _display_mode(self):
         mode = (self.request.GET.get("display") or "auto").strip().lower()
         return mode if mode in ("auto", "table", "cards") else "auto"
 
+    def get_base_queryset(self):
+        """Commandes filtrées (sans jointures d'affichage) : partagé par la liste et le résumé."""
+        # Service : EXISTS sur les lignes plutôt que JOIN + distinct() (voir common.filtres)
+        return self.get_filtres().filtrer(Commande.objects.all())
+
     def get_queryset(self):
-        qs = (Commande.objects
-            .select_related("client", "page")
+        return (self.get_base_queryset()
+            .select_related("client", "page", "vente")
             .prefetch_related("lignes_commandes__service")
-            .order_by("-date_commande"))
-
-        # ---- Lire & nettoyer les filtres ----
-        filtre_date_commande = (self.request.GET.get("date_commande") or "").strip()
-        filtre_service_id_raw = (self.request.GET.get("service_id") or "").strip()
-        filtre_client_id_raw = (self.request.GET.get("client_id") or "").strip()
-        filtre_statut = (self.request.GET.get("statut") or "").strip()
-        page_id = (self.request.GET.get("page_id") or "").strip()
-
-        def parse_int(s):
-            try:
-                return int(s)
-            except (TypeError, ValueError):
-                return None
-
-        filtre_service_id = parse_int(filtre_service_id_raw)
-        filtre_client_id = parse_int(filtre_client_id_raw)
-
-        # ---- Appliquer les filtres ----
-        if filtre_statut:
-            qs = qs.filter(statut_vente=filtre_statut)
-        if page_id:
-            qs = qs.filter(page_id=page_id)
-        if filtre_date_commande:
-            qs = qs.filter(date_commande=filtre_date_commande)
-        if filtre_client_id:
-            qs = qs.filter(client_id=filtre_client_id)
-        if filtre_service_id:
-            qs = qs.filter(lignes_commandes__service_id=filtre_service_id).distinct()
-
-        return qs
+            .order_by("-date_commande", "-id"))
+
+    def get_extra_querystring(self):
+        # conserver le mode dans la pagination
+        return self.get_filtres().querystring(display=self._display_mode())
 
     def get_context_data(self, **kwargs):
-        from urllib.parse import urlencode  # si pas déjà importé en haut
         context = super().get_context_data(**kwargs)
+        filtres = self.get_filtres()
 
-        commandes_valides = self.get_queryset().exclude(statut_vente__in=["Annulée", "Supprimée"])
-        total_montant = sum(c.montant_commande for c in commandes_valides)
-
-        filtre_date_commande = (self.request.GET.get("date_commande") or "").strip()
-        filtre_service_id_raw = (self.request.GET.get("service_id") or "").strip()
-        filtre_client_id_raw = (self.request.GET.get("client_id") or "").strip()
-        filtre_statut = (self.request.GET.get("statut") or "").strip()
-        page_id = (self.request.GET.get("page_id") or "").strip()
-
-        # ✅ utiliser la méthode nouvellement ajoutée
-        display_mode = self._display_mode()
-
-        extra_querystring = urlencode({
-            "date_commande": filtre_date_commande,
-            "service_id": filtre_service_id_raw,
-            "client_id": filtre_client_id_raw,
-            "statut": filtre_statut,
-            "page_id": page_id,
-            "display": display_mode,   # conserver le mode dans la pagination
-        })
+        resume = resume_commandes(self.get_base_queryset())
 
         context.update({
-            "filtre_date_commande": filtre_date_commande,
-            "filtre_service_id": filtre_service_id_raw,
-            "filtre_client_id": filtre_client_id_raw,
-            "filtre_statut": filtre_statut,
-            "filtre_page": page_id,
+            "filtre_date_commande": filtres.donnees["date_commande"],
+            "periodes": PERIODES,
+            "filtre_service_id": filtres.donnees["service_id"],
+            "filtre_client_id": filtres.donnees["client_id"],
+            "filtre_statut": filtres.donnees["statut"],
+            "filtre_page": filtres.donnees["page_id"],
 
             "pages": Pages.actifs.filter(type="SERVICE"),
-            "services": Service.objects.all(),
-            "clients": Entreprise.objects.all().order_by("raison_sociale"),
+            # Libellés des filtres actifs ; les options sont chargées à la demande (typeahead)
+            "filtre_service": Service.objects.filter(pk=filtres["service_id"]).first() if filtres["service_id"] else None,
+            "filtre_client": Entreprise.objects.filter(pk=filtres["client_id"]).first() if filtres["client_id"] else None,
 
-            "total_montant": total_montant,
-            "extra_querystring": extra_querystring,
-            "display_mode": display_mode,  # 👈 utilisé par le template
+            "total_montant": resume["total"],
+            "resume": resume,
+            "display_mode": self._display_mode(),  # 👈 utilisé par le template
         })
         return context
 
 
+def lire_lignes_post(post):
+    """
+    Lit les lignes soumises (listes parallèles service / tarif / quantite) et résout
+    tous les services en une seule requête IN.
+    Retourne [(service, tarif, quantite), ...] ; lève ValueError avec un message lisible.
+    """
+    service_ids = post.getlist("service")
+    tarifs = post.getlist("tarif")
+    quantites = post.getlist("quantite")
+
+    if not (len(service_ids) == len(tarifs) == len(quantites)):
+        raise ValueError("Lignes de commande incomplètes.")
+
+    lignes = []
+    for service_id, tarif, quantite in zip(service_ids, tarifs, quantites):
+        try:
+            service_id, tarif, quantite = int(service_id), int(tarif), int(quantite)
+        except (TypeError, ValueError):
+            raise ValueError("Service, tarif ou quantité invalide.")
+        if tarif < 0 or quantite < 0:
+            raise ValueError("Le tarif et la quantité doivent être positifs.")
+        lignes.append((service_id, tarif, quantite))
+
+    services = Service.objects.in_bulk({service_id for service_id, _, _ in lignes})
+    manquants = {service_id for service_id, _, _ in lignes} - services.keys()
+    if manquants:
+        raise ValueError(f"Service introuvable : {', '.join(map(str, sorted(manquants)))}.")
+
+    return [(services[service_id], tarif, quantite) for service_id, tarif, quantite in lignes]
+
+
+def appliquer_lignes(commande, lignes, ligne_ids, user):
+    """
+    Applique les lignes soumises à une commande existante en ne touchant que ce qui change :
+      - ligne_id connu et valeurs identiques -> rien
+      - ligne_id connu et valeurs modifiées  -> bulk_update
+      - sans ligne_id (ou id inconnu)        -> réutilise une ligne existante du même service, sinon bulk_create
+      - lignes existantes non reprises       -> un seul DELETE
+    Les écritures ne recalculent rien ; le montant_total (et le solde client) est
+    recalculé une seule fois à la fin. À appeler dans une transaction.
+    """
+    existantes = {ligne.pk: ligne for ligne in commande.lignes_commandes.all()}
+    libres = dict(existantes)
+
+    def parse_id(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    # 1) Lignes identifiées par leur id
+    restantes = []
+    associees = []
+    for ligne_id, valeurs in zip(ligne_ids, lignes):
+        ligne = libres.pop(parse_id(ligne_id), None)
+        if ligne is None:
+            restantes.append(valeurs)
+        else:
+            associees.append((ligne, valeurs))
+
+    # 2) Lignes sans id : rapprochement par service avec les lignes encore libres
+    a_creer = []
+    for service, tarif, quantite in restantes:
+        ligne = next((l for l in libres.values() if l.service_id == service.pk), None)
+        if ligne is None:
+            a_creer.append(LigneCommande(
+                commande=commande, service=service, tarif=tarif, quantite=quantite, created_by=user,
+            ))
+        else:
+            del libres[ligne.pk]
+            associees.append((ligne, (service, tarif, quantite)))
+
+    a_modifier = []
+    maintenant = now()
+    for ligne, (service, tarif, quantite) in associees:
+        if (ligne.service_id, ligne.tarif, ligne.quantite) == (service.pk, tarif, quantite):
+            continue
+        ligne.service = service
+        ligne.tarif = tarif
+        ligne.quantite = quantite
+        # bulk_update ne passe ni par le signal d'audit ni par auto_now
+        ligne.updated_by = user
+        ligne.updated_at = maintenant
+        a_modifier.append(ligne)
+
+    lignes_qs = LigneCommande.objects.sans_recalcul()
+    if libres:
+        lignes_qs.filter(pk__in=libres.keys()).delete()
+    if a_modifier:
+        lignes_qs.bulk_update(a_modifier, ["service", "tarif", "quantite", "updated_by", "updated_at"])
+    if a_creer:
+        lignes_qs.bulk_create(a_creer)
+    if libres or a_modifier or a_creer:
+        Commande.recalculer_montants([commande.pk])
+
+    return {"crees": len(a_creer), "modifiees": len(a_modifier), "supprimees": len(libres)}
+
+
 class CreerCommandeServiceView(LoginRequiredMixin, View):
     template_name = "vente/includes/commande.html"
 
     def get(self, request, *args, **kwargs):
         pages = Pages.actifs.filter(type="SERVICE")
-        services = Service.objects.all()  # ⚠️ utilise .objects si tu n’as pas de manager actifs
-
-        services_json = json.dumps(
-            list(services.values("id", "nom", "reference", "tarif")),
-            cls=DjangoJSONEncoder
-        )
 
+        # Clients et services sont chargés à la demande (entreprise_typeahead / service_typeahead)
         context = {
             "pages": pages,
-            "services": services,
-            "clients": Entreprise.objects.all().order_by("raison_sociale"),
             "date_du_jour": now().date(),
-            "services_json": services_json,
         }
         return render(request, self.template_name, context)
 
@@ -136,29 +204,35 @@ class CreerCommandeServiceView(LoginRequiredMixin, View):
         page_id = request.POST.get("page")
         page = get_object_or_404(Pages, id=page_id)
 
-        commande = Commande.objects.create(
-            client=client,
-            page=page,
-            remarque=request.POST.get("remarque"),
-            date_commande=request.POST.get("date_commande") or now(),
-        )
-
-        service_ids = request.POST.getlist("service")
-        tarifs = request.POST.getlist("tarif")
-        quantites = request.POST.getlist("quantite")
-
-        for i in range(len(service_ids)):
-            service = get_object_or_404(Service, pk=service_ids[i])
-            tarif = int(tarifs[i])
-            quantite = int(quantites[i])
-            LigneCommande.objects.create(
-                commande=commande,
-                service=service,
-                tarif=tarif,
-                quantite=quantite,
+        try:
+            lignes = lire_lignes_post(request.POST)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect("creer_commande_service")
+
+        user = request.user
+        with transaction.atomic():
+            commande = Commande.objects.create(
+                client=client,
+                page=page,
+                remarque=request.POST.get("remarque"),
+                date_commande=request.POST.get("date_commande") or now(),
+                created_by=user,
             )
-
-        return render(request, "vente/vente.html", {"commandes": Commande.objects.all()})
+            # bulk_create ne déclenche pas le signal d'audit : created_by renseigné ici
+            LigneCommande.objects.bulk_create([
+                LigneCommande(
+                    commande=commande,
+                    service=service,
+                    tarif=tarif,
+                    quantite=quantite,
+                    created_by=user,
+                )
+                for service, tarif, quantite in lignes
+            ])
+
+        messages.success(request, f"Commande {commande.numero_proforma} enregistrée.")
+        return redirect("accueil")
 
 class DetailCommandeServiceView(LoginRequiredMixin, View):
     template_name = "vente/detail_commande_service.html"
@@ -211,13 +285,11 @@ class ModifierCommandeServiceView(LoginRequiredMixin, View):
             return redirect("detail_commande_service", commande_id=commande.id)
 
         pages = Pages.actifs.filter(type="SERVICE")
-        services = Service.objects.all()
-        lignes = commande.lignes_commandes.all()
+        lignes = commande.lignes_commandes.select_related("service")
 
         return render(request, self.template_name, {
             "commande": commande,
             "pages": pages,
-            "services": services,
             "lignes": lignes,
         })
 
@@ -228,29 +300,30 @@ class ModifierCommandeServiceView(LoginRequiredMixin, View):
             messages.warning(request, "Modification interdite pour cette commande.")
             return redirect("detail_commande_service", commande_id=commande.id)
 
-        commande.page = get_object_or_404(Pages, id=request.POST.get("page"))
-        commande.remarque = request.POST.get("remarque")
-        commande.date_commande = request.POST.get("date_commande") or now()
-        commande.save()
-
-        # Supprimer les anciennes lignes
-        LigneCommande.objects.filter(commande=commande).delete()
-
-        # Recréer les lignes
-        service_ids = request.POST.getlist("service")
-        tarifs = request.POST.getlist("tarif")
-        quantites = request.POST.getlist("quantite")
-
-        for i in range(len(service_ids)):
-            service = get_object_or_404(Service, pk=service_ids[i])
-            tarif = int(tarifs[i])
-            quantite = int(quantites[i])
-            LigneCommande.objects.create(
-                commande=commande,
-                service=service,
-                tarif=tarif,
-                quantite=quantite
-            )
+        page = get_object_or_404(Pages, id=request.POST.get("page"))
+
+        try:
+            lignes = lire_lignes_post(request.POST)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect("modifier_commande_service", commande_id=commande.id)
+
+        ligne_ids = request.POST.getlist("ligne_id")
+        if len(ligne_ids) != len(lignes):
+            ligne_ids = [None] * len(lignes)
+
+        with transaction.atomic():
+            commande = Commande.objects.select_for_update().get(pk=commande.pk)
+            # Encaissée (ou supprimée) depuis la première lecture : plus rien à modifier
+            if commande.actions_desactivees():
+                messages.warning(request, "Modification interdite pour cette commande.")
+                return redirect("detail_commande_service", commande_id=commande.id)
+            commande.page = page
+            commande.remarque = request.POST.get("remarque")
+            commande.date_commande = request.POST.get("date_commande") or now()
+            commande.save()
+
+            appliquer_lignes(commande, lignes, ligne_ids, request.user)
 
         return redirect("accueil")
     
@@ -55,10 +55,20 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "common.middleware.ProfilageMiddleware",  # Server-Timing si PROFILAGE_ACTIF, X-Profile (staff)
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "common.middleware.DetecteurNPlus1Middleware",  # inactif sauf DETECTEUR_N_PLUS_1
 ]
 
+# Détection des requêtes SQL répétées par requête HTTP (développement)
+DETECTEUR_N_PLUS_1 = False
+DETECTEUR_N_PLUS_1_SEUIL = 5   # nombre d'exécutions d'une même forme de requête
+
+# Profilage par requête (en-tête Server-Timing, ligne de log JSON)
+PROFILAGE_ACTIF = False
+PROFILAGE_LOG = False
+
 ROOT_URLCONF = "zara_service.urls"
 
 TEMPLATES = [
@@ -135,6 +145,19 @@ STATICFILES_DIRS = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Cache disque des PDF de factures (voir facturation/pdf_cache.py)
+FACTURES_PDF_CACHE_DIR = MEDIA_ROOT / "factures_cache"
+FACTURES_PDF_CACHE_MAX_OCTETS = 200 * 1024 * 1024   # au-delà : suppression des plus anciens
+FACTURES_PDF_CACHE_MAX_AGE = 30 * 24 * 3600         # secondes
+
+# Exports groupés de factures (hors MEDIA_ROOT : servis uniquement par la vue)
+FACTURES_EXPORT_DIR = BASE_DIR / "exports" / "factures"
+FACTURES_EXPORTS_SIMULTANES = 1   # exports en arrière-plan à la fois (au-delà : 429)
+FACTURES_EXPORT_PROCESSUS = 4     # processus de rendu par export (plafonné au nombre de CPU)
+
+# Autocomplétion clients / services (voir common/typeahead.py) : durée de cache des réponses
+TYPEAHEAD_CACHE_SECONDES = 30
+
 # -------------------------
 # Divers
 # -------------------------